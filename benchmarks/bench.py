@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the hot paths of vfd.
+
+Each benchmark is timed for a range of sizes and the results are saved as JSON, so they can be compared across
+commits::
+
+    $ python benchmarks/bench.py                       # Save the results in benchmarks/results/<commit>.json
+    $ python benchmarks/bench.py --quick -k json       # Smaller sizes, only the benchmarks matching "json"
+    $ python benchmarks/bench.py --compare benchmarks/results/<other commit>.json
+
+The largest sizes (up to 10^7 points or a 4000x4000 colorplot) take several minutes and some GB of memory.
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import math
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from vfd import vfd, builder  # noqa: E402
+
+# Sizes used by the benchmarks. The quick ones are those up to the given limit.
+point_sizes = [10, 10 ** 3, 10 ** 5, 10 ** 6, 10 ** 7]
+series_counts = [1, 10, 100, 1000]
+matrix_sizes = [10, 100, 1000, 4000]
+
+_quick_limits = {"points": 10 ** 5, "series": 100, "matrix": 100}
+
+# Points in each series in the benchmarks with many series
+_points_per_series = 1000
+
+_benchmarks = []
+
+
+def benchmark(kind, sizes, max_size=None):
+    """
+    Register a benchmark.
+
+    The decorated function takes a size and returns a function to time, so the preparation is not timed.
+
+    Args:
+        kind (str): The kind of sizes ("points", "series" or "matrix"), used to limit them in quick runs.
+        sizes (list of int): Sizes to run the benchmark with.
+        max_size (int): If given, larger sizes are skipped (e.g., because the run would be too long).
+
+    """
+
+    def decorator(f):
+        _benchmarks.append((f.__name__, kind, [s for s in sizes if max_size is None or s <= max_size], f))
+        return f
+
+    return decorator
+
+
+def _series(points, count=1):
+    """Get a plot description with some series of some points"""
+    x = [i * 0.001 for i in range(points)]
+    return {"type": "plot", "xlabel": "x", "ylabel": "y",
+            "series": [{"x": x, "y": [math.sin(v + j) for v in x], "label": "Series %d" % j} for j in range(count)]}
+
+
+def _colorplot(size):
+    """Get a colorplot description with a square matrix"""
+    return {"type": "colorplot", "x": list(range(size)), "y": list(range(size)),
+            "z": [[math.sin(i * 0.01) * math.cos(j * 0.01) for j in range(size)] for i in range(size)]}
+
+
+@benchmark("points", point_sizes)
+def builder_plot(size):
+    description = _series(size)
+    x, y = description["series"][0]["x"], description["series"][0]["y"]
+
+    def run():
+        b = builder.Builder(to_matplotlib=False)
+        b.plot(x, y)
+        b.get_data()
+
+    return run
+
+
+@benchmark("points", point_sizes)
+def ensure_normal_type(size):
+    import numpy as np
+    x = np.linspace(0, 1, size)
+    y = np.sin(x)
+    y[::97] = np.nan
+    return lambda: builder._ensure_normal_type(x, y)
+
+
+@benchmark("points", point_sizes)
+def python_to_json_compact_arrays(size):
+    description = _series(size)
+    return lambda: vfd.python_to_json(description)
+
+
+@benchmark("points", point_sizes)
+def python_to_json_compact(size):
+    description = _series(size)
+    return lambda: vfd.python_to_json(description, compact=True)
+
+
+@benchmark("series", series_counts)
+def python_to_json_series(size):
+    description = _series(_points_per_series, size)
+    return lambda: vfd.python_to_json(description)
+
+
+@benchmark("points", point_sizes, max_size=10 ** 6)
+def validate_full(size):
+    description = _series(size)
+    return lambda: vfd.validate_vfd(description, mode="full")
+
+
+@benchmark("points", point_sizes)
+def validate_fast(size):
+    description = _series(size)
+    return lambda: vfd.validate_vfd(description, mode="fast")
+
+
+@benchmark("series", series_counts)
+def validate_series(size):
+    description = _series(_points_per_series, size)
+    return lambda: vfd.validate_vfd(description, mode="fast")
+
+
+@benchmark("matrix", matrix_sizes)
+def validate_colorplot(size):
+    description = _colorplot(size)
+    return lambda: vfd.validate_vfd(description, mode="fast")
+
+
+@benchmark("points", point_sizes)
+def create_matplotlib_script(size):
+    description = _series(size)
+    return lambda: vfd.create_matplotlib_script(description, export_format="png")
+
+
+@benchmark("series", series_counts)
+def create_matplotlib_script_series(size):
+    description = _series(_points_per_series, size)
+    return lambda: vfd.create_matplotlib_script(description, export_format="png")
+
+
+@benchmark("matrix", matrix_sizes)
+def create_matplotlib_script_colorplot(size):
+    description = _colorplot(size)
+    return lambda: vfd.create_matplotlib_script(description, export_format="png")
+
+
+@benchmark("points", point_sizes, max_size=10 ** 6)
+def export_xlsx(size):
+    description = _series(size)
+    file = os.path.join(_temp_dir, "export.xlsx")
+    return lambda: vfd.export_xlsx(description, file)
+
+
+@benchmark("matrix", matrix_sizes, max_size=1000)
+def export_xlsx_colorplot(size):
+    description = _colorplot(size)
+    file = os.path.join(_temp_dir, "export.xlsx")
+    return lambda: vfd.export_xlsx(description, file)
+
+
+def _create_scripts(description):
+    """Get a function exporting a VFD through create_scripts"""
+    file = os.path.join(_temp_dir, "e2e.vfd")
+    with open(file, "w") as f:
+        vfd.dump_json(description, f)
+    return lambda: vfd.create_scripts(file, run=True, export_format="png")
+
+
+@benchmark("points", point_sizes, max_size=10 ** 6)
+def create_scripts_run(size):
+    return _create_scripts(_series(size))
+
+
+@benchmark("series", series_counts)
+def create_scripts_run_series(size):
+    return _create_scripts(_series(_points_per_series, size))
+
+
+@benchmark("matrix", matrix_sizes)
+def create_scripts_run_colorplot(size):
+    return _create_scripts(_colorplot(size))
+
+
+# Directory for the files written by the benchmarks
+_temp_dir = None
+
+
+def _time(function, min_time=1.0, max_repeat=10):
+    """Time a function, repeating it until it has run for some time. Returns the list of times."""
+
+    def timed():
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+    # The first run includes imports and caches filled on first use. It is discarded if there is time to repeat.
+    first = timed()
+    if first >= min_time:
+        return [first]
+    times = []
+    while len(times) < max_repeat and (not times or sum(times) < min_time):
+        times.append(timed())
+    return times
+
+
+def _commit():
+    """Get the current commit of the repository, or None if not available"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(keyword=None, quick=False, min_time=1.0):
+    """
+    Run the benchmarks.
+
+    Args:
+        keyword (str): If given, only the benchmarks whose name contain it are run.
+        quick (bool): Whether to skip the largest sizes.
+        min_time (float): Minimum time in seconds spent repeating each benchmark.
+
+    Returns:
+        dict: The results, mapping "name[size]" to the statistics of the times in seconds.
+
+    """
+    global _temp_dir
+    _temp_dir = tempfile.mkdtemp(prefix="vfd-bench-")
+    results = {}
+    try:
+        for name, kind, sizes, factory in _benchmarks:
+            if keyword and keyword not in name:
+                continue
+            for size in sizes:
+                if quick and size > _quick_limits[kind]:
+                    continue
+                function = factory(size)
+                times = _time(function, min_time=min_time)
+                key = "%s[%d]" % (name, size)
+                results[key] = {"min": min(times), "mean": sum(times) / len(times), "repeat": len(times)}
+                print("%-45s %10.4f s (%d runs)" % (key, results[key]["min"], len(times)))
+                sys.stdout.flush()
+    finally:
+        shutil.rmtree(_temp_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, reference, threshold=1.2):
+    """
+    Print the ratio of the times of two runs.
+
+    Args:
+        results (dict): The results of the current run.
+        reference (dict): The results of the run to compare with.
+        threshold (float): Ratio of times above which a benchmark is reported as a regression.
+
+    Returns:
+        list of str: The benchmarks which are slower than the threshold.
+
+    """
+    regressions = []
+    for key in sorted(set(results) & set(reference)):
+        ratio = results[key]["min"] / reference[key]["min"]
+        mark = ""
+        if ratio > threshold:
+            mark = "  SLOWER"
+            regressions.append(key)
+        elif ratio < 1 / threshold:
+            mark = "  faster"
+        print("%-45s %10.4f s %10.4f s %7.2fx%s" % (key, reference[key]["min"], results[key]["min"], ratio, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of vfd")
+    parser.add_argument("-k", dest="keyword", default=None, help="Only run the benchmarks whose name contain this")
+    parser.add_argument("--quick", action="store_true", help="Skip the largest sizes")
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="Minimum time in seconds spent repeating each benchmark")
+    parser.add_argument("--output", default=None,
+                        help="JSON file where the results are saved. Defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", default=None, help="JSON file with previous results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Ratio of times above which a benchmark is reported as a regression")
+    args = parser.parse_args()
+
+    commit = _commit()
+    results = run(keyword=args.keyword, quick=args.quick, min_time=args.min_time)
+    output = args.output
+    if output is None:
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "%s.json" % (commit or "unknown"))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with io.open(output, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"commit": commit, "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                            "python": platform.python_version(), "machine": platform.platform(),
+                            "quick": args.quick, "results": results}, indent=4, sort_keys=True))
+    print("Results saved in %s" % output)
+
+    if args.compare:
+        with io.open(args.compare, encoding="utf-8") as f:
+            reference = json.load(f)
+        print("\n%-45s %12s %12s %8s" % ("Benchmark", reference.get("commit") or "reference", commit or "current",
+                                          "ratio"))
+        if compare(results, reference["results"], threshold=args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ import shutil
 import filecmp
 
 import numpy as np
+import pytest
 
 from vfd import builder, vfd
 
@@ -29,6 +30,12 @@ def test_ensure_normal_type():
     assert ([1, 2], [3, 4]) == builder._ensure_normal_type([1, 2], [3, 4])
     assert ([1, 2], [10, 20]) == builder._ensure_normal_type([1, np.nan, 2], [10, 13, 20])
 
+    # Lists of different length are cut as zip would do
+    assert ([1, 2], [10, 20]) == builder._ensure_normal_type([1, 2, 3], np.array([10, 20]))
+
+    # Nested data is filtered by its first dimension
+    assert ([[1, 2]],) == builder._ensure_normal_type(np.array([[1, 2], [3, np.nan]]))
+
 
 def test_builder_runs(tmpdir):
     """Test the Builder class is working"""
@@ -52,6 +59,13 @@ def test_builder_runs(tmpdir):
     # Compare the files
     assert filecmp.cmp(temp_plt, temp_plt + ".orig")
 
+    # Compressed VFD
+    with builder.Builder(to_matplotlib=False) as p:
+        p.plot([1, 2, 3], label="Data")
+        p.savevfd(os.path.join(temp_path, "compressed.vfd.gz"))
+    with vfd.open_vfd(os.path.join(temp_path, "compressed.vfd.gz")) as f:
+        assert vfd.str_to_python(f.read()) == p.get_data()
+
 
 def test_errobar():
     p = builder.Builder()
@@ -63,6 +77,14 @@ def test_errobar():
     assert p.data["series"][-1]["ymax"] == [1.1, 4.2, 9.3]
     assert p.data["series"][-1]["ymin"] == [0.8, 3.7, 8.6]
 
+    # Points which are not finite are removed from the errors too
+    p.errorbar(np.array([1, 2, 3]), np.array([1, np.nan, 9]), yerr=[1, 2, 3], xerr=[[0.1, 0.2, 0.3], [0.1, 0.2, 0.3]])
+    series = p.get_data()["series"][-1]
+    assert series["x"] == [1, 3]
+    assert series["yerr"] == [1, 3]
+    assert series["xmin"] == [0.9, 2.7]
+    assert len(series["xmax"]) == 2
+
 
 def test_colorplot():
     """Test colorplot are generated"""
@@ -180,3 +202,213 @@ def test_twiny():
     assert data["xlabel"] == "Romulus"
     assert data["xadded"][0]["label"] == "Remus"
     assert data["xadded"][0]["range"] == (0.1, 2.1)
+
+
+def test_stored_data():
+    """Test plotted data is kept until serialization"""
+    x = np.arange(1, 4, dtype=float)
+    y = np.array([1.0, np.nan, 9.0])
+    p = builder.Builder(to_matplotlib=False)
+    p.plot(x, y)
+    # Later changes in the arrays must not be seen
+    x[0] = 10
+    assert p.data["series"][0]["x"][0] == 1
+    # Conversion and non finite filtering happen when data is requested
+    data = p.get_data()
+    assert data["series"][0]["x"] == [1.0, 3.0]
+    assert data["series"][0]["y"] == [1.0, 9.0]
+    assert type(data["series"][0]["x"]) == list
+    assert vfd.str_to_python(p.to_json()) == data
+
+    # Also in the rows of nested lists
+    z = [[1.0, 2.0], [3.0, 4.0]]
+    p = builder.Builder(to_matplotlib=False)
+    p.pcolormesh([0, 1], [0, 1], z)
+    z[0][0] = 10
+    assert p.get_data()["z"] == [[1.0, 2.0], [3.0, 4.0]]
+
+
+def test_external_colorplot(tmpdir):
+    """Test the z values of colorplots can be saved in external files"""
+    temp_path = str(tmpdir)
+    z = np.arange(20, dtype=float).reshape(4, 5)
+    with builder.Builder(to_matplotlib=False, external_z=True) as p:
+        p.pcolormesh(np.arange(5), np.arange(4), z)
+        p.savevfd(os.path.join(temp_path, "map.vfd"))
+    with open(os.path.join(temp_path, "map.vfd")) as f:
+        description = vfd.str_to_python(f.read())
+    assert description["z"] == {"file": "map.z0.npy"}
+    assert (np.load(os.path.join(temp_path, "map.z0.npy")) == z).all()
+    vfd.create_scripts(os.path.join(temp_path, "map.vfd"), run=True, export_format="png")
+    assert os.path.isfile(os.path.join(temp_path, "map.png"))
+
+
+def test_stream(tmpdir):
+    """Test VFD streams only append the new series"""
+    temp_path = str(tmpdir)
+    temp_stream = os.path.join(temp_path, "stream.vfds")
+    p = builder.Builder(to_matplotlib=False, stream=True)
+    fig, axes = p.subplots(1, 2)
+    twinx = axes[0].twinx()
+    axes[0].plot([1, 2, 3], [4, 5, 6], label="First")
+    twinx.plot([1, 2, 3], [1, 1, 1])
+    p.savefig(os.path.join(temp_path, "stream.png"))
+    with open(temp_stream, "rb") as f:
+        first = f.read()
+
+    axes[0].set_xlabel("Time")
+    axes[1].plot(np.arange(100.0), np.sin(np.arange(100.0)))
+    twinx.plot([4, 5], [2, 2])
+    p.savefig(os.path.join(temp_path, "stream.png"))
+    with open(temp_stream, "rb") as f:
+        second = f.read()
+    assert second.startswith(first)
+    # A header with the new label and the two new series
+    assert len(second[len(first):].splitlines()) == 3
+    assert vfd.load_vfd(temp_stream) == vfd.str_to_python(vfd.python_to_json(p.get_data()))
+
+    # Series inserted before the written ones force a rewrite
+    axes[0].plot([1, 2], [3, 4])
+    p.savevfd(temp_stream)
+    with open(temp_stream, "rb") as f:
+        assert not f.read().startswith(first)
+    assert vfd.load_vfd(temp_stream) == vfd.str_to_python(vfd.python_to_json(p.get_data()))
+
+    # So do changes inside the written series
+    twinx.data["series"][0]["y"][0] = 10
+    p.savevfd(temp_stream)
+    assert vfd.load_vfd(temp_stream)["plots"][0][0]["series"][2]["y"][0] == 10
+
+    vfd.create_scripts(temp_stream, run=True, export_format="png")
+    assert os.path.isfile(os.path.join(temp_path, "stream.png"))
+
+
+def test_save_unchanged(tmpdir, monkeypatch):
+    """Test unmodified data is not serialized again and saves replace the files atomically"""
+    temp_path = str(tmpdir)
+    temp_vfd = os.path.join(temp_path, "saved.vfd")
+    p = builder.Builder(to_matplotlib=False)
+    fig, ax = p.subplots()
+    ax.plot([1, 2, 3], [4, 5, 6])
+    p.savefig(os.path.join(temp_path, "saved.png"))
+    with open(temp_vfd) as f:
+        content = f.read()
+
+    def no_serialization(*args, **kwargs):
+        raise AssertionError("Unmodified data was serialized")
+
+    monkeypatch.setattr(p, "get_data", no_serialization)
+    fig.savefig(os.path.join(temp_path, "saved.pdf"))
+    p.savefig(os.path.join(temp_path, "copy.svg"))
+    with open(os.path.join(temp_path, "copy.vfd")) as f:
+        assert f.read() == content
+    # Files changed by others are written again
+    with open(os.path.join(temp_path, "copy.vfd"), "w") as f:
+        f.write("{}")
+    with pytest.raises(AssertionError):
+        p.savevfd(temp_vfd)
+    monkeypatch.undo()
+    p.savevfd(os.path.join(temp_path, "copy.vfd"))
+    with open(os.path.join(temp_path, "copy.vfd")) as f:
+        assert f.read() == content
+
+    # Any change in the data, even through the axes or the data attribute, is saved
+    ax.set_xlabel("x")
+    p.savevfd(temp_vfd)
+    assert vfd.load_vfd(temp_vfd)["plots"][0][0]["xlabel"] == "x"
+    p.data["title"] = "Title"
+    p.savevfd(temp_vfd)
+    assert vfd.load_vfd(temp_vfd)["title"] == "Title"
+
+    # A failed save does not modify the file
+    monkeypatch.setattr(vfd, "dump_json", no_serialization)
+    ax.set_ylabel("y")
+    with pytest.raises(AssertionError):
+        p.savevfd(temp_vfd)
+    assert vfd.load_vfd(temp_vfd)["title"] == "Title"
+    assert sorted(os.listdir(temp_path)) == ["copy.vfd", "saved.vfd"]
+
+
+def test_save_held_reference(tmpdir):
+    """Test changes made through a reference to the data taken before a save are saved"""
+    temp_vfd = os.path.join(str(tmpdir), "held.vfd")
+    p = builder.Builder(to_matplotlib=False)
+    fig, ax = p.subplots()
+    ax.plot([1, 2, 3], [4, 5, 6])
+    ref = p.data
+    axes_ref = ax.data
+    p.savevfd(temp_vfd)
+    ref["title"] = "T"
+    p.savevfd(temp_vfd)
+    assert vfd.load_vfd(temp_vfd)["title"] == "T"
+    axes_ref["xlabel"] = "x"
+    p.savevfd(temp_vfd)
+    assert vfd.load_vfd(temp_vfd)["plots"][0][0]["xlabel"] == "x"
+
+
+def test_get_data_reused(monkeypatch):
+    """Test converted series are reused until the plot is modified"""
+    p = builder.Builder(to_matplotlib=False)
+    fig, axes = p.subplots(1, 2)
+    twinx = axes[0].twinx()
+    axes[0].plot(np.arange(3.0), np.arange(3.0))
+    twinx.plot([1, 2], [3, 4])
+    first = p.get_data()
+    assert p.get_data() == first
+
+    calls = []
+    normal_series = builder._normal_series
+    monkeypatch.setattr(builder, "_normal_series", lambda series: calls.append(series) or normal_series(series))
+    # Changes in the results are not seen by later calls, but arrays are shared
+    first["plots"][0][0]["series"][1]["label"] = "Changed"
+    second = p.get_data()
+    assert "label" not in second["plots"][0][0]["series"][1]
+    assert second["plots"][0][0]["series"][1]["yadded"] == 1
+    assert second["plots"][0][0]["series"][0]["x"] is first["plots"][0][0]["series"][0]["x"]
+    assert not calls
+
+    # Only new series are converted
+    twinx.plot([5, 6], [7, 8])
+    axes[1].set_title("Title")
+    third = p.get_data()
+    assert len(calls) == 1
+    assert len(third["plots"][0][0]["series"]) == 3
+    assert third["plots"][0][1]["title"] == "Title"
+    assert third["plots"][0][0]["series"][0]["x"] is first["plots"][0][0]["series"][0]["x"]
+
+
+def test_get_data_edited_series(tmpdir):
+    """Test changes made inside the stored series through the data attribute are seen"""
+    temp_vfd = os.path.join(str(tmpdir), "edited.vfd")
+    p = builder.Builder(to_matplotlib=False)
+    p.plot([1, 2, 3], [4, 5, 6])
+    p.savevfd(temp_vfd)
+    p.data["series"][0]["label"] = "L"
+    p.data["series"][0]["y"][0] = 40
+    data = p.get_data()
+    assert data["series"][0]["label"] == "L"
+    assert data["series"][0]["y"] == [40, 5, 6]
+    p.savevfd(temp_vfd)
+    assert vfd.load_vfd(temp_vfd) == data
+
+    # Also in the axes and their twins
+    fig, ax = p.subplots()
+    twinx = ax.twinx()
+    twinx.plot([1, 2], [3, 4])
+    p.get_data()
+    twinx.data["series"][0]["y"][1] = 5
+    assert p.get_data()["plots"][0][0]["series"][0]["y"] == [3, 5]
+
+    # Even through references taken before the data was requested
+    p = builder.Builder(to_matplotlib=False)
+    fig, ax = p.subplots()
+    ax.plot([1, 2, 3], [4, 5, 6])
+    ref = ax.data
+    p.get_data()
+    ref["xlabel"] = "x"
+    ref["series"][0]["label"] = "L"
+    ref["series"][0]["y"][2] = 60
+    data = p.get_data()["plots"][0][0]
+    assert data["xlabel"] == "x"
+    assert data["series"][0]["label"] == "L"
+    assert data["series"][0]["y"] == [4, 5, 60]
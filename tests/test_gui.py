@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the gui module."""
+import time
+import threading
+
+import pytest
+
+from vfd.incremental import IncrementalParser
+
+gui = pytest.importorskip("vfd.gui")
+
+
+def _wait_result(renderer, timeout=10):
+    start = time.time()
+    while time.time() - start < timeout:
+        result = renderer.poll()
+        if result is not None:
+            return result
+        time.sleep(0.01)
+    raise AssertionError("No result was obtained")
+
+
+def test_preview_renderer():
+    """Test previews are rendered in background, keeping only the latest result"""
+    renderer = gui.PreviewRenderer()
+    parser = IncrementalParser(validate="fast")
+    assert renderer.poll() is None
+
+    with open("tests/plot-tests/minimal.vfd") as f:
+        text = f.read()
+    renderer.submit(gui._render_preview, parser, text)
+    image, error = _wait_result(renderer)
+    assert error is None
+    assert image.startswith(b"\x89PNG")
+    assert not renderer.busy()
+
+    # Errors are returned
+    renderer.submit(gui._render_preview, parser, '{"type": "plot"}')
+    image, error = _wait_result(renderer)
+    assert image is None
+    assert error[0].__name__ == "ValidationError"
+
+    # Outdated requests are discarded
+    event = threading.Event()
+    renderer.submit(event.wait)
+    renderer.submit(lambda: "second")
+    event.set()
+    assert _wait_result(renderer) == ("second", None)
+    assert renderer.poll() is None
+
+    # Cancelled requests give no result
+    event.clear()
+    renderer.submit(event.wait)
+    renderer.cancel()
+    event.set()
+    time.sleep(0.1)
+    assert not renderer.busy()
+    assert renderer.poll() is None
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the incremental module."""
+import json
+
+import jsonschema
+import pytest
+
+from vfd import vfd
+from vfd.incremental import IncrementalParser
+
+
+def _minimal_text():
+    with open("tests/plot-tests/minimal.vfd") as f:
+        return f.read()
+
+
+def test_incremental_parse():
+    """Test the edited texts are parsed as json would do"""
+    text = _minimal_text()
+    parser = IncrementalParser(validate=False)
+    edits = [("9.0", "-9.5e1"), ('"plot"', '"plot", "xlabel": "x"'), ("1.0", "12.0"), ("]\n        }", "]}"),
+             ('"x"', '"xlabel"'), ("12.0,", "[1],"), ("[1],", "12.0,"), ("\n", " ")]
+    assert parser.parse(text) == json.loads(text)
+    for old, new in edits:
+        text = text.replace(old, new, 1)
+        try:
+            expected = json.loads(text)
+        except ValueError:
+            with pytest.raises(ValueError):
+                parser.parse(text)
+        else:
+            assert parser.parse(text) == expected
+
+
+def test_incremental_reuse():
+    """Test the values out of the edited region are reused"""
+    text = _minimal_text()
+    parser = IncrementalParser(validate=False)
+    data = parser.parse(text)
+    # Edit before the data
+    data2 = parser.parse(text.replace('"plot",', '"plot", "title": "Title",'))
+    assert data2["title"] == "Title"
+    assert data2["series"][0]["x"] is data["series"][0]["x"]
+    assert data2["series"][0]["y"] is data["series"][0]["y"]
+    # Broken intermediate texts do not prevent the reuse
+    with pytest.raises(ValueError):
+        parser.parse(text.replace('"plot",', '"plot", "title": "Tit'))
+    data3 = parser.parse(text.replace('"plot",', '"plot", "title": "Title 2",'))
+    assert data3["series"][0]["y"] is data["series"][0]["y"]
+
+
+@pytest.mark.parametrize('mode', ["full", "fast"])
+def test_incremental_validation(mode):
+    """Test errors are found and located in the text"""
+    text = _minimal_text()
+    parser = IncrementalParser(validate=mode)
+    parser.parse(text)
+
+    bad_text = text.replace("2.0,\n                9.0", '"2.0",\n                9.0')
+    with pytest.raises(jsonschema.ValidationError) as excinfo:
+        parser.parse(bad_text)
+    line = bad_text.splitlines().index('                "2.0",') + 1
+    assert parser.error_line(excinfo.value) == line
+    # The error is kept for the same text
+    with pytest.raises(jsonschema.ValidationError):
+        parser.parse(bad_text)
+
+    # Errors in the structure are found when the data was not changed
+    with pytest.raises(jsonschema.ValidationError) as excinfo:
+        parser.parse(text.replace('"series"', '"xlog": 1, "series"'))
+    assert parser.error_line(excinfo.value) == 3
+
+    with pytest.raises(ValueError) as excinfo:
+        parser.parse(text.replace('"x"', 'x'))
+    assert parser.error_line(excinfo.value) == 5
+
+    assert parser.parse(text) == vfd.str_to_python(text)
+
+
+@pytest.mark.parametrize('mode', ["full", "fast"])
+def test_incremental_validation_moved_array(mode):
+    """Test arrays validated under a key are validated again when moved to another one"""
+    text = '{"type": "colorplot", "z": [[1, 2], [3, 4]], "levels": [1.0, 2.0, 3.0]}'
+    parser = IncrementalParser(validate=mode)
+    parser.parse(text)
+    moved = text.replace('"levels"', '"xrange"')
+    with pytest.raises(jsonschema.ValidationError):
+        vfd.str_to_python(moved, validate=mode)
+    with pytest.raises(jsonschema.ValidationError):
+        parser.parse(moved)
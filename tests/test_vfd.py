@@ -4,16 +4,24 @@
 """Tests for `vfd` package."""
 
 import os
+import io
+import json
+import re
 import shutil
+import struct
 import subprocess
+import sys
 import filecmp
 from glob import glob
 
 from click.testing import CliRunner
+import jsonschema
 import pytest
 
 from vfd import cli
 from vfd import vfd
+from vfd.cache import RenderCache
+from vfd.profiling import Profiler
 
 
 def test_command_line_interface():
@@ -27,6 +35,22 @@ def test_command_line_interface():
     assert 'Show this message and exit.' in help_result.output
 
 
+def _imported_modules(module):
+    """Get the names of the modules loaded when importing a module in a new interpreter"""
+    output = subprocess.check_output([sys.executable, "-c", "import sys, %s; print(' '.join(sys.modules))" % module],
+                                     universal_newlines=True)
+    return set(output.split())
+
+
+def test_import_time():
+    """Test heavy dependencies are not imported when the modules are loaded"""
+    heavy = ["matplotlib", "jsonschema", "xlsxwriter", "numpy"]
+    for module in ["vfd.vfd", "vfd.cli"]:
+        modules = _imported_modules(module)
+        assert module in modules
+        assert not [name for name in heavy if name in modules]
+
+
 def test_errobar():
     """Test the error bar logic"""
     assert vfd._full_errorbar([1, 2, 3], [2, 3, 4], None, True) == [1, 1, 1]
@@ -61,3 +85,530 @@ def test_plot_files(tmpdir, file):
     proc.wait()
     # Compare the files
     assert filecmp.cmp(temp_vfd[:-3] + export_format, temp_ref[:-2] + export_format)
+
+
+@pytest.mark.parametrize('file', get_plot_test_list())
+def test_dump_json(file):
+    """Test the incremental JSON writer matches python_to_json"""
+    with open(file) as f:
+        data = json.load(f)
+    for kwargs in [{}, {"compact": True}, {"compact_arrays": False}]:
+        output = io.StringIO()
+        vfd.dump_json(data, output, **kwargs)
+        assert output.getvalue() == vfd.python_to_json(data, **kwargs)
+
+    # Numbers inside strings are not modified
+    data["title"] = "Series 1, [ 2 ]"
+    output = io.StringIO()
+    vfd.dump_json(data, output)
+    assert json.loads(output.getvalue()) == data
+
+
+_float_pattern = r'[-+]?(?:(?:\d*\.\d+)|(?:\d+\.?))(?:[Ee][+-]?\d+)?'
+
+
+def _regex_python_to_json(data):
+    """Reference implementation of the compact arrays layout, post-processing the JSON with regular expressions"""
+    my_json = json.dumps(data, sort_keys=True, indent=4, separators=(',', ': '))
+    my_json = re.sub(r"(%s)\s*([,\]])\s*" % _float_pattern, r"\g<1>\g<2>", my_json)
+    my_json = re.sub(r"\[\s*(%s)\s*" % _float_pattern, r"[\g<1>", my_json)
+    my_json = re.sub(r"\s*(%s)\s*\]" % _float_pattern, r"\g<1>]", my_json)
+    return my_json
+
+
+@pytest.mark.parametrize('file', get_plot_test_list())
+def test_compact_arrays_layout(file):
+    """Test the compact arrays layout is that of the regular expression post-processing"""
+    with open(file) as f:
+        data = json.load(f)
+    assert vfd.python_to_json(data) == _regex_python_to_json(data)
+
+
+def test_compact_arrays_layout_mixed():
+    """Test the compact arrays layout with mixed and nested arrays"""
+    data = {"a": [[1, 2], [3.5, -4e-07]], "b": [], "c": {}, "d": [True, 1, "x", 2], "e": [[True], [1e+20]],
+            "f": [float("nan"), 1, float("inf")], "g": 1, "h": [{"i": [1]}, [], 3], "j": [None, [5, [6]]]}
+    assert vfd.python_to_json(data) == _regex_python_to_json(data)
+    assert json.loads(vfd.python_to_json(data)) == json.loads(json.dumps(data))
+
+
+def test_parallel_scripts(tmpdir):
+    """Test files can be processed in parallel, collecting the errors"""
+    temp_path = str(tmpdir)
+    file_list = glob(os.path.join("tests", "plot-tests", "*.vfd"))
+    for file in file_list:
+        shutil.copyfile(file, os.path.join(temp_path, os.path.basename(file)))
+    with open(os.path.join(temp_path, "bad.vfd"), "w") as f:
+        f.write('{"type": "plot"}')
+
+    errors = vfd.create_scripts(os.path.join(temp_path, "*.vfd"), run=True, export_format="png", workers=2)
+
+    assert list(errors) == [os.path.join(temp_path, "bad.vfd")]
+    for file in file_list:
+        assert os.path.isfile(os.path.join(temp_path, os.path.basename(file)[:-3] + "png"))
+
+    with pytest.raises(ValueError):
+        vfd.create_scripts(os.path.join(temp_path, "*.vfd"), run=True, export_format="png", workers=0)
+    result = CliRunner().invoke(cli.main, [os.path.join(temp_path, "*.vfd"), "-f", "png", "--jobs", "0"])
+    assert result.exit_code == 2
+    # Interactive runs are not made in the workers
+    with pytest.raises(ValueError):
+        vfd.create_scripts(os.path.join(temp_path, "*.vfd"), run=True, workers=2)
+    with pytest.raises(ValueError):
+        vfd.create_scripts(os.path.join(temp_path, "*.vfd"), run=True, blocking=False, export_format="png", workers=2)
+    result = CliRunner().invoke(cli.main, [os.path.join(temp_path, "*.vfd"), "--jobs", "2"])
+    assert result.exit_code == 2
+    # Which is not the case of the xlsx export
+    assert not vfd.create_xlsx(os.path.join(temp_path, "minimal.vfd"), workers=2)
+    assert os.path.isfile(os.path.join(temp_path, "minimal.xlsx"))
+
+
+def test_run_without_script(tmpdir):
+    """Test plots can be made without writing the script"""
+    temp_path = str(tmpdir)
+    temp_vfd = os.path.join(temp_path, "minimal.vfd")
+    shutil.copyfile(os.path.join("tests", "plot-tests", "minimal.vfd"), temp_vfd)
+    vfd.create_scripts(temp_vfd, run=True, export_format="png", write_script=False)
+    assert os.path.isfile(os.path.join(temp_path, "minimal.png"))
+    assert not os.path.exists(os.path.join(temp_path, "minimal.py"))
+
+
+@pytest.mark.parametrize('data_format', ["npz", "json"])
+@pytest.mark.parametrize('file', get_plot_test_list())
+def test_data_file(tmpdir, file, data_format):
+    """Test scripts using a data file produce the same plots"""
+    name = os.path.basename(file)[:-4]
+    temp_path = str(tmpdir)
+    temp_vfd = os.path.join(temp_path, name + ".vfd")
+    shutil.copyfile(file, temp_vfd)
+    vfd.create_scripts(temp_vfd, export_format="png", data_format=data_format)
+    assert os.path.isfile(os.path.join(temp_path, name + "." + data_format))
+    # Run the script reading the data
+    proc = subprocess.Popen(["python", name + ".py"], cwd=os.path.abspath(temp_path))
+    proc.wait()
+    shutil.move(os.path.join(temp_path, name + ".png"), os.path.join(temp_path, name + ".data.png"))
+    # Run the script with the data in it
+    vfd.create_scripts(temp_vfd, run=True, export_format="png")
+    assert filecmp.cmp(os.path.join(temp_path, name + ".png"), os.path.join(temp_path, name + ".data.png"))
+
+
+def test_render_cache(tmpdir, monkeypatch):
+    """Test exported plots are restored from the cache"""
+    temp_path = str(tmpdir)
+    temp_vfd = os.path.join(temp_path, "minimal.vfd")
+    temp_png = os.path.join(temp_path, "minimal.png")
+    shutil.copyfile(os.path.join("tests", "plot-tests", "minimal.vfd"), temp_vfd)
+    cache = RenderCache(os.path.join(temp_path, "cache"))
+    vfd.create_scripts(temp_vfd, run=True, export_format="png", cache=cache)
+    shutil.move(temp_png, temp_png + ".orig")
+
+    def no_render(*args, **kwargs):
+        raise AssertionError("Cached plot was rendered")
+
+    monkeypatch.setattr(vfd, "_run_matplotlib", no_render)
+    vfd.create_scripts(temp_vfd, run=True, export_format="png", cache=cache)
+    assert filecmp.cmp(temp_png, temp_png + ".orig")
+
+    # Changes in the options or in the file are not in the cache
+    with pytest.raises(AssertionError):
+        vfd.create_scripts(temp_vfd, run=True, export_format="png", tight_layout=True, cache=cache)
+    with open(temp_vfd, "a") as f:
+        f.write("\n")
+    with pytest.raises(AssertionError):
+        vfd.create_scripts(temp_vfd, run=True, export_format="png", cache=cache)
+
+    # Least recently used entries are removed when the limit is exceeded
+    cache.max_size = os.path.getsize(temp_png) + os.path.getsize(os.path.join(temp_path, "minimal.py"))
+    monkeypatch.undo()
+    vfd.create_scripts(temp_vfd, run=True, export_format="png", cache=cache)
+    assert len(os.listdir(cache.path)) == 1
+
+
+def test_profile(tmpdir):
+    """Test the time of the stages of each file is reported"""
+    temp_path = str(tmpdir)
+    for name in ["minimal.vfd", "colorplot.vfd"]:
+        shutil.copyfile(os.path.join("tests", "plot-tests", name), os.path.join(temp_path, name))
+    with open(os.path.join(temp_path, "bad.vfd"), "w") as f:
+        f.write('{"type": "plot"}')
+    report_path = os.path.join(temp_path, "profile.jsonl")
+    profiler = Profiler(report_path, stats_threshold=0)
+
+    errors = vfd.create_scripts(os.path.join(temp_path, "*.vfd"), run=True, export_format="png", workers=2,
+                                profile=profiler)
+    assert list(errors) == [os.path.join(temp_path, "bad.vfd")]
+    vfd.create_xlsx(os.path.join(temp_path, "minimal.vfd"), profile=profiler)
+
+    with open(report_path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 4
+    records = {(os.path.basename(r["file"]), r["task"]): r for r in records}
+    record = records["minimal.vfd", "create_scripts"]
+    # Without a cache, the file is read as it is parsed
+    assert {"parse", "validate", "codegen", "write_script", "plot", "savefig"} <= set(record["stages"])
+    assert record["input_bytes"] == os.path.getsize(os.path.join(temp_path, "minimal.vfd"))
+    assert record["output_bytes"] == sum(os.path.getsize(os.path.join(temp_path, "minimal." + extension))
+                                         for extension in ["py", "png"])
+    assert record["points"] > 0 and record["error"] is None
+    assert record["total"] >= sum(record["stages"].values())
+    assert records["colorplot.vfd", "create_scripts"]["points"] > 0
+    assert "ValidationError" in records["bad.vfd", "create_scripts"]["error"]
+    assert set(records["minimal.vfd", "create_xlsx"]["stages"]) == {"parse", "validate", "export"}
+    assert os.path.isfile(profiler.stats_path(os.path.join(temp_path, "minimal.vfd")))
+
+    # The export is timed apart in the same style context as the plotting
+    style = os.path.join(temp_path, "small.mplstyle")
+    with open(style, "w") as f:
+        f.write("figure.figsize: 4, 3\nsavefig.dpi: 20\n")
+    vfd.create_scripts(os.path.join(temp_path, "minimal.vfd"), run=True, export_format="png", context=style,
+                       profile=profiler)
+    with open(os.path.join(temp_path, "minimal.png"), "rb") as f:
+        assert struct.unpack(">II", f.read(24)[16:24]) == (80, 60)
+
+
+def test_watch_changes(tmpdir):
+    """Test changes in the watched directory are found"""
+    temp_path = str(tmpdir)
+    temp_vfd = os.path.join(temp_path, "minimal.vfd")
+    shutil.copyfile(os.path.join("tests", "plot-tests", "minimal.vfd"), temp_vfd)
+    changes = vfd._watch_changes(temp_path, interval=0.01, debounce=0.1)
+    assert next(changes) == [temp_vfd]
+
+    os.makedirs(os.path.join(temp_path, "sub"))
+    new_vfd = os.path.join(temp_path, "sub", "new.vfd")
+    shutil.copyfile(temp_vfd, new_vfd)
+    with open(os.path.join(temp_path, "other.txt"), "w") as f:
+        f.write("Not a VFD")
+    assert next(changes) == [new_vfd]
+
+    with open(temp_vfd, "a") as f:
+        f.write("\n")
+    assert next(changes) == [temp_vfd]
+
+
+def test_watch(tmpdir, monkeypatch):
+    """Test the files reported by the watcher are processed"""
+    temp_path = str(tmpdir)
+    temp_vfd = os.path.join(temp_path, "minimal.vfd")
+    shutil.copyfile(os.path.join("tests", "plot-tests", "minimal.vfd"), temp_vfd)
+    with open(os.path.join(temp_path, "bad.vfd"), "w") as f:
+        f.write('{"type": "plot"}')
+    monkeypatch.setattr(vfd, "_watch_changes", lambda path, **kwargs: iter([sorted(vfd._scan_vfd_files(path))]))
+
+    vfd.watch(temp_path, export_format="png", xlsx=True)
+    assert os.path.isfile(os.path.join(temp_path, "minimal.png"))
+    assert os.path.isfile(os.path.join(temp_path, "minimal.xlsx"))
+
+    result = CliRunner().invoke(cli.main, [temp_vfd, "--watch", temp_path, "-f", "png"])
+    assert result.exit_code == 2
+
+
+@pytest.mark.parametrize('file', get_plot_test_list())
+def test_render_image(tmpdir, file):
+    """Test images rendered in memory are equal to the exported ones"""
+    name = os.path.basename(file)[:-4]
+    temp_path = str(tmpdir)
+    temp_vfd = os.path.join(temp_path, name + ".vfd")
+    shutil.copyfile(file, temp_vfd)
+    vfd.create_scripts(temp_vfd, run=True, export_format="png", write_script=False)
+    with open(file) as f:
+        image = vfd.render_image(json.load(f), "png")
+    with open(os.path.join(temp_path, name + ".png"), "rb") as f:
+        assert image == f.read()
+
+
+def test_decimate():
+    """Test lines are reduced keeping the extremes"""
+    x = [i / 10.0 for i in range(10000)]
+    y = [(i * 7919) % 1000 for i in range(10000)]
+    assert vfd._decimate(x, y, 20000) == (x, y)
+
+    x2, y2 = vfd._decimate(x, y, 400)
+    assert len(x2) <= 400
+    assert (x2[0], y2[0]) == (x[0], y[0])
+    assert (x2[-1], y2[-1]) == (x[-1], y[-1])
+    # Extremes in each bucket are kept
+    for start in range(0, 10000, 100):
+        assert min(y[start:start + 100]) in y2
+        assert max(y[start:start + 100]) in y2
+    assert all(y[x.index(x_value)] == y_value for x_value, y_value in zip(x2, y2))
+
+    # Indexes are used if x is not given
+    x3, y3 = vfd._decimate(None, y, 400)
+    assert y3 == y2
+    assert x3 == [round(x_value * 10) for x_value in x2]
+
+    # Unsorted data is not reduced
+    assert vfd._decimate(x[::-1], y, 400) == (x[::-1], y)
+
+    # Only lines are reduced in the scripts
+    description = {"type": "plot", "series": [{"x": x, "y": y}, {"x": x, "y": y, "joined": False}]}
+    code = vfd.create_matplotlib_script(description, max_points=400)
+    assert repr(x2) in code
+    assert repr(x) in code
+
+    # Series in the added x axis are limited to its range, not to that of the main axis
+    x_range = [x[0], x[len(x) // 2]]
+    description = {"type": "plot", "xrange": [x[0] - 20, x[0] - 10], "xadded": [{"range": x_range}],
+                   "series": [{"x": x, "y": y, "xadded": 1}]}
+    code = vfd.create_matplotlib_script(description, max_points=400)
+    assert repr(vfd._decimate(x, y, 400, x_range=x_range)[0]) in code
+
+
+@pytest.mark.parametrize('mode', ["full", "fast"])
+def test_validate(mode):
+    """Test the validation modes"""
+    for file in glob(os.path.join("tests", "plot-tests", "*.vfd")):
+        with open(file) as f:
+            vfd.validate_vfd(json.load(f), mode=mode)
+
+    with pytest.raises(jsonschema.ValidationError):
+        vfd.validate_vfd({"type": "plot"}, mode=mode)
+    with pytest.raises(jsonschema.ValidationError):
+        vfd.validate_vfd({"type": "plot", "series": [{"y": [1, 2, "3"]}]}, mode=mode)
+    with pytest.raises(jsonschema.ValidationError):
+        vfd.validate_vfd({"type": "plot", "series": [{"y": [1, 2, 3], "xerr": [1, True, 3]}]}, mode=mode)
+    with pytest.raises(jsonschema.ValidationError):
+        vfd.validate_vfd({"type": "colorplot", "z": [[1, 2], [3, None]]}, mode=mode)
+    with pytest.raises(jsonschema.ValidationError):
+        vfd.validate_vfd({"type": "colorplot", "z": [[1, 2], 3]}, mode=mode)
+    with pytest.raises(ValueError):
+        vfd.validate_vfd({"type": "unknown"}, mode=mode)
+
+
+@pytest.mark.parametrize('file', get_plot_test_list())
+def test_binary_arrays(tmpdir, file):
+    """Test arrays encoded in binary are read transparently"""
+    with open(file) as f:
+        description = json.load(f)
+    for binary, compression in [("float64", None), ("float64", "zlib"), ("float32", "zlib")]:
+        text = vfd.python_to_json(description, binary=binary, compression=compression)
+        data = vfd.str_to_python(text)
+        if binary == "float64":
+            assert data == description
+        else:
+            assert vfd.python_to_json(data, binary=binary) == vfd.python_to_json(description, binary=binary)
+
+    temp_vfd = os.path.join(str(tmpdir), os.path.basename(file))
+    with open(temp_vfd, "w") as f:
+        vfd.dump_json(description, f, binary="float64")
+    vfd.create_scripts(temp_vfd, run=True, export_format="png")
+    assert os.path.isfile(temp_vfd[:-3] + "png")
+    if description["type"] == "plot":
+        vfd.create_xlsx(temp_vfd)
+        assert os.path.isfile(temp_vfd[:-3] + "xlsx")
+
+
+def test_binary_array_encoding():
+    """Test the binary encoding of arrays"""
+    x = [i / 7.0 for i in range(1000)]
+    z = [[float(i * j) for j in range(20)] for i in range(10)]
+    description = {"type": "plot", "series": [{"x": x, "y": x, "xerr": [1, 2]}]}
+    encoded = json.loads(vfd.python_to_json(description, binary="float64"))
+    assert encoded["series"][0]["x"]["dtype"] == "<f8"
+    # Short arrays are kept readable
+    assert encoded["series"][0]["xerr"] == [1, 2]
+    assert len(vfd.python_to_json(description, binary="float64", compact=True)) < \
+        len(vfd.python_to_json(description, compact=True)) * 0.7
+
+    encoded = vfd._encode_arrays({"type": "colorplot", "z": z}, binary="float32", compression="zlib")
+    assert encoded["z"]["shape"] == [10, 20]
+    assert vfd._decode_arrays(encoded)["z"] == z
+
+    with pytest.raises(ValueError):
+        vfd._decode_arrays({"type": "plot", "series": [{"y": {"dtype": "<i8", "data": ""}}]})
+    with pytest.raises(ValueError):
+        vfd._encode_arrays(description, binary="int8")
+
+
+@pytest.mark.parametrize('extension', [".vfd.gz", ".vfd.zst"])
+def test_compressed_files(tmpdir, extension):
+    """Test compressed VFD files are read and written"""
+    if extension == ".vfd.zst":
+        pytest.importorskip("zstandard")
+    temp_path = str(tmpdir)
+    with open(os.path.join("tests", "plot-tests", "minimal.vfd")) as f:
+        description = json.load(f)
+    temp_vfd = os.path.join(temp_path, "minimal" + extension)
+    with vfd.open_vfd(temp_vfd, "w") as f:
+        vfd.dump_json(description, f)
+    with vfd.open_vfd(temp_vfd) as f:
+        assert vfd.str_to_python(f.read()) == description
+    with open(temp_vfd, "rb") as f:
+        assert not f.read().startswith(b"{")
+
+    assert vfd.split_vfd_extension(temp_vfd) == (os.path.join(temp_path, "minimal"), extension)
+    # Patterns for VFD files match the compressed ones
+    vfd.create_scripts(os.path.join(temp_path, "*.vfd"), run=True, export_format="png")
+    vfd.create_xlsx(os.path.join(temp_path, "*.vfd"))
+    assert os.path.isfile(os.path.join(temp_path, "minimal.py"))
+    assert os.path.isfile(os.path.join(temp_path, "minimal.png"))
+    assert os.path.isfile(os.path.join(temp_path, "minimal.xlsx"))
+    assert vfd._scan_vfd_files(temp_path).keys() == {temp_vfd}
+
+
+def test_stream(tmpdir):
+    """Test VFD streams are consolidated into a VFD"""
+    temp_path = str(tmpdir)
+    temp_stream = os.path.join(temp_path, "stream.vfds")
+    writer = vfd.StreamWriter(temp_stream, binary="float32")
+    writer.write_header({"type": "plot", "xlabel": "t"})
+    writer.append(0, {"x": list(range(20)), "y": [1.0] * 20, "label": "A"})
+    writer.append(1, {"y": [1, 2]})
+    writer.append(0, {"x": [20], "y": [2.0]})
+    # Repeated headers are not written
+    writer.write_header({"type": "plot", "xlabel": "t"})
+    assert writer.is_intact()
+    expected = {"type": "plot", "xlabel": "t",
+                "series": [{"x": list(range(21)), "y": [1.0] * 20 + [2.0], "label": "A"}, {"y": [1, 2]}]}
+    assert vfd.read_vfd_stream(temp_stream) == expected
+
+    # A record being written is ignored
+    with open(temp_stream, "a") as f:
+        f.write('{"series": 1, "data": {"y": [3')
+    assert not writer.is_intact()
+    assert vfd.load_vfd(temp_stream) == expected
+    with vfd.open_vfd(temp_stream) as f:
+        assert json.load(f) == expected
+    with pytest.raises(ValueError):
+        vfd.open_vfd(temp_stream, "w")
+
+    # Streams are found by the patterns of VFD files
+    vfd.create_scripts(os.path.join(temp_path, "*.vfd"), run=True, export_format="png")
+    assert os.path.isfile(os.path.join(temp_path, "stream.png"))
+    vfd.create_xlsx(temp_stream)
+    assert os.path.isfile(os.path.join(temp_path, "stream.xlsx"))
+
+    with open(temp_stream, "w") as f:
+        f.write('{"series": 0, "data": {"y": [1]}}\n')
+    with pytest.raises(ValueError):
+        vfd.load_vfd(temp_stream)
+
+
+def test_external_colorplot(tmpdir):
+    """Test colorplot matrices are memory-mapped from external files"""
+    np = pytest.importorskip("numpy")
+    temp_path = str(tmpdir)
+    z = np.arange(12, dtype=float).reshape(3, 4) ** 2
+    np.save(os.path.join(temp_path, "map.npy"), z)
+    z.astype("<f4").tofile(os.path.join(temp_path, "map.raw"))
+    description = {"type": "colorplot", "x": [1, 2, 3, 4], "y": [1, 2, 3], "z": z.tolist()}
+    expected = vfd.render_image(description, "png")
+
+    for reference in [{"file": "map.npy"}, {"file": "map.raw", "dtype": "<f4", "shape": [3, 4]}]:
+        external = dict(description, z=reference)
+        for mode in ["full", "fast"]:
+            vfd.validate_vfd(external, mode=mode)
+        assert (vfd.load_external_array(reference, temp_path) == z).all()
+        code = vfd.create_matplotlib_script(external)
+        assert "mmap_mode='r'" in code or "np.memmap(" in code
+        assert repr(z.tolist()[2]) not in code
+        assert vfd.render_image(external, "png", path=temp_path) == expected
+
+    with pytest.raises(jsonschema.ValidationError):
+        vfd.validate_vfd(dict(description, z={"file": "map.raw", "shape": [3]}))
+    with pytest.raises(ValueError):
+        vfd.load_external_array({"file": "map.raw"}, temp_path)
+
+    # Changes in the external files are noticed by the cache
+    temp_vfd = os.path.join(temp_path, "map.vfd")
+    with open(temp_vfd, "w") as f:
+        json.dump(dict(description, z={"file": "map.npy"}), f)
+    cache = RenderCache(os.path.join(temp_path, "cache"))
+    vfd.create_scripts(temp_vfd, run=True, export_format="png", cache=cache)
+    with open(os.path.join(temp_path, "map.png"), "rb") as f:
+        assert f.read() == expected
+    np.save(os.path.join(temp_path, "map.npy"), -z)
+    vfd.create_scripts(temp_vfd, run=True, export_format="png", cache=cache)
+    with open(os.path.join(temp_path, "map.png"), "rb") as f:
+        assert f.read() != expected
+
+
+def _xlsx_parts(file):
+    """Get the sheet names and the chart definitions of a xlsx file"""
+    import zipfile
+    with zipfile.ZipFile(file) as z:
+        sheets = re.findall(r'<sheet name="([^"]*)"', z.read("xl/workbook.xml").decode("utf-8"))
+        charts = [z.read(name).decode("utf-8") for name in sorted(z.namelist()) if name.startswith("xl/charts/")]
+    return sheets, charts
+
+
+def test_export_xlsx(tmpdir, monkeypatch):
+    """Test the xlsx export"""
+    temp_path = str(tmpdir)
+    file = os.path.join(temp_path, "many.xlsx")
+    # Columns beyond Z
+    description = {"type": "plot", "series": [{"x": [1, 2, 3], "y": [i, i, i], "label": str(i)} for i in range(15)]}
+    vfd.export_xlsx(description, file)
+    sheets, charts = _xlsx_parts(file)
+    assert sheets == ["Sheet1"]
+    assert "Sheet1!$AC$3:$AC$5" in charts[0]
+    assert "Sheet1!$AD$3:$AD$5" in charts[0]
+
+    # Series split across sheets
+    monkeypatch.setattr(vfd, "_xlsx_max_rows", 12)
+    description = {"type": "plot", "series": [{"y": list(range(25))}, {"x": [1, 2], "y": [3, 4]}]}
+    vfd.export_xlsx(description, file)
+    sheets, charts = _xlsx_parts(file)
+    assert sheets == ["Sheet1", "Sheet1 (2)", "Sheet1 (3)"]
+    for reference in ["Sheet1!$A$3:$A$12", "'Sheet1 (2)'!$B$3:$B$12", "'Sheet1 (3)'!$B$3:$B$7", "Sheet1!$C$3:$C$4"]:
+        assert reference in charts[0]
+    assert "'Sheet1 (2)'!$C$" not in charts[0]
+
+
+def test_export_xlsx_types(tmpdir):
+    """Test the xlsx export of multiplots and colorplots"""
+    temp_path = str(tmpdir)
+    for name in ["multiplot", "colorplot"]:
+        file = os.path.join("tests", "plot-tests", name + ".vfd")
+        temp_vfd = os.path.join(temp_path, name + ".vfd")
+        shutil.copyfile(file, temp_vfd)
+        vfd.create_xlsx(temp_vfd)
+        sheets, charts = _xlsx_parts(temp_vfd[:-3] + "xlsx")
+        with open(file) as f:
+            description = json.load(f)
+        if name == "multiplot":
+            assert len(sheets) == sum(len(row) for row in description["plots"])
+            assert sheets[0] == "Plot 1-1"
+            assert len(charts) == len(sheets)
+        else:
+            assert sheets == ["Sheet1"]
+            assert not charts
+
+    # Colorplot stored in an external file
+    np = pytest.importorskip("numpy")
+    np.save(os.path.join(temp_path, "map.npy"), np.arange(6.0).reshape(2, 3))
+    vfd.export_xlsx({"type": "colorplot", "z": {"file": "map.npy"}}, os.path.join(temp_path, "map.xlsx"),
+                    path=temp_path)
+    import zipfile
+    with zipfile.ZipFile(os.path.join(temp_path, "map.xlsx")) as z:
+        sheet = z.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert "<v>5</v>" in sheet
+    assert "colorScale" in sheet
+
+    # Values which are not finite are not in the color scale
+    z = np.arange(6.0).reshape(2, 3)
+    z[0, 1] = np.inf
+    np.save(os.path.join(temp_path, "map.npy"), z)
+    vfd.export_xlsx({"type": "colorplot", "z": {"file": "map.npy"}}, os.path.join(temp_path, "map.xlsx"),
+                    path=temp_path)
+    with zipfile.ZipFile(os.path.join(temp_path, "map.xlsx")) as z:
+        sheet = z.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert re.findall(r'<cfvo type="num" val="([^"]*)"/>', sheet) == ["0.0", "2.5", "5.0"]
+
+
+def test_xlsx_finite_range(tmpdir, monkeypatch):
+    """Test the range of the color scale is found reading memory-mapped matrices by blocks"""
+    np = pytest.importorskip("numpy")
+    file = os.path.join(str(tmpdir), "map.npy")
+    z = np.arange(20.0).reshape(5, 4)
+    z[0, 0] = -np.inf
+    z[1, :] = np.nan
+    z[4, 3] = np.inf
+    np.save(file, z)
+    z = vfd.load_external_array({"file": "map.npy"}, str(tmpdir))
+    assert isinstance(z, np.memmap)
+    monkeypatch.setattr(vfd, "_xlsx_block_size", 4)
+    assert vfd._finite_range(z) == (1.0, 18.0)
+    z = np.full((3, 2), np.inf)
+    assert vfd._finite_range(z) == (0, 1)
@@ -3,13 +3,15 @@
 
 from __future__ import division
 
+import os
+import sys
 from os import path
 import math
+import shutil
 import tempfile
 import subprocess
 from numbers import Number
 import logging
-from copy import deepcopy
 
 try:
     import matplotlib.pyplot as plt
@@ -24,15 +26,14 @@ except ImportError:
 
 from . import vfd
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.Logger("vfd")
 
 try:
     import numpy as np
 
 
-    def _ensure_normal_type(*lists):
-        """Make sure lists of data are regular python"""
+    def _ensure_normal_type_slow(*lists):
+        """Make sure lists of data are regular python, checking them point by point"""
         ret = tuple([[] for _ in range(len(lists))])
         for items in zip(*lists):
             if np.isfinite(items).all():
@@ -40,12 +41,47 @@ try:
                     if isinstance(i, np.ndarray):
                         i = i.tolist()
                     if isinstance(i, np.generic):
-                        ret[pos].append(np.asscalar(i))
+                        ret[pos].append(i.item())
                     else:
                         ret[pos].append(i)
         return ret
 
 
+    def _ensure_normal_type(*lists):
+        """Make sure lists of data are regular python"""
+        if not lists:
+            return ()
+        try:
+            arrays = [np.asarray(l) for l in lists]
+        except ValueError:  # E.g., ragged nested lists
+            return _ensure_normal_type_slow(*lists)
+        if any(a.ndim == 0 or a.dtype.kind not in "biuf" for a in arrays):
+            return _ensure_normal_type_slow(*lists)
+        # zip would stop at the shortest list
+        length = min(len(a) for a in arrays)
+        if length == 0:
+            return tuple([] for _ in arrays)
+        arrays = [a[:length] for a in arrays]
+        # A point is kept if all of its coordinates are finite (in every dimension, if they were nested)
+        mask = np.ones(length, dtype=bool)
+        for a in arrays:
+            if a.dtype.kind == "f":
+                mask &= np.isfinite(a.reshape(length, -1)).all(axis=1)
+        if mask.all():
+            return tuple(a.tolist() for a in arrays)
+        return tuple(a[mask].tolist() for a in arrays)
+
+
+    def _store(values):
+        """Keep a private copy of some plotted data until it is serialized"""
+        if isinstance(values, np.ndarray):
+            values = np.array(values)
+            values.flags.writeable = False
+            return values
+        # Rows of nested lists are copied too
+        return [_store(v) if isinstance(v, (list, tuple, np.ndarray)) else v for v in values]
+
+
 except ImportError:
     # Assume no numpy is used if no numpy is around
     def _ensure_normal_type(*lists):
@@ -60,6 +96,12 @@ except ImportError:
         return ret
 
 
+    def _store(values):
+        """Keep a private copy of some plotted data until it is serialized"""
+        # Rows of nested lists are copied too
+        return [_store(v) if isinstance(v, (list, tuple)) else v for v in values]
+
+
 def _squeeze_matrix(matrix):
     """Remove dimensions with one element"""
     if len(matrix[0]) == 1 and len(matrix) == 1:
@@ -72,7 +114,180 @@ def _squeeze_matrix(matrix):
         return matrix
 
 
-_float_pattern = '[-+]?(?:(?:\d*\.\d+)|(?:\d+\.?))(?:[Ee][+-]?\d+)?'
+_error_keys = ["xerr", "yerr", "xmin", "xmax", "ymin", "ymax"]
+
+
+def _normal_data(data, external=None):
+    """
+    Get a copy of the data of a plot where the stored series are converted to regular python.
+
+    Points which are not finite are removed at this point.
+
+    Args:
+        data (dict): The data stored by a Builder or an AxesBuilder.
+        external (callable): If given, function saving the z values of a colorplot in an external file and returning
+                             the reference to it which is used instead. Its values are kept as they are.
+
+    Returns:
+        dict: A copy of the data which can be serialized.
+
+    """
+    data = dict(data)
+    if "series" in data:
+        data["series"] = [_normal_series(series) for series in data["series"]]
+    if "z" in data:
+        if external is not None:
+            data["z"] = external(data["z"])
+        else:
+            # Remove columns with non finite values
+            data["z"] = list(_ensure_normal_type(*data["z"]))
+        for key in ["x", "y"]:
+            if key in data:
+                data[key] = _ensure_normal_type(data[key])[0]
+    return data
+
+
+def _normal_series(series):
+    """Get a copy of a stored series converted to regular python, removing the points with any value not finite"""
+    series = dict(series)
+    # Points are removed from all the arrays at once, so they keep matching
+    keys = (["x", "y"] if "x" in series else ["y"]) + [key for key in _error_keys if key in series]
+    for key, values in zip(keys, _ensure_normal_type(*[series[key] for key in keys])):
+        series[key] = values
+    return series
+
+
+class _StreamState(object):
+    """The records written by a Builder to a VFD stream"""
+
+    def __init__(self, fname, options, accesses):
+        self.writer = vfd.StreamWriter(fname, **options)
+        self.options = options
+        # Accesses to the data of the builders from outside when written, which might have changed the series
+        self.accesses = accesses
+        # Mapping from the positions of the plots to the stored series already written
+        self.written = {}
+
+    def can_append(self, fname, options, accesses, sources):
+        """Check if the series can be appended to the stream, because the written ones are the first of them"""
+        if fname != self.writer.path or options != self.options or not self.writer.is_intact():
+            return False
+        if accesses != self.accesses:
+            return False
+        for position, written in self.written.items():
+            current = sources.get(position, [])
+            if len(current) < len(written) or any(a is not b for a, (b, _) in zip(written, current)):
+                return False
+        return True
+
+
+def _npy_saver(stem):
+    """
+    Get a function saving matrices in .npy files with a common stem, as needed by _normal_data.
+
+    Args:
+        stem (str): Path of the files without the extension. A suffix with a counter is added to it.
+
+    Returns:
+        callable: The function, which returns the reference to the file relative to its directory.
+
+    """
+    import numpy
+    saved = []
+
+    def save(matrix):
+        file = "%s.z%d.npy" % (stem, len(saved))
+        numpy.save(file, numpy.asarray(matrix, dtype=float))
+        saved.append(file)
+        return {"file": path.basename(file)}
+
+    return save
+
+
+def _structural_copy(data):
+    """Copy the dicts and lists of a VFD, sharing the arrays of numbers with the original"""
+    if isinstance(data, dict):
+        return {key: _structural_copy(value) for key, value in data.items()}
+    # Arrays of numbers are not walked
+    if isinstance(data, list) and data and isinstance(data[0], (dict, list)):
+        return [_structural_copy(value) for value in data]
+    return data
+
+
+class _TrackedData(object):
+    """Base of the builders, which track the accesses to their data to know when it might have been modified"""
+
+    def _get_memoized(self):
+        """Get a copy of the data given by the last get_data without external files, if nothing was modified since"""
+        if self._memo is not None and self._memo[0] == self._modification_state():
+            return _structural_copy(self._memo[1])
+        return None
+
+    def _memoize(self, state, data):
+        """Keep the data given by get_data in a state, returning a copy of it"""
+        self._memo = (state, data)
+        return _structural_copy(data)
+
+    def _normal_sources(self, sources):
+        """
+        Get the stored series converted to regular python, reusing those converted in the previous call.
+
+        The methods of the builders never modify a series once stored, so its conversion is reused while it is the
+        same object, unless the data was accessed from outside, since it might be changed through any reference.
+
+        Args:
+            sources (list of tuple): The stored series of this builder and the values added to them.
+
+        Returns:
+            list of dict: The series, sharing their arrays with the ones given in other calls.
+
+        """
+        normal_cache = {}
+        series_list = []
+        for series, added in sources:
+            cached = None if self._exposed else self._normal_cache.get(id(series))
+            normal = cached[1] if cached is not None and cached[0] is series else _normal_series(series)
+            normal_cache[id(series)] = (series, normal)
+            series_list.append(dict(normal, **added) if added else dict(normal))
+        self._normal_cache = normal_cache
+        return series_list
+
+    @property
+    def data(self):
+        """
+        The data stored for the plot.
+
+        Once accessed, the builder is considered modified whenever it is saved or serialized, since the data might
+        be changed at any time through a reference to it, even inside the stored series.
+        """
+        self._exposed = True
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._exposed = True
+        self._data = value
+
+    def _access_state(self):
+        """Get a value which changes in every call once the data was accessed from outside, as it might be modified"""
+        if self._exposed:
+            self._data_accesses += 1
+        return self._data_accesses
+
+    @property
+    def _stored(self):
+        """The data, as accessed by the methods of the builder, which never modify the stored series"""
+        self._version += 1
+        return self._data
+
+
+def _file_signature(fname):
+    """Get a value which changes if a file is written, or None if it does not exist"""
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns if sys.version_info >= (3, 3) else stat.st_mtime
 
 
 def supplant_pyplot():
@@ -85,7 +300,7 @@ def supplant_pyplot():
 
 # TODO: A lot of repeated code to move to a default Axes object
 
-class Builder:
+class Builder(_TrackedData):
     """
     Class that mimics the behaviour of matplotlib.pyplot to produce vfd files.
 
@@ -94,14 +309,34 @@ class Builder:
 
     """
 
-    def __init__(self, to_matplotlib=True):
+    def __init__(self, to_matplotlib=True, binary=None, compression=None, external_z=False, stream=False):
         """
 
         Args:
             to_matplotlib (bool): Whether to send all methods to matplotlib.pyplot after getting their info.
+            binary (str): If given, default type used to store the arrays of numbers in binary ("float64" or
+                          "float32") when saving or serializing. See `vfd.python_to_json`.
+            compression (str): If binary was given, default compression applied to the arrays ("zlib").
+            external_z (bool): Whether to save the z values of the colorplots in .npy files next to the VFD files
+                               instead of in them. Those are memory-mapped when rendered, so large matrices are
+                               never converted to Python objects. Requires numpy.
+            stream (bool): Whether to save the VFD files as streams (.vfds), so each save only appends the series
+                           plotted since the previous one. See `vfd.StreamWriter`.
 
         """
-        self.data = {}
+        self._version = 0
+        self._data_accesses = 0
+        self._exposed = False
+        self._data = {}
+        self._memo = None
+        self._normal_cache = {}
+        self.binary = binary
+        self.compression = compression
+        self.external_z = external_z
+        self.stream = stream
+        self._stream_state = None
+        # The key of the last saved VFD, its path and its signature when saved
+        self._saved = None
         self._fig = None
         self._subplots = None
         if plt is None and to_matplotlib:
@@ -117,20 +352,20 @@ class Builder:
         pass
 
     def semilogx(self, *args, **kwargs):
-        self.data["xlog"] = True
+        self._stored["xlog"] = True
         self._plot(*args, **kwargs)
         if self.to_matplotlib:
             return plt.semilogx(*args, **kwargs)
 
     def semilogy(self, *args, **kwargs):
-        self.data["ylog"] = True
+        self._stored["ylog"] = True
         self._plot(*args, **kwargs)
         if self.to_matplotlib:
             return plt.semilogy(*args, **kwargs)
 
     def loglog(self, *args, **kwargs):
-        self.data["xlog"] = True
-        self.data["ylog"] = True
+        self._stored["xlog"] = True
+        self._stored["ylog"] = True
         self._plot(*args, **kwargs)
         if self.to_matplotlib:
             return plt.loglog(*args, **kwargs)
@@ -141,72 +376,72 @@ class Builder:
             return plt.plot(*args, **kwargs)
 
     def _plot(self, *args, **kwargs):
-        self.data["type"] = "plot"
+        self._stored["type"] = "plot"
         if len(args) == 0:
             raise TypeError("At least one argument is needed")
         new_series = {}
         if len(args) == 1:
-            new_series["y"] = _ensure_normal_type(args[0])[0]
+            new_series["y"] = _store(args[0])
         else:
-            new_series["x"], new_series["y"] = _ensure_normal_type(args[0], args[1])
+            new_series["x"], new_series["y"] = _store(args[0]), _store(args[1])
         if "label" in kwargs:
             new_series["label"] = str(kwargs["label"])
 
-        if "series" not in self.data:
-            self.data["series"] = [new_series]
+        if "series" not in self._stored:
+            self._stored["series"] = [new_series]
         else:
-            self.data["series"].append(new_series)
+            self._stored["series"].append(new_series)
 
     def errorbar(self, x, y, yerr=None, xerr=None, **kwargs):
-        self.data["type"] = "plot"
-        new_series = {"x": x, "y": y}
-        if yerr:
+        self._stored["type"] = "plot"
+        new_series = {"x": _store(x), "y": _store(y)}
+        if yerr is not None:
             if isinstance(yerr, Number):
                 new_series["yerr"] = _ensure_normal_type([yerr] * len(y))[0]
             elif isinstance(yerr[0], Number):
-                new_series["yerr"] = _ensure_normal_type(yerr)[0]
+                new_series["yerr"] = _store(yerr)
             else:
-                new_series["ymax"] = _ensure_normal_type([y0 + err for y0, err in zip(y, yerr[0])])[0]
-                new_series["ymin"] = _ensure_normal_type([y0 - err for y0, err in zip(y, yerr[1])])[0]
+                new_series["ymax"] = [y0 + err for y0, err in zip(y, yerr[0])]
+                new_series["ymin"] = [y0 - err for y0, err in zip(y, yerr[1])]
 
-        if xerr:
+        if xerr is not None:
             if isinstance(xerr, Number):
                 new_series["xerr"] = _ensure_normal_type([xerr] * len(x))[0]
             elif isinstance(xerr[0], Number):
-                new_series["xerr"] = _ensure_normal_type(xerr)[0]
+                new_series["xerr"] = _store(xerr)
             else:
-                new_series["xmax"] = _ensure_normal_type([y0 + err for y0, err in zip(x, xerr[0])])[0]
-                new_series["xmin"] = _ensure_normal_type([y0 - err for y0, err in zip(x, xerr[1])])[0]
+                new_series["xmax"] = [y0 + err for y0, err in zip(x, xerr[0])]
+                new_series["xmin"] = [y0 - err for y0, err in zip(x, xerr[1])]
 
         if "label" in kwargs:
             new_series["label"] = str(kwargs["label"])
 
-        if "series" not in self.data:
-            self.data["series"] = [new_series]
+        if "series" not in self._stored:
+            self._stored["series"] = [new_series]
         else:
-            self.data["series"].append(new_series)
+            self._stored["series"].append(new_series)
 
         if self.to_matplotlib:
             return plt.errorbar(x, y, yerr=None, xerr=None, **kwargs)
 
     def xlabel(self, label, **kwargs):
-        self.data["xlabel"] = label
+        self._stored["xlabel"] = label
         if self.to_matplotlib:
             return plt.xlabel(label, **kwargs)
 
     def ylabel(self, label, **kwargs):
-        self.data["ylabel"] = label
+        self._stored["ylabel"] = label
         if self.to_matplotlib:
             return plt.ylabel(label, **kwargs)
 
     def title(self, title, *args):
-        self.data["title"] = title
+        self._stored["title"] = title
         if self.to_matplotlib:
             return plt.title(title, *args)
 
     def legend(self, *args, **kwargs):
         try:
-            self.data["legendtitle"] = kwargs["title"]
+            self._stored["legendtitle"] = kwargs["title"]
         except KeyError:
             pass
         # TODO: Parse other args.
@@ -215,9 +450,9 @@ class Builder:
 
     def ylim(self, *args, **kwargs):
         if len(args) == 2:
-            self.data["yrange"] = args
+            self._stored["yrange"] = args
         elif len(args) == 1:
-            self.data["yrange"] = args[0]
+            self._stored["yrange"] = args[0]
         # TODO: Parse kwargs
         if self.to_matplotlib:
             return plt.ylim(*args, **kwargs)
@@ -225,9 +460,9 @@ class Builder:
 
     def xlim(self, *args, **kwargs):
         if len(args) == 2:
-            self.data["xrange"] = args
+            self._stored["xrange"] = args
         elif len(args) == 1:
-            self.data["xrange"] = args[0]
+            self._stored["xrange"] = args[0]
         # TODO: Parse kwargs
         if self.to_matplotlib:
             return plt.xlim(*args, **kwargs)
@@ -255,8 +490,8 @@ class Builder:
 
     def _colorplot(self, *args, **kwargs):
         if len(args) in [1, 2]:  # 2nd argument might be in the signature of contour/contourf
-            self.data["type"] = "colorplot"
-            self.data["z"] = list(_ensure_normal_type(*args[0]))
+            self._stored["type"] = "colorplot"
+            self._stored["z"] = _store(args[0])
         elif len(args) in [3, 4]:  # 4th argument might be in the signature of contour/contourf
             x, y, z = args[0:3]
             # Dimensions of X,Y in pcolor/pcolormesh might be those of Z + 1 (in fact, they should)
@@ -267,17 +502,17 @@ class Builder:
             if len(y) == len(z) + 1:
                 y = [(a + b) / 2 for a, b in zip(y[1:], y[:-1])]
 
-            self.data["type"] = "colorplot"
+            self._stored["type"] = "colorplot"
             # TODO: Nan and Inf should be improved
-            self.data["x"] = _ensure_normal_type(x)[0]
-            self.data["y"] = _ensure_normal_type(y)[0]
-            self.data["z"] = list(_ensure_normal_type(*z))
+            self._stored["x"] = _store(x)
+            self._stored["y"] = _store(y)
+            self._stored["z"] = _store(z)
         else:
             raise ValueError("Bad argument number")
         if "norm" in kwargs and plt is not None:
             # Check if logarithmic
             if isinstance(kwargs["norm"], LogNorm):
-                self.data["zlog"] = True
+                self._stored["zlog"] = True
 
     def subplots(self, *args, **kwargs):
         # Default values
@@ -308,16 +543,16 @@ class Builder:
             self._fig = FigureBuilder(self, fig=fig)
             self._subplots = [[AxesBuilder(axis) for axis in row] for row in mpl_axes]
         else:
-            fig = FigureBuilder(self, fig=None)
+            self._fig = FigureBuilder(self, fig=None)
             self._subplots = [[AxesBuilder(None) for _ in range(num_cols)] for _ in range(num_rows)]
-        self.data["type"] = "multiplot"
+        self._stored["type"] = "multiplot"
         try:
-            self.data["xshared"] = kwargs["sharex"] if isinstance(kwargs["sharex"], str) else (
+            self._stored["xshared"] = kwargs["sharex"] if isinstance(kwargs["sharex"], str) else (
                 "all" if kwargs["sharex"] else "none")
         except KeyError:
             pass
         try:
-            self.data["yshared"] = kwargs["sharey"] if isinstance(kwargs["sharey"], str) else (
+            self._stored["yshared"] = kwargs["sharey"] if isinstance(kwargs["sharey"], str) else (
                 "all" if kwargs["sharey"] else "none")
         except KeyError:
             pass
@@ -327,19 +562,91 @@ class Builder:
             return self._fig, self._subplots
 
     def text(self, x, y, s, **kwargs):
-        if "epilog" not in self.data:
-            self.data["epilog"] = []
-        self.data["epilog"].append({"type": "text", "x": x, "y": y, "text": s})
+        if "epilog" not in self._stored:
+            self._stored["epilog"] = []
+        self._stored["epilog"].append({"type": "text", "x": x, "y": y, "text": s})
         if self.to_matplotlib:
             return plt.text(x, y, s, **kwargs)
 
-    def get_data(self):
+    def get_data(self, external=None):
+        """
+        Get the data describing the plot.
+
+        Stored series are converted to regular python at this point, which is (potentially) expensive. Converted
+        series are reused in later calls, so only the ones plotted since are converted, and the whole result is
+        reused until the builder or its axes are modified. Nothing is reused once their data attribute is accessed,
+        since it might be modified through the returned reference. The arrays of numbers are shared among the results,
+        so they should not be modified.
+
+        Args:
+            external (callable): If given, function saving the z values of a colorplot in an external file and
+                                 returning the reference to it which is used instead. The result is not reused then.
+
+        Returns:
+            dict: A python representation of the VFD.
+
+        """
+        if external is None:
+            memoized = self._get_memoized()
+            if memoized is not None:
+                return memoized
+        state = self._modification_state()
+        data = self._get_header(external=external)
+        if "series" in self._data:
+            data["series"] = self._normal_sources([(series, None) for series in self._data["series"]])
         if self._subplots is not None:
-            self.data["plots"] = [[x.get_data() for x in row] for row in self._subplots]
+            data["plots"] = [[x.get_data(external=external) for x in row] for row in self._subplots]
 
-        return self.data
+        return self._memoize(state, data) if external is None else data
 
-    def to_json(self, compact=False, compact_arrays=True):
+    def _get_header(self, external=None):
+        """Get the data describing the plot without the series, which are given by _series_sources"""
+        data = _normal_data({key: value for key, value in self._data.items() if key != "series"}, external=external)
+        if self._subplots is not None:
+            data["plots"] = [[x._get_header(external=external) for x in row] for row in self._subplots]
+        return data
+
+    def _series_sources(self):
+        """
+        Get the stored series in the plot, in the order of get_data.
+
+        Returns:
+            dict: A mapping from the position of the plot in a multiplot (or an empty tuple) to a list of tuples with
+                  each stored series and the values added to it, if any.
+
+        """
+        sources = {}
+        if "series" in self._data:
+            sources[()] = [(series, None) for series in self._data["series"]]
+        if self._subplots is not None:
+            for i, row in enumerate(self._subplots):
+                for j, axes in enumerate(row):
+                    sources[(i, j)] = axes._series_sources()
+        return sources
+
+    def _modification_state(self):
+        """Get a value which changes whenever the data of the builder or its axes might have been modified"""
+        state = [self._version, self._access_state()]
+        if self._subplots is not None:
+            state += [axes._modification_state() for row in self._subplots for axes in row]
+        return tuple(state)
+
+    def _data_access_state(self):
+        """Get a value which changes whenever the data of the builder or its axes might be modified from outside"""
+        state = [self._access_state()]
+        if self._subplots is not None:
+            state += [axes._data_access_state() for row in self._subplots for axes in row]
+        return tuple(state)
+
+    def _binary_options(self, binary, compression):
+        """Get the binary encoding options, using the ones of the builder by default"""
+        if binary is None:
+            binary = self.binary
+            if compression is None:
+                compression = self.compression
+        return {"binary": binary or None, "compression": compression}
+
+    def to_json(self, compact=False, compact_arrays=True, binary=None, compression=None):
         """
         Return a JSON representation of the data.
 
@@ -347,17 +654,21 @@ class Builder:
             compact (bool): Whether to save space in detriment of readability.
             compact_arrays (bool): If compact was False, whether to make 1d arrays of numbers compact.
                                    This both improves readability and saves space.
+            binary (str): Type used to store the arrays of numbers in binary ("float64" or "float32"). If None, the
+                          one given to the builder is used. If False, plain JSON numbers are used.
+            compression (str): If binary was given, compression applied to the arrays ("zlib").
 
         Returns:
             str: A JSON representation of the data.
 
         """
-        return vfd.python_to_json(self.get_data(), compact=compact, compact_arrays=compact_arrays)
+        return vfd.python_to_json(self.get_data(), compact=compact, compact_arrays=compact_arrays,
+                                  **self._binary_options(binary, compression))
 
     def show(self):
         # TODO: Doesn't work from Jupyter
         with tempfile.NamedTemporaryFile(suffix=".vfd") as f:
-            self.savevfd(f.name)
+            self.savevfd(f.name, external_z=False, stream=False)
             # Prefer the system installed vfd to the package
             proc = subprocess.Popen(["vfd", path.abspath(f.name)],
                                     cwd=path.abspath(path.dirname(f.name)))
@@ -365,7 +676,7 @@ class Builder:
         if self.to_matplotlib:
             return plt.show()
 
-    def savevfd(self, fname):
+    def savevfd(self, fname, binary=None, compression=None, external_z=None, stream=None):
         """
         Save the data as a vfd file.
 
@@ -373,17 +684,72 @@ class Builder:
         However, the original export is not overridden by the created VFD.
 
         Args:
-            fname: Path where the file will be saved. If the extension is not vfd, it will be changed to it.
-
+            fname: Path where the file will be saved. If the extension is not vfd, it will be changed to it. If it is
+                   that of a compressed VFD (.vfd.gz or .vfd.zst), the file is compressed as it is written.
+            binary (str): Type used to store the arrays of numbers in binary ("float64" or "float32"). If None, the
+                          one given to the builder is used. If False, plain JSON numbers are used.
+            compression (str): If binary was given, compression applied to the arrays ("zlib").
+            external_z (bool): Whether to save the z values of the colorplots in .npy files next to the VFD, named
+                               after it. If None, the option given to the builder is used.
+            stream (bool): Whether to save the file as a VFD stream (.vfds). If the last save was to the same stream
+                           and the series it wrote are still the first ones, only the new series are appended to it.
+                           Otherwise, it is written from scratch. If None, the option given to the builder is used,
+                           or a stream is saved if fname has its extension.
+
+        If the data was not modified since the last save with the same options, the file is not written again if it
+        is still as saved, or it is copied to the new path. Otherwise, the file is written to a temporary one which
+        replaces it when complete, so a failure never leaves a partially written VFD.
 
         """
-        if "." in path.basename(fname):  # If has an extension
-            fname = fname.rsplit(".", 1)[0]  # Remove it
-
-        fname += ".vfd"
-
-        with open(fname, "w") as text_file:
-            text_file.write(self.to_json())
+        stem, extension = vfd.split_vfd_extension(fname)
+        if stream is None:
+            stream = self.stream or extension == vfd.stream_extension
+        if stream:
+            extension = vfd.stream_extension
+        elif extension not in vfd.vfd_extensions or extension == vfd.stream_extension:
+            extension = ".vfd"
+        fname = stem + extension
+
+        if external_z is None:
+            external_z = self.external_z
+        options = self._binary_options(binary, compression)
+        key = (self._modification_state(), extension, external_z, options)
+        if self._saved is not None and self._saved[0] == key and _file_signature(self._saved[1]) == self._saved[2]:
+            if self._saved[1] == fname:
+                return
+            # External files and streams are named after the path, so they are not copied
+            if not external_z and not stream:
+                with open(self._saved[1], "rb") as source, vfd.write_vfd_atomic(fname, "wb") as target:
+                    shutil.copyfileobj(source, target)
+                self._saved = (key, fname, _file_signature(fname))
+                return
+
+        external = _npy_saver(stem) if external_z else None
+        if stream:
+            self._save_stream(fname, external, options)
+        else:
+            data = self.get_data(external=external)
+            with vfd.write_vfd_atomic(fname) as text_file:
+                vfd.dump_json(data, text_file, **options)
+        self._saved = (key, fname, _file_signature(fname))
+
+    def _save_stream(self, fname, external, options):
+        """Save the data as a VFD stream, appending only the new series if possible"""
+        sources = self._series_sources()
+        accesses = self._data_access_state()
+        state = self._stream_state
+        if state is None or not state.can_append(fname, options, accesses, sources):
+            state = self._stream_state = _StreamState(fname, options, accesses)
+        state.writer.write_header(self._get_header(external=external))
+        for position, series_list in sources.items():
+            written = state.written.setdefault(position, [])
+            for index in range(len(written), len(series_list)):
+                series, added = series_list[index]
+                data = _normal_series(series)
+                if added:
+                    data.update(added)
+                state.writer.append(index, data, plot=position or None)
+                written.append(series)
 
     def savefig(self, fname, **kwargs):
         self.savevfd(fname)
@@ -424,14 +790,19 @@ class FigureBuilder:
             raise AttributeError("FigureBuilder has no attribute '%s'" % name)
 
 
-class AxesBuilder:
+class AxesBuilder(_TrackedData):
     """
     Class that mimics the behaviour of matplotlib.pyplot.axes to produce vfd files.
     """
 
     def __init__(self, axes=None):
+        self._version = 0
+        self._data_accesses = 0
+        self._exposed = False
+        self._memo = None
+        self._normal_cache = {}
         self.axes = axes
-        self.data = {"type": "plot"}
+        self._data = {"type": "plot"}
         self.twins_x = []
         self.twins_y = []
 
@@ -441,52 +812,52 @@ class AxesBuilder:
             return self.axes.plot(*args, **kwargs)
 
     def semilogx(self, *args, **kwargs):
-        self.data["xlog"] = True
+        self._stored["xlog"] = True
         self._plot(*args, **kwargs)
         if self.axes is not None:
             return self.axes.semilogx(*args, **kwargs)
 
     def semilogy(self, *args, **kwargs):
-        self.data["ylog"] = True
+        self._stored["ylog"] = True
         self._plot(*args, **kwargs)
         if self.axes is not None:
             return self.axes.semilogy(*args, **kwargs)
 
     def loglog(self, *args, **kwargs):
-        self.data["xlog"] = True
-        self.data["ylog"] = True
+        self._stored["xlog"] = True
+        self._stored["ylog"] = True
         self._plot(*args, **kwargs)
         if self.axes is not None:
             return self.axes.loglog(*args, **kwargs)
 
     def errorbar(self, x, y, yerr=None, xerr=None, **kwargs):
-        self.data["type"] = "plot"
-        new_series = {"x": x, "y": y}
-        if yerr:
+        self._stored["type"] = "plot"
+        new_series = {"x": _store(x), "y": _store(y)}
+        if yerr is not None:
             if isinstance(yerr, Number):
                 new_series["yerr"] = _ensure_normal_type([yerr] * len(y))[0]
             elif isinstance(yerr[0], Number):
-                new_series["yerr"] = _ensure_normal_type(yerr)[0]
+                new_series["yerr"] = _store(yerr)
             else:
-                new_series["ymax"] = _ensure_normal_type([y0 + err for y0, err in zip(y, yerr[0])])[0]
-                new_series["ymin"] = _ensure_normal_type([y0 - err for y0, err in zip(y, yerr[1])])[0]
+                new_series["ymax"] = [y0 + err for y0, err in zip(y, yerr[0])]
+                new_series["ymin"] = [y0 - err for y0, err in zip(y, yerr[1])]
 
-        if xerr:
+        if xerr is not None:
             if isinstance(xerr, Number):
                 new_series["xerr"] = _ensure_normal_type([xerr] * len(x))[0]
             elif isinstance(xerr[0], Number):
-                new_series["xerr"] = _ensure_normal_type(xerr)[0]
+                new_series["xerr"] = _store(xerr)
             else:
-                new_series["xmax"] = _ensure_normal_type([y0 + err for y0, err in zip(x, xerr[0])])[0]
-                new_series["xmin"] = _ensure_normal_type([y0 - err for y0, err in zip(x, xerr[1])])[0]
+                new_series["xmax"] = [y0 + err for y0, err in zip(x, xerr[0])]
+                new_series["xmin"] = [y0 - err for y0, err in zip(x, xerr[1])]
 
         if "label" in kwargs:
             new_series["label"] = str(kwargs["label"])
 
-        if "series" not in self.data:
-            self.data["series"] = [new_series]
+        if "series" not in self._stored:
+            self._stored["series"] = [new_series]
         else:
-            self.data["series"].append(new_series)
+            self._stored["series"].append(new_series)
 
         if self.axes is not None:
             return self.axes.errorbar(x, y, yerr=None, xerr=None, **kwargs)
@@ -496,35 +867,35 @@ class AxesBuilder:
             raise TypeError("At least one argument is needed")
         new_series = {}
         if len(args) == 1:
-            new_series["y"] = _ensure_normal_type(args[0])[0]
+            new_series["y"] = _store(args[0])
         else:
-            new_series["x"], new_series["y"] = _ensure_normal_type(args[0], args[1])
+            new_series["x"], new_series["y"] = _store(args[0]), _store(args[1])
         if "label" in kwargs:
             new_series["label"] = str(kwargs["label"])
 
-        if "series" not in self.data:
-            self.data["series"] = [new_series]
+        if "series" not in self._stored:
+            self._stored["series"] = [new_series]
         else:
-            self.data["series"].append(new_series)
+            self._stored["series"].append(new_series)
 
     def set_xlabel(self, label, **kwargs):
-        self.data["xlabel"] = label
+        self._stored["xlabel"] = label
         if self.axes is not None:
             return self.axes.set_xlabel(label, **kwargs)
 
     def set_ylabel(self, label, **kwargs):
-        self.data["ylabel"] = label
+        self._stored["ylabel"] = label
         if self.axes is not None:
             return self.axes.set_ylabel(label, **kwargs)
 
     def set_title(self, title, *args):
-        self.data["title"] = title
+        self._stored["title"] = title
         if self.axes is not None:
             return self.axes.set_title(title, *args)
 
     def legend(self, *args, **kwargs):
         try:
-            self.data["legendtitle"] = kwargs["title"]
+            self._stored["legendtitle"] = kwargs["title"]
         except KeyError:
             pass
         # TODO: Parse other args.
@@ -533,9 +904,9 @@ class AxesBuilder:
 
     def set_ylim(self, *args, **kwargs):
         if len(args) == 2:
-            self.data["yrange"] = args
+            self._stored["yrange"] = args
         elif len(args) == 1:
-            self.data["yrange"] = args[0]
+            self._stored["yrange"] = args[0]
         # TODO: Parse kwargs
         if self.axes is not None:
             return self.axes.set_ylim(*args, **kwargs)
@@ -543,9 +914,9 @@ class AxesBuilder:
 
     def set_xlim(self, *args, **kwargs):
         if len(args) == 2:
-            self.data["xrange"] = args
+            self._stored["xrange"] = args
         elif len(args) == 1:
-            self.data["xrange"] = args[0]
+            self._stored["xrange"] = args[0]
         # TODO: Parse kwargs
         if self.axes is not None:
             return self.axes.set_xlim(*args, **kwargs)
@@ -573,8 +944,8 @@ class AxesBuilder:
 
     def _colorplot(self, *args, **kwargs):
         if len(args) in [1, 2]:  # 2nd argument might be in the signature of contour/contourf
-            self.data["type"] = "colorplot"
-            self.data["z"] = _ensure_normal_type(args[0])[0]
+            self._stored["type"] = "colorplot"
+            self._stored["z"] = _store(args[0])
         elif len(args) in [3, 4]:  # 4th argument might be in the signature of contour/contourf
             x, y, z = args[0:3]
             # Dimensions of X,Y in pcolor/pcolormesh might be those of Z + 1 (in fact, they should)
@@ -585,21 +956,21 @@ class AxesBuilder:
             if len(y) == len(z) + 1:
                 y = [(a + b) / 2 for a, b in zip(y[1:], y[:-1])]
 
-            self.data["type"] = "colorplot"
-            self.data["x"] = _ensure_normal_type(x)[0]
-            self.data["y"] = _ensure_normal_type(y)[0]
-            self.data["z"] = _ensure_normal_type(z)[0]
+            self._stored["type"] = "colorplot"
+            self._stored["x"] = _store(x)
+            self._stored["y"] = _store(y)
+            self._stored["z"] = _store(z)
         else:
             raise ValueError("Bad argument number")
         if "norm" in kwargs and plt is not None:
             # Check if logarithmic
             if isinstance(kwargs["norm"], LogNorm):
-                self.data["zlog"] = True
+                self._stored["zlog"] = True
 
     def text(self, x, y, s, **kwargs):
-        if "epilog" not in self.data:
-            self.data["epilog"] = []
-        self.data["epilog"].append({"type": "text", "x": x, "y": y, "text": s})
+        if "epilog" not in self._stored:
+            self._stored["epilog"] = []
+        self._stored["epilog"].append({"type": "text", "x": x, "y": y, "text": s})
         if self.axes is not None:
             return self.axes.text(x, y, s, **kwargs)
 
@@ -607,7 +978,7 @@ class AxesBuilder:
         if self.axes is not None:
             new_axis = AxesBuilder(self.axes.twinx())
         else:
-            new_axis = AxesBuilder
+            new_axis = AxesBuilder()
 
         self.twins_x.append(new_axis)
         return new_axis
@@ -616,20 +987,54 @@ class AxesBuilder:
         if self.axes is not None:
             new_axis = AxesBuilder(self.axes.twiny())
         else:
-            new_axis = AxesBuilder
+            new_axis = AxesBuilder()
 
         self.twins_y.append(new_axis)
         return new_axis
 
-    def get_data(self):
-        data2 = deepcopy(self.data)
-        if "series" not in data2:
-            data2["series"] = []
+    def get_data(self, external=None):
+        """Get the data describing the axes, including the series of its twins. See `Builder.get_data`."""
+        if external is None:
+            memoized = self._get_memoized()
+            if memoized is not None:
+                return memoized
+        state = self._modification_state()
+        data2 = self._get_header(external=external)
+        data2["series"] = self._normal_series_list()
+        return self._memoize(state, data2) if external is None else data2
+
+    def _normal_series_list(self):
+        """Get the series of the axes and its twins converted to regular python, in the order of get_data"""
+        series_list = self._normal_sources([(series, None) for series in self._data.get("series", [])])
+        for twins, key in [(self.twins_x, "yadded"), (self.twins_y, "xadded")]:
+            for a in twins:
+                series_list += [dict(series, **{key: 1}) for series in a._normal_series_list()]
+        return series_list
+
+    def _series_sources(self):
+        """Get the stored series in the axes and its twins, in the order of get_data, with the values added to them"""
+        sources = [(series, None) for series in self._data.get("series", [])]
+        for twins, key in [(self.twins_x, "yadded"), (self.twins_y, "xadded")]:
+            for a in twins:
+                sources += [(series, dict(added or {}, **{key: 1})) for series, added in a._series_sources()]
+        return sources
+
+    def _modification_state(self):
+        """Get a value which changes whenever the data of the axes or its twins might have been modified"""
+        return (self._version, self._access_state(), tuple(a._modification_state() for a in self.twins_x),
+                tuple(a._modification_state() for a in self.twins_y))
+
+    def _data_access_state(self):
+        """Get a value which changes whenever the data of the axes or its twins might have been modified from outside"""
+        return (self._access_state(), tuple(a._data_access_state() for a in self.twins_x),
+                tuple(a._data_access_state() for a in self.twins_y))
+
+    def _get_header(self, external=None):
+        """Get the data describing the axes with no series, which are given by _series_sources"""
+        data2 = _normal_data({key: value for key, value in self._data.items() if key != "series"}, external=external)
+        data2["series"] = []
         for a in self.twins_x:
-            data_twin = a.get_data()
-            for s in data_twin["series"]:
-                data2["series"].append(deepcopy(s))
-                data2["series"][-1]["yadded"] = 1
+            data_twin = a._get_header()
             # The following code does not account for multiple axes addition
             if "yadded" not in data2:
                 data2["yadded"] = [{}]
@@ -641,10 +1046,7 @@ class AxesBuilder:
                 data2["yadded"][-1]["range"] = data_twin["yrange"]
 
         for a in self.twins_y:
-            data_twin = a.get_data()
-            for s in data_twin["series"]:
-                data2["series"].append(deepcopy(s))
-                data2["series"][-1]["xadded"] = 1
+            data_twin = a._get_header()
             # The following code does not account for multiple axes addition
             if "xadded" not in data2:
                 data2["xadded"] = [{}]
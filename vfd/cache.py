@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""On-disk cache of the files generated from VFD files"""
+import os
+import sys
+import json
+import hashlib
+import shutil
+import tempfile
+import filecmp
+
+from . import __version__
+
+
+def default_cache_path():
+    """
+    Get the default directory of the cache.
+
+    The VFD_CACHE_DIR environment variable can be used to choose it. Otherwise, the usual cache directory of the
+    platform is used.
+
+    Returns:
+        str: Path to the directory.
+
+    """
+    if os.environ.get("VFD_CACHE_DIR"):
+        return os.environ["VFD_CACHE_DIR"]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "vfd")
+
+
+class RenderCache(object):
+    """
+    A cache of the files generated from VFD files, with a size limit.
+
+    Each entry is identified by a key computed from the content of the VFD and the options used to generate the files,
+    and it stores a copy of them. When the size limit is exceeded, the least recently used entries are removed.
+
+    Note external files used in the generation (e.g., style files given by their path) are not part of the key.
+
+    Args:
+        path (str): Directory where the cache is stored. If None, `default_cache_path` is used.
+        max_size (int): Maximum size of the cache in bytes.
+
+    """
+
+    def __init__(self, path=None, max_size=512 * 2 ** 20):
+        self.path = path if path is not None else default_cache_path()
+        self.max_size = max_size
+
+    def key(self, content, options):
+        """
+        Get the key identifying some generated files.
+
+        Args:
+            content (bytes): Content of the VFD file.
+            options (dict): JSON-serializable options used to generate the files.
+
+        Returns:
+            str: The key.
+
+        """
+        h = hashlib.sha256()
+        h.update(content)
+        h.update(json.dumps([__version__, options], sort_keys=True, default=repr).encode("utf-8"))
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def restore(self, key, outputs):
+        """
+        Bring the generated files up to date from the cache, if they are available.
+
+        Files which are already identical to the cached ones are not written.
+
+        Args:
+            key (str): Key of the entry.
+            outputs (list of str): Paths of the generated files.
+
+        Returns:
+            bool: True if the files were found in the cache, False otherwise.
+
+        """
+        entry = self._entry(key)
+        cached = [os.path.join(entry, os.path.basename(output)) for output in outputs]
+        if not all(os.path.isfile(c) for c in cached):
+            return False
+        for c, output in zip(cached, outputs):
+            if not (os.path.isfile(output) and filecmp.cmp(c, output, shallow=False)):
+                shutil.copyfile(c, output)
+        # Mark as recently used
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, outputs):
+        """
+        Add generated files to the cache, removing the least recently used entries if needed.
+
+        Args:
+            key (str): Key of the entry.
+            outputs (list of str): Paths of the generated files.
+
+        """
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # Might have been created by other process
+                if not os.path.isdir(self.path):
+                    raise
+        # Fill a temporary directory first, so other processes never see incomplete entries
+        temp_entry = tempfile.mkdtemp(prefix=".tmp-", dir=self.path)
+        try:
+            for output in outputs:
+                shutil.copyfile(output, os.path.join(temp_entry, os.path.basename(output)))
+            os.rename(temp_entry, self._entry(key))
+        except OSError:
+            # Entry already stored by other process
+            shutil.rmtree(temp_entry, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries until the size limit is met"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+            except OSError:
+                # Removed by other process
+                continue
+            total += size
+        entries.sort()
+        while total > self.max_size and entries:
+            _, size, entry = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove all the entries in the cache"""
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
@@ -2,9 +2,9 @@
 
 """Console script for vfd."""
 import sys
+import logging
 import click
 
-from . import vfd
 from . import __version__
 
 
@@ -17,12 +17,38 @@ from . import __version__
                    'among them). Styles further to the right overwrite values defined by styles to their left.')
 @click.option('--tight', is_flag=True, help='Use tight_layout')
 @click.option('--scalemulti', is_flag=True, help='Automatic scale of multiplots')
+@click.option('--max-points', type=int, default=None,
+              help='Reduce the lines with more points to about this number, keeping their shape when it is at least '
+                   'four times the width of the plot in pixels')
+@click.option('--script/--no-script', default=True, help='Whether to write the matplotlib scripts')
+@click.option('--data', type=click.Choice(['npz', 'json']), default=None,
+              help='Save the data of the scripts in a file with this format instead of writing it in the scripts')
+@click.option('--jobs', "-j", type=click.IntRange(1), default=None,
+              help='Number of processes used to handle the files. If given, files which can not be processed are '
+                   'reported at the end instead of stopping the execution.')
+@click.option('--cache/--no-cache', default=True,
+              help='Whether to reuse the exported plots of files whose content and options did not change')
+@click.option('--watch', "-w", default=None, metavar='DIR',
+              help='Keep processing the VFD files in this directory as they are created or modified, until '
+                   'interrupted')
+@click.option('--profile', default=None, metavar='FILE',
+              help='Append the time spent in each stage of the processing of each file to this JSON Lines file')
+@click.option('--profile-stats', type=float, default=None, metavar='SECONDS',
+              help='With --profile, dump the cProfile stats of the files taking at least these seconds next to the '
+                   'profile file')
 @click.option('--version', is_flag=True, help='Display version and exit')
-def main(file, format, style, tight, scalemulti, version):
+def main(file, format, style, tight, scalemulti, max_points, script, data, jobs, cache, watch, profile, profile_stats,
+         version):
     """Command line interface for Vernacular Figure Description."""
+    logging.basicConfig(level=logging.INFO)
     if version:
         click.echo("vfd " + __version__)
         exit(0)
+    # Imported here to display the version and the help faster
+    from . import vfd
+    from .cache import RenderCache
+    from .profiling import Profiler
+
     # NOTE: Styles with a comma in their names (!) won't be processed properly.
     # If we wanted to support this, a escape procedure should be defined.
     if style is not None and "," in style:
@@ -37,16 +63,44 @@ def main(file, format, style, tight, scalemulti, version):
         xlsx = True
         format = None
 
-    if file:
+    if profile:
+        profile = Profiler(profile, stats_threshold=profile_stats)
+    elif profile_stats is not None:
+        raise click.UsageError("--profile-stats requires --profile")
+
+    if watch:
+        if file:
+            raise click.UsageError("Files can not be given when watching a directory")
+        if not format and not xlsx:
+            raise click.UsageError("An export format is needed to watch a directory")
+        click.echo("Watching %s (press Ctrl+C to stop)" % watch)
+        try:
+            vfd.watch(watch, scripts=bool(format), xlsx=xlsx, export_format=format, context=style,
+                      tight_layout=tight, scale_multiplot=scalemulti, max_points=max_points, write_script=script,
+                      data_format=data, cache=RenderCache() if cache else None, profile=profile)
+        except KeyboardInterrupt:
+            pass
+    elif file:
+        if jobs is not None and not format and not xlsx:
+            raise click.UsageError("An export format is needed to process the files in parallel")
+        cache = RenderCache() if cache else None
+        errors = {}
         for f in file:
             if xlsx:
-                vfd.create_xlsx(path=f)
+                errors.update(vfd.create_xlsx(path=f, workers=jobs, profile=profile) or {})
                 if format:
-                    vfd.create_scripts(path=f, export_format=format, context=style, run=True, tight_layout=tight,
-                                       scale_multiplot=scalemulti)
+                    errors.update(vfd.create_scripts(path=f, export_format=format, context=style, run=True,
+                                                     tight_layout=tight, scale_multiplot=scalemulti,
+                                                     max_points=max_points, write_script=script, data_format=data,
+                                                     workers=jobs, cache=cache, profile=profile) or {})
             else:
-                vfd.create_scripts(path=f, export_format=format, context=style, run=True, tight_layout=tight,
-                                   scale_multiplot=scalemulti)
+                errors.update(vfd.create_scripts(path=f, export_format=format, context=style, run=True,
+                                                 tight_layout=tight, scale_multiplot=scalemulti,
+                                                 max_points=max_points, write_script=script, data_format=data,
+                                                 workers=jobs, cache=cache, profile=profile) or {})
+        if errors:
+            # Errors were already logged
+            raise click.ClickException("%d file(s) could not be processed" % len(errors))
     else:
         _print_help_msg(main)
     return 0
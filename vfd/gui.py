@@ -6,11 +6,10 @@ from __future__ import division
 
 import sys
 import os
-import tempfile
 import io
 import traceback
+import threading
 
-import shutil
 from PIL import Image, ImageTk
 
 try:
@@ -23,6 +22,11 @@ except ImportError:
     import tkFileDialog as tkfiledialog
     import tkMessageBox as tkmessagebox
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 try:
     import matplotlib.pyplot as plt
 except ImportError:
@@ -30,6 +34,7 @@ except ImportError:
 
 from . import vfd
 from . import __version__
+from .incremental import IncrementalParser
 
 _ico_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "img")
 
@@ -222,6 +227,99 @@ class TraceDialog(tk.Frame, object):
         self.top.destroy()
 
 
+def _render_preview(parser, text, **kwargs):
+    """Render the preview of the text of a VFD parsed with an IncrementalParser, returning the content of a png file"""
+    return vfd.render_image(parser.parse(text), "png", **kwargs)
+
+
+class PreviewRenderer(object):
+    """
+    Render previews in a background thread, so the user interface is not blocked.
+
+    Only the latest request is rendered: a request not yet started is replaced by a newer one, and the result of a
+    render which was running when a newer one was requested is discarded. Results are collected with `poll`, which must
+    be called from the thread of the user interface.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.request = None
+        # Identifier of the latest request, so outdated results can be discarded
+        self.generation = 0
+        # Identifier of the request being rendered, if any
+        self.running = None
+        self.results = queue.Queue()
+        # Held while rendering. Renders in other threads must hold it too, since matplotlib is not thread-safe
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Request a render, cancelling the previous one.
+
+        Args:
+            function (callable): The function to call in the background.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            int: An identifier of the request.
+        """
+        with self.condition:
+            self.generation += 1
+            self.request = (self.generation, function, args, kwargs)
+            self.condition.notify()
+            return self.generation
+
+    def cancel(self):
+        """Cancel the pending and running requests"""
+        with self.condition:
+            self.generation += 1
+            self.request = None
+
+    def busy(self):
+        """Check if the latest request has not finished yet"""
+        with self.condition:
+            return self.request is not None or self.running == self.generation
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.request is None:
+                    self.condition.wait()
+                generation, function, args, kwargs = self.request
+                self.request = None
+                self.running = generation
+            try:
+                with self.lock:
+                    result, error = function(*args, **kwargs), None
+            except Exception:
+                result, error = None, sys.exc_info()
+            with self.condition:
+                self.running = None
+                if generation == self.generation:
+                    self.results.put((generation, result, error))
+
+    def poll(self):
+        """
+        Get the result of the latest request, if available.
+
+        Returns:
+            tuple: A tuple (result, exc_info), where exc_info is None unless the function raised an exception, or None
+                   if there is no new result.
+        """
+        while True:
+            try:
+                generation, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            # Results obtained before a newer request was made are discarded
+            if generation == self.generation:
+                return result, error
+
+
 class VfdGui(tk.Frame, object):
 
     def __init__(self, master=None):
@@ -325,11 +423,28 @@ class VfdGui(tk.Frame, object):
         self.chk_scale_multi_tt = CreateToolTip(self.chk_scale_multi, "Proportionally scale multiplots?")
         self.chk_scale_multi.pack(side=tk.LEFT)
 
+        self.var_max_points = tk.StringVar()
+        self.var_max_points.set("")
+        self.mpl_max_points = ParBox(self.mpl_toolbar, self.var_max_points, pre_text="Max points",
+                                     help_text="If given, lines with more points are reduced to about this number of "
+                                               "points, keeping their shape.")
+        self.mpl_max_points.txt.config(width=8)
+        self.mpl_max_points.pack(side=tk.LEFT)
+
         self.img_refresh = ImageTk.PhotoImage(file=get_ico_path("go-jump.png"))
         self.btn_refresh = tk.Button(self.mpl_toolbar, image=self.img_refresh, relief=tk.FLAT, command=self.refresh)
         self.btn_refresh_tt = CreateToolTip(self.btn_refresh, "Refresh preview")
         self.btn_refresh.pack(side=tk.RIGHT)
 
+        self.var_auto_refresh = tk.IntVar()
+        self.var_auto_refresh.set(0)
+        self.chk_auto_refresh = tk.Checkbutton(self.mpl_toolbar, text="Auto", variable=self.var_auto_refresh)
+        self.chk_auto_refresh_tt = CreateToolTip(self.chk_auto_refresh, "Refresh the preview while editing?")
+        self.chk_auto_refresh.pack(side=tk.RIGHT)
+
+        self.lbl_status = tk.Label(self.mpl_toolbar, text="")
+        self.lbl_status.pack(side=tk.RIGHT)
+
         self.img_img = ImageTk.PhotoImage(file=get_ico_path("image-x-generic.png"))
         self.btn_img_export = tk.Button(self.mpl_toolbar, image=self.img_img, relief=tk.FLAT,
                                         command=self.mpl_export_choose)
@@ -363,10 +478,21 @@ class VfdGui(tk.Frame, object):
         # Preview image
         self.image = None
 
-        # Create a temporary directory
-        self.temp_dir = tempfile.mkdtemp()
-
-        self.temp_vfd = os.path.join(self.temp_dir, "vfdgui.vfd")
+        # Plots are rendered in memory, never shown in their own windows
+        if plt is not None:
+            plt.switch_backend("agg")
+        # The text is parsed reusing the work done for its previous version
+        self.parser = IncrementalParser(validate="fast")
+        self.txt_editor.tag_configure("error", background="#ffc0c0")
+        # Previews are rendered in background
+        self.renderer = PreviewRenderer()
+        # Whether the errors of the render being done are shown in a dialog
+        self.show_render_errors = True
+        # Time (ms) to wait after the last key press before an automatic refresh
+        self.auto_refresh_delay = 500
+        self.auto_refresh_id = None
+        self.poll_id = None
+        self.txt_editor.bind('<KeyRelease>', self.schedule_auto_refresh)
 
         self.master.protocol("WM_DELETE_WINDOW", self.leave)
 
@@ -389,7 +515,7 @@ class VfdGui(tk.Frame, object):
 
     def reformat(self):
         """Fix the json format"""
-        data = vfd.str_to_python(self.txt_editor.get(1.0, tk.END))
+        data = self.get_description()
         formatted = vfd.python_to_json(data, compact=False, compact_arrays=True)
         self.txt_editor.delete(1.0, tk.END)
         self.txt_editor.insert(tk.END, formatted)
@@ -407,16 +533,21 @@ class VfdGui(tk.Frame, object):
         """Show a dialog to choose which VFD to open"""
         if self.confirm_close_modified():
             return
-        file = tkfiledialog.askopenfile(parent=self, mode='r', filetypes=(("VFD file", "*.vfd"), ("all files", "*.*")),
-                                        title='Open a VFD')
+        file = tkfiledialog.askopenfilename(parent=self, filetypes=(("VFD file", "*.vfd *.vfd.gz *.vfd.zst *.vfds"),
+                                                                    ("all files", "*.*")),
+                                            title='Open a VFD')
         if file:
-            self.open(file.name)
+            self.open(file)
 
     def open(self, path):
         """Open the VFD in the given path"""
-        self.file_path = path
-        with io.open(path, 'r', encoding='utf8') as file:
+        with vfd.open_vfd(path) as file:
             text = file.read()
+        stem, extension = vfd.split_vfd_extension(path)
+        if extension == vfd.stream_extension:
+            # Streams are edited as the VFD they are consolidated into, which is saved apart from them
+            path = stem + ".vfd"
+        self.file_path = path
 
         self.txt_editor.delete(1.0, tk.END)
         self.txt_editor.insert(tk.END, text)
@@ -441,20 +572,74 @@ class VfdGui(tk.Frame, object):
         # If said no
         return False
 
-    def update_temp_file(self):
-        """Update the vfd in temp dir"""
-        self.save(self.temp_vfd)
+    def get_description(self):
+        """Get the description of the VFD in the editor"""
+        return self.parser.parse(self.txt_editor.get(1.0, tk.END))
 
-    def refresh(self):
-        """Recreate the image and update the preview"""
-        self.mpl_create_img("png")
-        self.update_preview()
+    def refresh(self, show_errors=True):
+        """
+        Start recreating the image in background, updating the preview when finished.
+
+        Args:
+            show_errors (bool): Whether to show the errors in a dialog. Otherwise, they are only summarized in the
+                                status label.
+        """
+        self.show_render_errors = show_errors
+        self.renderer.submit(_render_preview, self.parser, self.txt_editor.get(1.0, tk.END),
+                             path=self.get_data_path(), **self.get_mpl_parameters())
+        self.lbl_status.configure(text="Rendering...")
+        self.preview.configure(cursor="watch")
+        if self.poll_id is None:
+            self.poll_id = self.after(20, self.poll_preview)
+
+    def poll_preview(self):
+        """Check if the render has finished, updating the preview if so"""
+        self.poll_id = None
+        # Check if busy first, so a result obtained in the meanwhile is not missed
+        busy = self.renderer.busy()
+        result = self.renderer.poll()
+        if result is None:
+            if busy:
+                self.poll_id = self.after(20, self.poll_preview)
+            return
+        self.preview.configure(cursor="")
+        image, error = result
+        self.txt_editor.tag_remove("error", 1.0, tk.END)
+        if error is None:
+            self.lbl_status.configure(text="")
+            self.update_preview(image)
+        else:
+            line = self.parser.error_line(error[1])
+            message = getattr(error[1], "message", None) or getattr(error[1], "msg", error[1])
+            if line is not None:
+                self.txt_editor.tag_add("error", "%d.0" % line, "%d.0" % (line + 1))
+                self.txt_editor.see("%d.0" % line)
+                self.lbl_status.configure(text="Error in line %d: %s" % (line, message))
+            else:
+                self.lbl_status.configure(text="Error: %s" % message)
+            if self.show_render_errors:
+                self.report_callback_exception(*error)
+        if self.renderer.busy():
+            # A newer request is on its way
+            self.poll_id = self.after(20, self.poll_preview)
+
+    def schedule_auto_refresh(self, event=None):
+        """Refresh the preview when the user stops typing, if the automatic refresh was chosen"""
+        if self.auto_refresh_id is not None:
+            self.after_cancel(self.auto_refresh_id)
+            self.auto_refresh_id = None
+        if self.var_auto_refresh.get():
+            self.auto_refresh_id = self.after(self.auto_refresh_delay, self.auto_refresh)
+
+    def auto_refresh(self):
+        self.auto_refresh_id = None
+        self.refresh(show_errors=False)
 
     def mpl_export_choose(self):
         """Show a dialog to choose where to export a mpl-generated plot"""
         initialdir, initialfile = os.path.split(self.file_path) if self.file_path else (None, None)
         if initialfile:
-            initialfile = os.path.splitext(initialfile)[0] + ".png"
+            initialfile = vfd.split_vfd_extension(initialfile)[0] + ".png"
         file = tkfiledialog.asksaveasfilename(parent=self, filetypes=(
             ("Portable Network Graphics", "*.png"), ("Portable Document Format", "*.pdf"), ("PostScript", "*.ps"),
             ("Encapsulated PostScript", "*.eps"), ("Scalable Vector Graphics", "*.svg"), ("JPEG", "*.jpg"),
@@ -470,8 +655,13 @@ class VfdGui(tk.Frame, object):
         if "." not in file_name:
             raise ValueError("No extension in path %s" % path)
         ext = file_name.split(".")[-1]
-        self.mpl_create_img(ext)
-        shutil.copyfile(os.path.join(self.temp_dir, "vfdgui." + ext), path)
+        image = self.mpl_create_img(ext)
+        with open(path, "wb") as file:
+            file.write(image)
+
+    def get_data_path(self):
+        """Get the directory where the relative paths of external data files in the VFD start"""
+        return os.path.dirname(os.path.abspath(self.file_path)) if self.file_path else None
 
     def get_mpl_parameters(self):
         style = self.var_style.get()
@@ -479,13 +669,15 @@ class VfdGui(tk.Frame, object):
             style = list(filter(None, (s.strip() for s in style.split(","))))
         tight = bool(self.var_tight.get())
         scale_multi = bool(self.var_tight.get())
-        return {"context": style, "tight_layout": tight, "scale_multiplot": scale_multi}
+        max_points = self.var_max_points.get().strip()
+        max_points = int(max_points) if max_points else None
+        return {"context": style, "tight_layout": tight, "scale_multiplot": scale_multi, "max_points": max_points}
 
     def mpl_python_choose(self):
         """Show a dialog to choose where to export a mpl-generating python script"""
         initialdir, initialfile = os.path.split(self.file_path) if self.file_path else (None, None)
         if initialfile:
-            initialfile = os.path.splitext(initialfile)[0] + ".py"
+            initialfile = vfd.split_vfd_extension(initialfile)[0] + ".py"
         file = tkfiledialog.asksaveasfilename(parent=self, filetypes=(("Python script", "*.py"),),
                                               title='Export matplotlib script', initialfile=initialfile,
                                               initialdir=initialdir)
@@ -497,17 +689,26 @@ class VfdGui(tk.Frame, object):
 
     def mpl_python(self, path):
         """Export using mpl to the given path"""
-        vfd.create_scripts(self.temp_vfd, run=False, **self.get_mpl_parameters())
-        shutil.copyfile(os.path.join(self.temp_dir, "vfdgui.py"), path)
+        description = vfd._skip_multiplot_container(self.get_description())
+        code = vfd.create_matplotlib_script(description, export_name=os.path.basename(path)[:-3],
+                                            **self.get_mpl_parameters())
+        with io.open(path, 'w', encoding='utf8') as file:
+            file.write(code)
 
     def mpl_create_img(self, format):
-        """Use the temp dir to create an image with the given format"""
-        self.update_temp_file()
-        vfd.create_scripts(self.temp_vfd, run=True, blocking=True, export_format=[format], **self.get_mpl_parameters())
+        """
+        Create an image with the given format in memory.
 
-    def update_preview(self):
-        """Update the preview image using the one in the temp dir"""
-        image = Image.open(os.path.join(self.temp_dir, "vfdgui.png"))
+        Returns:
+            bytes: The content of the image file.
+        """
+        with self.renderer.lock:
+            return vfd.render_image(self.get_description(), format, path=self.get_data_path(),
+                                    **self.get_mpl_parameters())
+
+    def update_preview(self, data):
+        """Update the preview image with the content of a png file"""
+        image = Image.open(io.BytesIO(data))
         # Image will be reduced if it's bigger than the available space
         self.master.update()  # Ensure measure is updated
         max_width = self.preview.winfo_width()
@@ -531,12 +732,15 @@ class VfdGui(tk.Frame, object):
         """
         # TODO: Check if well formed
         initialdir, initialfile = os.path.split(self.file_path) if self.file_path else (None, None)
-        file = tkfiledialog.asksaveasfilename(parent=self, filetypes=(("Vernacular Figure Description", "*.vfd"),),
+        file = tkfiledialog.asksaveasfilename(parent=self, filetypes=(("Vernacular Figure Description", "*.vfd"),
+                                                                      ("Compressed VFD", "*.vfd.gz *.vfd.zst")),
                                               title='Save VFD', initialfile=initialfile, initialdir=initialdir)
         if file:
             # If an extension was not added to the filename (I see this in Windows)
-            if file[-4:] != ".vfd":
+            if not file.endswith(vfd.vfd_extensions):
                 file += ".vfd"
+            elif file.endswith(vfd.stream_extension):
+                file = vfd.split_vfd_extension(file)[0] + ".vfd"
             self.save(file)
             return True
         else:  # Cancelled
@@ -544,7 +748,7 @@ class VfdGui(tk.Frame, object):
 
     def save(self, path):
         """Save the edited VFD to the given path"""
-        with io.open(path, 'w', encoding='utf8') as file:
+        with vfd.write_vfd_atomic(path) as file:
             file.write(self.txt_editor.get(1.0, tk.END))
         self.txt_editor.edit_modified(False)
 
@@ -552,7 +756,7 @@ class VfdGui(tk.Frame, object):
         """Show a dialog to choose where to export in xlsx format"""
         initialdir, initialfile = os.path.split(self.file_path) if self.file_path else (None, None)
         if initialfile:
-            initialfile = os.path.splitext(initialfile)[0] + ".xlsx"
+            initialfile = vfd.split_vfd_extension(initialfile)[0] + ".xlsx"
         file = tkfiledialog.asksaveasfilename(parent=self, filetypes=(("Spreadsheet", "*.xlsx"),),
                                               title='Export as xlsx', initialfile=initialfile, initialdir=initialdir)
         if file:
@@ -563,9 +767,8 @@ class VfdGui(tk.Frame, object):
 
     def export_xlsx(self, path):
         """Export as xlsx to the given path"""
-        self.update_temp_file()
-        vfd.create_xlsx(self.temp_vfd)
-        shutil.move(self.temp_vfd[:-3] + "xlsx", path)
+        vfd.export_xlsx(vfd._skip_multiplot_container(self.get_description()), file_path=path,
+                        path=self.get_data_path())
 
     def leave(self):
         """Exit the application"""
@@ -574,8 +777,7 @@ class VfdGui(tk.Frame, object):
         for d in [self.trace_dialog, self.style_dialog]:
             if d is not None:
                 d.exit()
-        # Delete the temp folder unless running from pyinstaller
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.renderer.cancel()
         self.quit()
 
 
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+"""Incremental parsing and validation of a VFD being edited"""
+import json
+import re
+import threading
+
+from . import vfd
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+_decoder = json.JSONDecoder()
+
+# Size of the blocks compared when looking for the edited region
+_block_size = 4096
+
+
+class _Node(object):
+    """A value in the text, with its position and the nodes of its items if it is a container"""
+
+    __slots__ = ["start", "end", "value", "children"]
+
+    def __init__(self, start, end, value, children=None):
+        self.start = start
+        self.end = end
+        self.value = value
+        # Mapping from keys or indexes to nodes. None for values parsed at once.
+        self.children = children
+
+    def shifted(self, delta):
+        """Get a copy of the node moved in the text, sharing the parsed value"""
+        if delta == 0:
+            return self
+        if isinstance(self.children, dict):
+            children = {key: child.shifted(delta) for key, child in self.children.items()}
+        elif self.children is not None:
+            children = [child.shifted(delta) for child in self.children]
+        else:
+            children = None
+        return _Node(self.start + delta, self.end + delta, self.value, children)
+
+
+def _common_prefix(a, b):
+    """Get the length of the common prefix of two strings"""
+    n = min(len(a), len(b))
+    i = 0
+    # Compare by blocks, which is done in C, then find the difference in the block
+    while i < n and a[i:i + _block_size] == b[i:i + _block_size]:
+        i += _block_size
+    while i < n and a[i] == b[i]:
+        i += 1
+    return min(i, n)
+
+
+def _common_suffix(a, b, limit):
+    """Get the length of the common suffix of two strings, which does not exceed a limit"""
+    n = min(len(a), len(b), limit)
+    i = 0
+    while i + _block_size <= n and \
+            a[len(a) - i - _block_size:len(a) - i] == b[len(b) - i - _block_size:len(b) - i]:
+        i += _block_size
+    while i < n and a[len(a) - i - 1] == b[len(b) - i - 1]:
+        i += 1
+    return i
+
+
+def _skip_whitespace(text, pos):
+    return _whitespace.match(text, pos).end()
+
+
+class _Parser(object):
+    """Parse a text, reusing the nodes of the previous version of the text out of the edited region"""
+
+    def __init__(self, text, old_nodes=None, prefix=0, suffix_start=None, delta=0):
+        self.text = text
+        # Nodes of the previous text by their starting position
+        self.old_nodes = old_nodes or {}
+        # Edited region: [prefix, suffix_start) in the old text
+        self.prefix = prefix
+        self.suffix_start = suffix_start
+        self.delta = delta
+
+    def _reusable(self, pos):
+        """Get a node of the previous text which can be reused at a position of the new text, if any"""
+        node = self.old_nodes.get(pos)
+        # A value just before the edited region might have been extended (e.g., a number)
+        if node is not None and node.end < self.prefix:
+            return node
+        if self.suffix_start is not None and pos - self.delta >= self.suffix_start:
+            node = self.old_nodes.get(pos - self.delta)
+            if node is not None:
+                return node.shifted(self.delta)
+        return None
+
+    def parse(self, pos=0):
+        """Parse the value starting at the given position"""
+        pos = _skip_whitespace(self.text, pos)
+        node = self._reusable(pos)
+        if node is not None:
+            return node
+        char = self.text[pos:pos + 1]
+        if char == "{":
+            return self._parse_object(pos)
+        if char == "[":
+            # Arrays of plain values (e.g., numbers) are parsed at once
+            inner = _skip_whitespace(self.text, pos + 1)
+            if self.text[inner:inner + 1] in ("{", "["):
+                return self._parse_array(pos)
+        value, end = _decoder.raw_decode(self.text, pos)
+        return _Node(pos, end, value)
+
+    def _expect(self, pos, chars):
+        pos = _skip_whitespace(self.text, pos)
+        if self.text[pos:pos + 1] not in chars:
+            raise json.JSONDecodeError("Expecting one of %s" % repr(chars), self.text, pos)
+        return self.text[pos], pos + 1
+
+    def _parse_object(self, start):
+        value = {}
+        children = {}
+        pos = _skip_whitespace(self.text, start + 1)
+        if self.text[pos:pos + 1] == "}":
+            return _Node(start, pos + 1, value, children)
+        while True:
+            pos = _skip_whitespace(self.text, pos)
+            if self.text[pos:pos + 1] != '"':
+                raise json.JSONDecodeError("Expecting property name enclosed in double quotes", self.text, pos)
+            key, pos = _decoder.raw_decode(self.text, pos)
+            _, pos = self._expect(pos, ":")
+            node = self.parse(pos)
+            value[key] = node.value
+            children[key] = node
+            char, pos = self._expect(node.end, ",}")
+            if char == "}":
+                return _Node(start, pos, value, children)
+
+    def _parse_array(self, start):
+        value = []
+        children = []
+        pos = start + 1
+        while True:
+            node = self.parse(pos)
+            value.append(node.value)
+            children.append(node)
+            char, pos = self._expect(node.end, ",]")
+            if char == "]":
+                return _Node(start, pos, value, children)
+
+
+def _index_nodes(node, index):
+    """Add a node and its descendants to a mapping from starting positions to nodes"""
+    index[node.start] = node
+    if node.children is not None:
+        for child in (node.children.values() if isinstance(node.children, dict) else node.children):
+            _index_nodes(child, index)
+    return index
+
+
+def _validation_copy(data, schema, validated, arrays):
+    """
+    Get a copy of the data where the arrays of numbers already validated are replaced by short stand-ins.
+
+    Args:
+        data: The data.
+        schema (dict): The schema of the data.
+        validated (dict): Mapping from the ids of the validated arrays and of their schemas to the arrays.
+        arrays (list): List where all the arrays of numbers found are appended, with their schemas.
+
+    Returns:
+        A copy of the data.
+
+    """
+    if "anyOf" in schema:
+        # Use the alternative matching the type of the data
+        for subschema in schema["anyOf"]:
+            if ("items" in subschema and isinstance(data, list)) or \
+                    ("properties" in subschema and isinstance(data, dict)):
+                return _validation_copy(data, subschema, validated, arrays)
+        return data
+    if "properties" in schema and isinstance(data, dict):
+        return {key: _validation_copy(value, schema["properties"][key], validated, arrays)
+                if key in schema["properties"] else value for key, value in data.items()}
+    if "items" in schema and isinstance(data, list):
+        if schema["items"] == {"type": "number"}:
+            arrays.append((schema, data))
+            # Arrays are only replaced where the same schema validated them, so the stand-in keeps the validity
+            # regarding the length limits in it
+            return data[:max(schema.get("minItems", 0), 1)] if (id(schema), id(data)) in validated else data
+        elif isinstance(schema["items"], dict):
+            return [_validation_copy(value, schema["items"], validated, arrays) for value in data]
+    return data
+
+
+class IncrementalParser(object):
+    """
+    Parse and validate the successive versions of a VFD text, reusing the work done for the previous one.
+
+    Only the values in the edited region of the text are parsed again, and the arrays of numbers which were not edited
+    are not validated again.
+
+    Args:
+        validate (str or bool): Validation of the VFD. See `vfd.validate_vfd` for the available modes. If False, the
+                                VFD is not validated.
+
+    """
+
+    def __init__(self, validate="full"):
+        self.validate = validate
+        # Last text given
+        self.text = None
+        # Last text which was a well-formed JSON, with the parsed nodes
+        self.parsed_text = None
+        self.root = None
+        self.nodes = {}
+        # Python representation of the last well-formed text, with the binary encoded arrays decoded
+        self.value = None
+        # Arrays of numbers in the last valid VFD, by their id
+        self.validated = {}
+        # Error found in the last text
+        self.error = None
+        # Used from the GUI and from the rendering thread
+        self.lock = threading.Lock()
+
+    def parse(self, text):
+        """
+        Find a Python representation for the given data in a string, as `vfd.str_to_python` does.
+
+        Args:
+            text (str): A string defining the JSON object.
+
+        Returns:
+            dict: A python representation of the VFD.
+
+        Raises:
+            json.JSONDecodeError: If string does not define a JSON.
+            jsonschema.ValidationError: If string defines a JSON but not a well-built VFD.
+
+        """
+        with self.lock:
+            if text != self.text:
+                self._update(text)
+            if self.error is not None:
+                raise self.error
+            return self.value
+
+    def _update(self, text):
+        self.error = None
+        self.text = text
+        if self.root is None:
+            parser = _Parser(text)
+        else:
+            # Compare with the last text which could be parsed, since the intermediate ones are often broken
+            old = self.parsed_text
+            prefix = _common_prefix(old, text)
+            suffix = _common_suffix(old, text, min(len(old), len(text)) - prefix)
+            parser = _Parser(text, self.nodes, prefix, len(old) - suffix, len(text) - len(old))
+        try:
+            root = parser.parse()
+            end = _skip_whitespace(text, root.end)
+            if end != len(text):
+                raise json.JSONDecodeError("Extra data", text, end)
+        except ValueError as e:
+            self.error = e
+            return
+        self.parsed_text = text
+        self.root = root
+        self.nodes = _index_nodes(root, {})
+        try:
+            self.value = vfd._decode_arrays(root.value)
+        except (ValueError, TypeError, KeyError) as e:
+            self.error = e
+            return
+        if self.validate:
+            self._validate(self.value)
+
+    def _validate(self, data):
+        arrays = []
+        if isinstance(data, dict) and data.get("type") in vfd._schemas:
+            data = _validation_copy(data, vfd._schemas[data["type"]], self.validated, arrays)
+        try:
+            vfd.validate_vfd(data, mode=self.validate)
+        except Exception as e:
+            self.error = e
+            return
+        self.validated = {(id(schema), id(array)): array for schema, array in arrays}
+
+    def line_of(self, path):
+        """
+        Get the line of the last text where the value in the given path is found.
+
+        Args:
+            path (list): Keys and indexes leading to the value, as in the path of a jsonschema.ValidationError.
+
+        Returns:
+            int: The line number, starting at 1, of the deepest value in the path which was found.
+
+        """
+        with self.lock:
+            node = self.root
+            if node is None:
+                return None
+            pos = node.start
+            for key in path:
+                if node.children is None:
+                    if isinstance(node.value, list) and isinstance(key, int) and key < len(node.value):
+                        pos = self._item_position(node, key)
+                    break
+                try:
+                    node = node.children[key]
+                except (KeyError, IndexError, TypeError):
+                    break
+                pos = node.start
+            return self.parsed_text.count("\n", 0, pos) + 1
+
+    def _item_position(self, node, index):
+        """Get the position of an item of an array parsed at once"""
+        text = self.parsed_text
+        pos = _skip_whitespace(text, node.start + 1)
+        for _ in range(index):
+            _, pos = _decoder.raw_decode(text, pos)
+            # Skip the comma
+            pos = _skip_whitespace(text, _skip_whitespace(text, pos) + 1)
+        return pos
+
+    def error_line(self, error):
+        """
+        Get the line of the last text where an error was found.
+
+        Args:
+            error (Exception): An exception raised by `parse`.
+
+        Returns:
+            int: The line number, starting at 1, or None if it could not be found.
+
+        """
+        if hasattr(error, "lineno"):
+            # json.JSONDecodeError
+            return error.lineno
+        if hasattr(error, "absolute_path"):
+            # jsonschema.ValidationError
+            return self.line_of(list(error.absolute_path))
+        return None
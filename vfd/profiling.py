@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""Timing of the stages of the processing of VFD files"""
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+
+# Clock used to measure the wall time (perf_counter is not available in Python 2)
+timer = getattr(time, "perf_counter", time.time)
+
+
+class Profiler(object):
+    """
+    Collect the time spent in each stage of the processing of the VFD files, appending a JSON line for each file.
+
+    Each line is a JSON object with the following keys:
+
+    - file: Path to the VFD file.
+    - task: The function processing it ("create_scripts" or "create_xlsx").
+    - stages: Mapping from the stages (e.g., "parse", "validate", "codegen", "plot", "savefig") to their wall time
+      in seconds.
+    - total: Total wall time in seconds.
+    - input_bytes: Size of the VFD file.
+    - points: Number of values in the plotted arrays (points of the series and cells of the colorplots).
+    - output_bytes: Total size of the files written.
+    - cached: Whether the outputs were taken from the render cache.
+    - error: Description of the error, if the file could not be processed.
+
+    Lines are written as soon as each file is processed, even from parallel processes, so the report of an
+    interrupted batch is still useful.
+
+    Args:
+        path (str): Path to the JSON Lines file. Lines are appended to it if it already exists.
+        stats_threshold (float): If given, files taking at least this time in seconds are profiled with cProfile,
+                                 dumping the stats next to the JSON Lines file (see `stats_path`). Note profiling
+                                 adds an overhead to every file.
+
+    """
+
+    def __init__(self, path, stats_threshold=None):
+        self.path = path
+        self.stats_threshold = stats_threshold
+
+    def stats_path(self, file):
+        """Get the path where the cProfile stats of a file are dumped, which can be read with the pstats module"""
+        name = os.path.normpath(file).replace(os.sep, "_").replace(":", "_").lstrip("._")
+        return "%s.%s.prof" % (os.path.splitext(self.path)[0], name)
+
+    def start(self, file, task):
+        """
+        Start the report of the processing of a file.
+
+        Args:
+            file (str): Path to the VFD file.
+            task (str): The function processing it.
+
+        Returns:
+            FileReport: The report, which is written when finished.
+
+        """
+        return FileReport(self, file, task)
+
+    def write(self, record):
+        """Append a record to the JSON Lines file"""
+        line = json.dumps(record, sort_keys=True) + "\n"
+        # A single write in append mode, so lines from parallel processes are not mixed
+        with open(self.path, "a") as f:
+            f.write(line)
+
+
+class FileReport(object):
+    """The times and sizes measured in the processing of a file. See `Profiler`."""
+
+    def __init__(self, profiler, file, task):
+        self.profiler = profiler
+        self.record = {"file": file, "task": task, "stages": {}, "input_bytes": None, "points": None,
+                       "output_bytes": None, "cached": False, "error": None}
+        self._start = timer()
+        if profiler.stats_threshold is not None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        else:
+            self._cprofile = None
+
+    def add_time(self, stage, seconds):
+        """Add time to a stage"""
+        self.record["stages"][stage] = self.record["stages"].get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager timing a stage"""
+        start = timer()
+        try:
+            yield
+        finally:
+            self.add_time(name, timer() - start)
+
+    def set(self, **kwargs):
+        """Set values of the record"""
+        self.record.update(kwargs)
+
+    def finish(self, error=None):
+        """Write the record of the file"""
+        total = timer() - self._start
+        self.record["total"] = total
+        if error is not None:
+            self.record["error"] = "%s: %s" % (type(error).__name__, getattr(error, "message", error))
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            if total >= self.profiler.stats_threshold:
+                self._cprofile.dump_stats(self.profiler.stats_path(self.record["file"]))
+        self.profiler.write(self.record)
+
+
+class _NullReport(object):
+    """A report which measures nothing, used when there is no profiler"""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def add_time(self, stage, seconds):
+        pass
+
+    def set(self, **kwargs):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+
+null_report = _NullReport()
+
+
+def start_report(profiler, file, task):
+    """Start the report of a file with a profiler, which might be None"""
+    return null_report if profiler is None else profiler.start(file, task)
@@ -8,17 +8,22 @@ import subprocess
 import logging
 import io
 import sys
-import re
+import math
+import time
+import multiprocessing
+import base64
+import zlib
+import gzip
+import array
+import uuid
+from numbers import Number
+from collections import deque
+from contextlib import contextmanager
+
+from .profiling import start_report, null_report
+
+# NOTE: jsonschema, xlsxwriter and matplotlib are slow to import. They are imported when first needed instead.
 
-from jsonschema import validate as validate_schema
-import xlsxwriter
-
-try:
-    import matplotlib.pyplot as plt
-except ModuleNotFoundError:
-    plt = None
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.Logger("vfd")
 
 default_colors = ['#1F77B4', '#FF7F0E', '#2CA02C', '#D62728', '#9467BD', '#8C564B', '#E377C2', '#7F7F7F']
@@ -29,8 +34,6 @@ default_markers = ['o', 's', '^', 'p', 'v', "d", "P", "*"]
 
 _indentation_size = 4
 
-_float_pattern = '[-+]?(?:(?:\d*\.\d+)|(?:\d+\.?))(?:[Ee][+-]?\d+)?'
-
 schema_style = {
     "type": "object",
     "properties": {
@@ -126,6 +129,20 @@ schema_plot = {
     "required": ["series"]
 }
 
+schema_external_array = {
+    "type": "object",
+    "properties": {
+        "file": {"Description": "Path to the file with the data, relative to the VFD. Either a .npy file or raw "
+                                "binary data", "type": "string"},
+        "dtype": {"Description": "Type of the items in a raw file, as a numpy dtype (e.g., \"<f8\")", "type": "string"},
+        "shape": {"Description": "Number of rows and columns of the matrix in a raw file", "type": "array",
+                  "minItems": 2, "maxItems": 2, "items": {"type": "integer", "minimum": 0}},
+        "offset": {"Description": "Position in bytes where the data starts in a raw file", "type": "integer",
+                   "minimum": 0}
+    },
+    "required": ["file"]
+}
+
 schema_colorplot = {
     "type": "object",
     "properties": {
@@ -154,9 +171,9 @@ schema_colorplot = {
               "type": "array",
               "items": {"type": "number"},
               },
-        "z": {"description": "Matrix of values to plot",
-              "type": "array",
-              "items": {"type": "array", "items": {"type": "number"}},
+        "z": {"description": "Matrix of values to plot, or a reference to a file with it, which is memory-mapped",
+              "anyOf": [{"type": "array", "items": {"type": "array", "items": {"type": "number"}}},
+                        schema_external_array],
               },
 
         "style": schema_style,
@@ -184,9 +201,37 @@ schema_multiplot = {
 }
 
 
+_schemas = {"plot": schema_plot, "multiplot": schema_multiplot, "colorplot": schema_colorplot}
+
 # TODO: Add epilog to schemas
 
 
+def _import_pyplot():
+    """Import matplotlib.pyplot, raising an error if it is not available"""
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        raise ModuleNotFoundError("Matplotlib was not found, scripts can not be run")
+    return plt
+
+
+def _matplotlib_version():
+    """Get the version of matplotlib, avoiding its import if possible, or None if it is not available"""
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python < 3.8
+        try:
+            import matplotlib
+        except ImportError:
+            return None
+        return matplotlib.__version__
+    try:
+        return version("matplotlib")
+    except PackageNotFoundError:
+        return None
+
+
 def _open_write(path):
     # io.open seems not to encode properly in windows + python3. Use regular open in py3, just in case.
     if sys.version_info < (3, 0):
@@ -195,10 +240,434 @@ def _open_write(path):
         return open(path, "w")
 
 
+# Extension of the VFD streams, see `StreamWriter`
+stream_extension = ".vfds"
+
+# Extensions of the VFD files, including the compressed ones and the streams
+vfd_extensions = (".vfd", ".vfd.gz", ".vfd.zst", stream_extension)
+
+
+def _open_zstd(file, mode):
+    """Open a zstd compressed file, given by its path or a file-like object"""
+    try:
+        import zstandard
+    except ImportError:
+        raise ModuleNotFoundError("The zstandard package is needed to open zstd compressed VFD files")
+    return zstandard.open(file, mode, encoding=None if "b" in mode else "utf-8")
+
+
+def _open_gzip(file, mode):
+    """Open a gzip compressed file, given by its path or a file-like object"""
+    # The default level (9) is several times slower than 6, for a small gain in size
+    return gzip.open(file, mode, compresslevel=6, encoding=None if "b" in mode else "utf-8")
+
+
+_compressed_openers = {".vfd.gz": _open_gzip, ".vfd.zst": _open_zstd}
+
+
+def split_vfd_extension(path):
+    """
+    Split a path into the part before its extension and the extension, which might be a compressed VFD one.
+
+    Args:
+        path (str): The path.
+
+    Returns:
+        tuple of str: The path without the extension and the extension (e.g., ".vfd.gz"), empty if there was none.
+
+    """
+    for extension in vfd_extensions:
+        if path.endswith(extension):
+            return path[:-len(extension)], extension
+    return os.path.splitext(path)
+
+
+def open_vfd(path, mode="r"):
+    """
+    Open a VFD file, compressing or decompressing it on the fly if its extension is that of a compressed VFD.
+
+    Available compressions are gzip (.vfd.gz) and zstd (.vfd.zst), which needs the zstandard package.
+
+    VFD streams (.vfds) can only be read, giving the JSON of the VFD their records are consolidated into. Use
+    `StreamWriter` to write them.
+
+    Args:
+        path (str): Path to the file.
+        mode (str): Mode to open the file ("r", "w", "rb" or "wb"). Text modes use utf-8.
+
+    Returns:
+        A file-like object.
+
+    Raises:
+        ValueError: If a VFD stream was opened for writing.
+
+    """
+    extension = split_vfd_extension(path)[1]
+    if extension == stream_extension:
+        if "r" not in mode:
+            raise ValueError("VFD streams must be written with a StreamWriter")
+        text = python_to_json(read_vfd_stream(path))
+        return io.BytesIO(text.encode("utf-8")) if "b" in mode else io.StringIO(text)
+    return _open_with_extension(path, mode, extension)
+
+
+def _open_with_extension(path, mode, extension):
+    """Open a file as one with the given VFD extension, compressing or decompressing it if needed"""
+    opener = _compressed_openers.get(extension)
+    if opener is not None:
+        # Text mode must be explicit in compressed files
+        return opener(path, mode if "b" in mode else mode + "t")
+    if "b" in mode:
+        return open(path, mode)
+    return io.open(path, mode, encoding="utf-8")
+
+
+def _replace_file(source, target):
+    """Rename a file, replacing the target if it exists"""
+    if sys.version_info < (3, 3):
+        # Renaming does not replace existing files in Windows. Not atomic there, but the file is already complete.
+        if os.name == "nt" and os.path.exists(target):
+            os.remove(target)
+        os.rename(source, target)
+    else:
+        os.replace(source, target)
+
+
+@contextmanager
+def write_vfd_atomic(path, mode="w"):
+    """
+    Open a VFD file for writing as `open_vfd` does, replacing the file only once it has been completely written.
+
+    The data is written to a temporary file in the same directory, which is renamed to the path when the context is
+    exited. If an exception is raised in the context, the temporary file is removed and the path is not modified.
+
+    Args:
+        path (str): Path to the file.
+        mode (str): Mode to open the file ("w" or "wb").
+
+    Yields:
+        A file-like object.
+
+    """
+    extension = split_vfd_extension(path)[1]
+    if extension == stream_extension:
+        raise ValueError("VFD streams must be written with a StreamWriter")
+    directory, name = os.path.split(os.path.abspath(path))
+    temp_path = os.path.join(directory, ".%s.%s.tmp" % (name, uuid.uuid4().hex[:8]))
+    try:
+        with _open_with_extension(temp_path, mode, extension) as f:
+            yield f
+        _replace_file(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _read_vfd_bytes(file):
+    """Get the content of a VFD file, decompressing it if needed. VFD streams are returned as they are."""
+    with open(file, "rb") as f:
+        content = f.read()
+    opener = _compressed_openers.get(split_vfd_extension(file)[1])
+    if opener is not None:
+        with opener(io.BytesIO(content), "rb") as f:
+            content = f.read()
+    return content
+
+
+def _parse_vfd_bytes(content, file):
+    """Get the Python representation of the content of a VFD file, as given by _read_vfd_bytes"""
+    if split_vfd_extension(file)[1] == stream_extension:
+        return read_vfd_stream(io.BytesIO(content))
+    return _decode_arrays(json.loads(content.decode("utf-8")))
+
+
+def load_vfd(file):
+    """
+    Load a VFD file into its Python representation, without validating it.
+
+    Compressed files and VFD streams are also accepted, see `open_vfd`. Binary encoded arrays are decoded.
+
+    Args:
+        file (str): Path to the file.
+
+    Returns:
+        dict: A python representation of the VFD.
+
+    """
+    if split_vfd_extension(file)[1] == stream_extension:
+        return read_vfd_stream(file)
+    with open_vfd(file) as f:
+        return _decode_arrays(json.load(f))
+
+
+class StreamWriter(object):
+    """
+    Writer of VFD streams, files which grow by appending records to them, so saving new data never rewrites the
+    previous one.
+
+    A VFD stream (.vfds) is a JSON Lines file with two kinds of records:
+
+    - Headers, as {"header": {...}}: A VFD whose series are given by the chunks. Each header replaces the previous one.
+    - Chunks, as {"series": 2, "plot": [0, 1], "data": {"x": [...], "y": [...], "label": "..."}}: Data appended to
+      the series with the given index, which is created if it is the next one. Arrays are concatenated to those of
+      the series and other values replace them. The plot is the position in a multiplot, omitted in other types.
+
+    Series of a plot in the header are only kept if there are no chunks for it. Read a stream with `read_vfd_stream`
+    or any function taking a VFD file, which consolidate the records into a VFD.
+
+    Each record is written with a single append, so the file is readable even while it is being written. A line
+    which is not finished is ignored when reading.
+
+    Args:
+        path (str): Path to the file. Any existing file is truncated.
+        binary (str): If given, type used to store the arrays of numbers in binary. See `python_to_json`.
+        compression (str): If binary was given, compression applied to the arrays. See `python_to_json`.
+
+    """
+
+    def __init__(self, path, binary=None, compression=None):
+        self.path = path
+        self.binary = binary
+        self.compression = compression
+        self._header = None
+        with open(path, "wb"):
+            pass
+        self._size = 0
+
+    def is_intact(self):
+        """Check the file still has the size it had after the last record, so records can be appended to it"""
+        return os.path.isfile(self.path) and os.path.getsize(self.path) == self._size
+
+    def write_header(self, header):
+        """
+        Write a header, if it differs from the last one.
+
+        Args:
+            header (dict): The VFD, without series or with those used when there are no chunks for them.
+
+        """
+        line = self._encode({"header": header})
+        if line != self._header:
+            self._write(line)
+            self._header = line
+
+    def append(self, series, data, plot=None):
+        """
+        Append data to a series.
+
+        Args:
+            series (int): Index of the series. If it is the number of series, a new one is created.
+            data (dict): The data of the series to append (e.g., "x", "y" or "label").
+            plot (tuple of int): Row and column of the plot in a multiplot.
+
+        """
+        record = {"series": series, "data": data}
+        if plot is not None:
+            record["plot"] = list(plot)
+        self._write(self._encode(record))
+
+    def _encode(self, record):
+        return python_to_json(record, compact=True, binary=self.binary, compression=self.compression) + "\n"
+
+    def _write(self, line):
+        line = line.encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(line)
+        self._size += len(line)
+
+
+def read_vfd_stream(file):
+    """
+    Read a VFD stream, consolidating its records into a VFD. See `StreamWriter` for the format.
+
+    Args:
+        file: Path to the file, or file-like object opened in binary mode.
+
+    Returns:
+        dict: A python representation of the VFD, with the binary encoded arrays decoded.
+
+    Raises:
+        ValueError: If the file is not a well-built VFD stream.
+
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            return read_vfd_stream(f)
+    header = None
+    chunks = {}
+    for line in file:
+        if not line.endswith(b"\n"):
+            # The last record is still being written
+            break
+        record = _decode_arrays(json.loads(line.decode("utf-8")))
+        if "header" in record:
+            header = record["header"]
+            continue
+        if header is None:
+            raise ValueError("Chunk found before the header of the VFD stream")
+        series_list = chunks.setdefault(tuple(record.get("plot", ())), [])
+        index = record["series"]
+        if index == len(series_list):
+            series_list.append({})
+        elif not 0 <= index < len(series_list):
+            raise ValueError("Chunk of series %d found when there are %d" % (index, len(series_list)))
+        series = series_list[index]
+        for key, value in record["data"].items():
+            if isinstance(value, list) and isinstance(series.get(key), list):
+                series[key].extend(value)
+            else:
+                series[key] = value
+    if header is None:
+        raise ValueError("No header found in the VFD stream")
+
+    description = dict(header)
+    if "plots" in description:
+        description["plots"] = [[dict(plot) for plot in row] for row in description["plots"]]
+    for position, series_list in chunks.items():
+        try:
+            plot = description["plots"][position[0]][position[1]] if position else description
+        except (KeyError, IndexError):
+            raise ValueError("Chunk found for a plot not in the header: %s" % (list(position),))
+        plot["series"] = series_list
+    return description
+
+
+def is_external_array(value):
+    """Check if a value of a VFD is a reference to an array stored in an external file"""
+    return isinstance(value, dict) and "file" in value
+
+
+def _external_array_code(reference):
+    """Get the code memory-mapping an array stored in an external file, with numpy imported as np"""
+    if reference["file"].endswith(".npy"):
+        return "np.load(%r, mmap_mode='r')" % reference["file"]
+    if "dtype" not in reference or "shape" not in reference:
+        raise ValueError("The dtype and the shape of the raw file %s are needed" % reference["file"])
+    return "np.memmap(%r, dtype=%r, mode='r', offset=%d, shape=(%d, %d))" % (
+        reference["file"], str(reference["dtype"]), reference.get("offset", 0), reference["shape"][0],
+        reference["shape"][1])
+
+
+def load_external_array(reference, path="."):
+    """
+    Memory-map an array stored in an external file.
+
+    Args:
+        reference (dict): The reference to the file in the VFD.
+        path (str): Directory of the VFD, where relative paths start.
+
+    Returns:
+        numpy.ndarray: The read-only, memory-mapped array.
+
+    Raises:
+        ValueError: If the dtype or the shape of a raw file was not given.
+
+    """
+    import numpy as np
+    file = os.path.join(path, reference["file"])
+    if file.endswith(".npy"):
+        return np.load(file, mmap_mode="r")
+    if "dtype" not in reference or "shape" not in reference:
+        raise ValueError("The dtype and the shape of the raw file %s are needed" % reference["file"])
+    return np.memmap(file, dtype=reference["dtype"], mode="r", offset=reference.get("offset", 0),
+                     shape=tuple(reference["shape"]))
+
+
+def _resolve_external_files(description, path):
+    """Get a copy of a VFD where the paths of the external files are relative to a directory instead"""
+    if isinstance(description, dict):
+        if is_external_array(description):
+            return dict(description, file=os.path.join(path, description["file"]))
+        return {key: _resolve_external_files(value, path) for key, value in description.items()}
+    if isinstance(description, list) and description and isinstance(description[0], (dict, list)):
+        return [_resolve_external_files(value, path) for value in description]
+    return description
+
+
+def _external_files_state(description, path):
+    """Get the paths, modification times and sizes of the external data files referred in a VFD"""
+    states = []
+    if isinstance(description, dict):
+        if is_external_array(description):
+            file = os.path.join(path, description["file"])
+            try:
+                st = os.stat(file)
+                states.append((file, st.st_mtime, st.st_size))
+            except OSError:
+                # Reported when rendering
+                states.append((file, None, None))
+        else:
+            for value in description.values():
+                states += _external_files_state(value, path)
+    elif isinstance(description, list) and description and isinstance(description[0], (dict, list)):
+        for value in description:
+            states += _external_files_state(value, path)
+    return states
+
+
 def _cycle_property(index, property_list):
     return property_list[index % len(property_list)]
 
 
+def _decimate(x, y, max_points, x_range=None, log_x=False):
+    """
+    Reduce the points of a line, keeping its shape when drawn at the given resolution.
+
+    The x range is split in max_points / 4 buckets of equal width in the scale of the axis, where the first, last,
+    minimum and maximum points are kept. When a bucket spans at most a pixel column, the drawn line is the same.
+
+    Args:
+        x (list of float or None): The x-coordinates, which must be sorted. If None, indexes are assumed.
+        y (list of float): The y-coordinates.
+        max_points (int): The approximate maximum number of points to keep.
+        x_range (list of float): The represented x range, if not determined by the data.
+        log_x (bool): Whether the x-axis is in logarithmic scale.
+
+    Returns:
+        tuple: The reduced x and y lists, or the given ones if they could not be reduced.
+
+    """
+    if len(y) <= max_points:
+        return x, y
+    try:
+        import numpy as np
+    except ImportError:
+        logger.warning("numpy is needed to reduce the number of points")
+        return x, y
+    y_array = np.asarray(y, dtype=float)
+    x_array = np.arange(len(y), dtype=float) if x is None else np.asarray(x, dtype=float)
+    if len(x_array) != len(y_array) or not (np.isfinite(x_array).all() and np.isfinite(y_array).all()):
+        return x, y
+    if not (np.diff(x_array) >= 0).all():
+        # Not a function of x, the buckets would not correspond to pixels
+        return x, y
+    if log_x:
+        if not (x_array > 0).all():
+            return x, y
+        x_scaled = np.log10(x_array)
+        x_range = np.log10(x_range) if x_range is not None else None
+    else:
+        x_scaled = x_array
+    low, high = x_range if x_range is not None else (x_scaled[0], x_scaled[-1])
+    if not high > low:
+        return x, y
+
+    # Buckets are contiguous, since x is sorted
+    bucket = np.floor((x_scaled - low) / (high - low) * max(max_points // 4, 1)).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    ends = np.concatenate((starts[1:], [len(y_array)])) - 1
+    segment = np.repeat(np.arange(len(starts)), ends - starts + 1)
+    keep = [starts, ends]
+    for reduce in (np.minimum, np.maximum):
+        # First point of each bucket where the extreme is found
+        found = np.flatnonzero(y_array == reduce.reduceat(y_array, starts)[segment])
+        _, first = np.unique(segment[found], return_index=True)
+        keep.append(found[first])
+    keep = np.unique(np.concatenate(keep))
+    return x_array[keep].tolist(), y_array[keep].tolist()
+
+
 def _full_errorbar(values, error_limit, error, positive):
     """
     Get the argument needed for plt.errorbar error description.
@@ -254,8 +723,78 @@ def _get_style(description):
     return kwargs
 
 
+class _CodeName(object):
+    """A name which is written as such in the generated code"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+    __str__ = __repr__
+
+
+def _literal_data(values):
+    """Data store writing the data as literals in the code"""
+    return values
+
+
+def _array_store(arrays, reference="_data[%d]"):
+    """
+    Get a data store which appends the data to a list, referring to it by its position.
+
+    Args:
+        arrays (list): The list where the data is appended.
+        reference (str): Format of the reference in the code, taking the position in the list.
+
+    Returns:
+        callable: The data store.
+
+    """
+
+    def store(values):
+        arrays.append(values)
+        return _CodeName(reference % (len(arrays) - 1))
+
+    return store
+
+
+def _sidecar_store(data_file, arrays):
+    """
+    Get the code loading a data file and a data store to refer to its contents.
+
+    Args:
+        data_file (str): Path of the file. Its extension (.npz or .json) defines the format.
+        arrays (list): The list where the data will be appended, to save it after the code is created.
+
+    Returns:
+        tuple: The code loading the data and the data store.
+
+    """
+    name = os.path.basename(data_file)
+    if data_file.endswith(".npz"):
+        code = "import numpy as np\n_data = np.load(%s)\n" % repr(name)
+        return code, _array_store(arrays, '_data["arr_%d"]')
+    elif data_file.endswith(".json"):
+        code = "import json\nwith open(%s) as _data_file:\n    _data = json.load(_data_file)\n" % repr(name)
+        return code, _array_store(arrays, "_data[%d]")
+    else:
+        raise ValueError("Unknown data file format: %s" % data_file)
+
+
+def _save_sidecar(data_file, arrays):
+    """Save the data referred by the code given by _sidecar_store"""
+    if data_file.endswith(".npz"):
+        import numpy as np
+        np.savez(data_file, *arrays)
+    else:
+        with _open_write(data_file) as f:
+            json.dump(arrays, f)
+
+
 def _create_matplotlib_plot(description, container="plt", current_axes=True, indentation_level=0, marker_list=None,
-                            color_list=None, line_list=None, title_inside=False):
+                            color_list=None, line_list=None, title_inside=False, data_store=None, max_points=None):
     """
     Create code describing a simple plot.
 
@@ -268,11 +807,16 @@ def _create_matplotlib_plot(description, container="plt", current_axes=True, ind
         color_list (list): Colors to use when an index requests to do so.
         line_list (list of str): Line styles to use when requested.
         title_inside (bool): Insert the title as text inside the plot instead as a title. Useful for multiplots.
+        data_store (callable): Function returning what is written in the code for each array of data.
+        max_points (int): If given, maximum number of points (approximately) of the lines, as described in
+                          `create_matplotlib_script`.
 
     Returns:
         str: Python code which will create the plot.
 
     """
+    if data_store is None:
+        data_store = _literal_data
     # Markers will automatically switch always to distinguish the series.
     if marker_list is None:
         marker_list = default_markers
@@ -320,10 +864,21 @@ def _create_matplotlib_plot(description, container="plt", current_axes=True, ind
 
     for series_index, s in enumerate(description["series"]):
         y = s["y"]
-        if "x" in s:
-            args = [s["x"], y]
+        x = s.get("x")
+        if max_points and len(y) > max_points and s.get("joined", True) and \
+                not any(i in s for i in ["xerr", "xmax", "xmin", "yerr", "ymin", "ymax"]):
+            # Only simple lines are reduced. E.g., all the points are needed to draw the markers.
+            if s.get("xadded") == 1:
+                # The series is drawn in the added x axis
+                x_axis = description.get("xadded", [{}])[0]
+                x_range, log_x = x_axis.get("range"), x_axis.get("log", False)
+            else:
+                x_range, log_x = description.get("xrange"), description.get("xlog", False)
+            x, y = _decimate(x, y, max_points, x_range=x_range, log_x=log_x)
+        if x is not None:
+            args = [data_store(x), data_store(y)]
         else:
-            args = [y]
+            args = [data_store(y)]
         kwargs = {}
         if "label" in s and s["label"]:
             kwargs["label"] = s["label"]
@@ -371,7 +926,7 @@ def _create_matplotlib_plot(description, container="plt", current_axes=True, ind
                     x = list(range(len(s["y"])))
                 kwargs["alpha"]=0.5  # Half-transparency seems desirable
                 code += indentation + series_container + '.fill_between(*%s,%s**%s)\n' % (
-                    [x, ymin, ymax], "\n" + indentation + " " * 12, kwargs)
+                    [data_store(x), data_store(ymin), data_store(ymax)], "\n" + indentation + " " * 12, kwargs)
 
             else:
                 # Error bar plot
@@ -382,9 +937,9 @@ def _create_matplotlib_plot(description, container="plt", current_axes=True, ind
                     ymax = _full_errorbar(y, s["ymax"] if "ymax" in s else None, s["yerr"] if "yerr" in s else None,
                                           True)
 
-                    kwargs["yerr"] = [ymin, ymax]
+                    kwargs["yerr"] = [data_store(ymin), data_store(ymax)]
                 elif "yerr" in s:
-                    kwargs["yerr"] = s["yerr"]
+                    kwargs["yerr"] = data_store(s["yerr"])
                 if "xmin" in s or "xmax" in s:
                     # Custom error bars
                     x = s["x"] if "x" in s else list(range(len(y)))
@@ -393,9 +948,9 @@ def _create_matplotlib_plot(description, container="plt", current_axes=True, ind
                     xmax = _full_errorbar(x, s["xmax"] if "xmax" in s else None, s["xerr"] if "xerr" in s else None,
                                           True)
 
-                    kwargs["xerr"] = [xmin, xmax]
+                    kwargs["xerr"] = [data_store(xmin), data_store(xmax)]
                 elif "xerr" in s:
-                    kwargs["xerr"] = s["xerr"]
+                    kwargs["xerr"] = data_store(s["xerr"])
                 if "joined" in s:
                     if not s["joined"]:
                         kwargs["fmt"] = _cycle_property(marker_count, marker_list)
@@ -500,7 +1055,8 @@ def _create_matplotlib_plot(description, container="plt", current_axes=True, ind
     return code
 
 
-def _create_matplotlib_colorplot(description, container="plt", current_axes=True, indentation_level=0, rasterized=True):
+def _create_matplotlib_colorplot(description, container="plt", current_axes=True, indentation_level=0, rasterized=True,
+                                 data_store=None):
     """
     Create code describing a simple plot.
 
@@ -510,11 +1066,14 @@ def _create_matplotlib_colorplot(description, container="plt", current_axes=True
         current_axes (bool): Whether to call the set_* methods of the container or the current axes methods (for 'plt').
         indentation_level: Indentation level for the code.
         rasterized (bool): Whether the plot should be rasterized
+        data_store (callable): Function returning what is written in the code for each array of data.
 
     Returns:
         str: Python code which will create the plot.
 
     """
+    if data_store is None:
+        data_store = _literal_data
     code = ""
     indentation = " " * (indentation_level * _indentation_size)
     plot_f = "pcolormesh"
@@ -533,6 +1092,13 @@ def _create_matplotlib_colorplot(description, container="plt", current_axes=True
     except KeyError:
         pass
 
+    if is_external_array(description["z"]):
+        # Memory-mapped, so the data is never written in the code or loaded as Python objects
+        code += indentation + "import numpy as np\n"
+        z = _CodeName(_external_array_code(description["z"]))
+    else:
+        z = data_store(description["z"])
+
     # Store the ContourSet to label or rasterize it later
     code += indentation
     if plot_f in ["contour", "contourf"]:
@@ -540,9 +1106,9 @@ def _create_matplotlib_colorplot(description, container="plt", current_axes=True
 
     # Leave call open for other args
     if "x" and "y" in description:
-        code += container + '.%s(%s,%s,%s' % (plot_f, description["x"], description["y"], description["z"])
+        code += container + '.%s(%s,%s,%s' % (plot_f, data_store(description["x"]), data_store(description["y"]), z)
     else:
-        code += container + '.%s(%s' % (plot_f, description["z"])
+        code += container + '.%s(%s' % (plot_f, z)
 
     # Set the scale and range
     if "zlog" in description and description["zlog"]:
@@ -607,7 +1173,7 @@ def _create_matplotlib_colorplot(description, container="plt", current_axes=True
 
 def create_matplotlib_script(description, export_name="untitled", context=None, export_format=None,
                              marker_list=None, color_list=None, line_list=None, tight_layout=None,
-                             scale_multiplot=False):
+                             scale_multiplot=False, data_store=None, data_file=None, max_points=None):
     """
     Create a matplotlib script to plot the VFD with the given description.
 
@@ -621,11 +1187,49 @@ def create_matplotlib_script(description, export_name="untitled", context=None,
         line_list (list of str): Line styles to use when requested.
         tight_layout (bool): Use the tight_layout function to fit the plot.
         scale_multiplot (bool): Whether to automatically increase the size of multiplots.
+        data_store (callable): Function called with each array of data, returning the object whose representation is
+                               written in the code instead of the data. By default, data is written as literals.
+        data_file (str): If given, path to a file (.npz or .json) where the data is saved instead of writing it in the
+                         code. The code loads the file from its working directory, like the exported plots are saved.
+        max_points (int): If given, lines with more points are reduced to approximately this number of points, keeping
+                          the minimum and maximum in small ranges of x. Their shape is kept if the number is at least
+                          four times the width in pixels of the plot. Markers, error bars and lines which do not
+                          represent a function of x are not reduced.
 
     Returns:
         str: Python code which will create the plot.
 
     """
+    return "".join(_create_matplotlib_stages(description, export_name=export_name, context=context,
+                                             export_format=export_format, marker_list=marker_list,
+                                             color_list=color_list, line_list=line_list, tight_layout=tight_layout,
+                                             scale_multiplot=scale_multiplot, data_store=data_store,
+                                             data_file=data_file, max_points=max_points))
+
+
+def _create_matplotlib_stages(description, export_name="untitled", context=None, export_format=None,
+                              marker_list=None, color_list=None, line_list=None, tight_layout=None,
+                              scale_multiplot=False, data_store=None, data_file=None, max_points=None):
+    """
+    Create the parts of the script given by create_matplotlib_script, so the plotting and the export can be run apart.
+
+    The arguments are those of `create_matplotlib_script`.
+
+    Returns:
+        str: The head of the script, importing matplotlib and loading the data.
+        str: The line opening the style context, for which the next parts are indented, or an empty string.
+        str: The code creating the plot.
+        str: The code exporting or showing the plot.
+
+    """
+    if data_file is not None:
+        if data_store is not None:
+            raise ValueError("data_store and data_file can not be used at the same time")
+        arrays = []
+        data_code, data_store = _sidecar_store(data_file, arrays)
+    else:
+        data_code = ""
+
     # Consider only top level style hinting
     if "style" in description:
         style_description = description["style"]
@@ -636,14 +1240,16 @@ def create_matplotlib_script(description, export_name="untitled", context=None,
         if marker_list is None and "markers" in style_description:
             marker_list = style_description["markers"]
 
-    code = "#!/usr/bin/env python\nimport matplotlib.pyplot as plt\n"
+    head = "#!/usr/bin/env python\nimport matplotlib.pyplot as plt\n" + data_code
+    context_code = ""
+    code = ""
     indentation = ""
     indentation_level = 0
     if context is not None and context:
         if isinstance(context, str):
-            code += "with plt.style.context(%s):\n" % repr(context)
+            context_code = "with plt.style.context(%s):\n" % repr(context)
         elif isinstance(context, list):
-            code += "with plt.style.context([%s]):\n" % ", ".join([repr(s) for s in context])
+            context_code = "with plt.style.context([%s]):\n" % ", ".join([repr(s) for s in context])
         else:
             raise TypeError("context must be a str or a list of str")
         indentation_level = 1
@@ -651,7 +1257,8 @@ def create_matplotlib_script(description, export_name="untitled", context=None,
 
     if description["type"] == "plot":
         code += _create_matplotlib_plot(description, indentation_level=indentation_level, marker_list=marker_list,
-                                        color_list=color_list, line_list=line_list, )
+                                        color_list=color_list, line_list=line_list, data_store=data_store,
+                                        max_points=max_points)
         if tight_layout:
             code += indentation + "plt.tight_layout()\n"
 
@@ -674,26 +1281,30 @@ def create_matplotlib_script(description, export_name="untitled", context=None,
         if plots_hor == 1 and plots_ver == 1:
             code += _create_matplotlib_plot(description["plots"][0][0], container="axarr", current_axes=False,
                                             indentation_level=indentation_level, marker_list=marker_list,
-                                            color_list=color_list, line_list=line_list, title_inside=True)
+                                            color_list=color_list, line_list=line_list, title_inside=True,
+                                            data_store=data_store, max_points=max_points)
         elif plots_hor == 1:
             for i in range(plots_ver):
                 code += _create_matplotlib_plot(description["plots"][i][0], container="axarr[%d]" % i,
                                                 current_axes=False, indentation_level=indentation_level,
                                                 marker_list=marker_list, color_list=color_list,
-                                                line_list=line_list, title_inside=True)
+                                                line_list=line_list, title_inside=True, data_store=data_store,
+                                                max_points=max_points)
         elif plots_ver == 1:
             for j in range(plots_hor):
                 code += _create_matplotlib_plot(description["plots"][0][j], container="axarr[%d]" % j,
                                                 current_axes=False, indentation_level=indentation_level,
                                                 marker_list=marker_list, color_list=color_list,
-                                                line_list=line_list, title_inside=True)
+                                                line_list=line_list, title_inside=True, data_store=data_store,
+                                                max_points=max_points)
         else:
             for i in range(plots_ver):
                 for j in range(plots_hor):
                     code += _create_matplotlib_plot(description["plots"][i][j], container="axarr[%d][%d]" % (i, j),
                                                     current_axes=False, indentation_level=indentation_level,
                                                     marker_list=marker_list, color_list=color_list,
-                                                    line_list=line_list, title_inside=True)
+                                                    line_list=line_list, title_inside=True, data_store=data_store,
+                                                    max_points=max_points)
         if "title" in description:
             code += indentation + 'fig.suptitle(%s)\n' % repr(description["title"])
 
@@ -710,60 +1321,99 @@ def create_matplotlib_script(description, export_name="untitled", context=None,
             pass
 
     elif description["type"] == "colorplot":
-        code += _create_matplotlib_colorplot(description, indentation_level=indentation_level)
+        code += _create_matplotlib_colorplot(description, indentation_level=indentation_level, data_store=data_store)
         if tight_layout:
             code += indentation + "plt.tight_layout()\n"
 
     else:
         raise ValueError("Unknown plot type: %s" % description["type"])
 
+    export_code = ""
     if export_format is None or not export_format:
-        code += indentation + 'plt.gcf().canvas.set_window_title(%s)\n' % repr(export_name)
-        code += indentation + 'plt.show()\n'
+        export_code += indentation + 'plt.gcf().canvas.set_window_title(%s)\n' % repr(export_name)
+        export_code += indentation + 'plt.show()\n'
     else:
         if isinstance(export_format, str):
             export_format = [export_format]
         for f in export_format:
-            code += indentation + 'plt.savefig("%s.%s")\n' % (export_name, f)
-    return code
+            if isinstance(export_name, _CodeName):
+                # Export to an object defined where the code is run (e.g., a buffer)
+                export_code += indentation + 'plt.savefig(%s, format=%s)\n' % (export_name, repr(f))
+            else:
+                export_code += indentation + 'plt.savefig("%s.%s")\n' % (export_name, f)
+
+    if data_file is not None:
+        _save_sidecar(data_file, arrays)
+    return head, context_code, code, export_code
+
+
+# Maximum number of rows in a sheet of a xlsx file
+_xlsx_max_rows = 1048576
+
+# Maximum number of columns in a sheet of a xlsx file
+_xlsx_max_columns = 16384
+
+# Rows before the data in a sheet: the titles and the labels of the series or the x values of a colorplot
+_xlsx_header_rows = 2
 
+# Approximate number of values of a numpy matrix read at once when looking for its range
+_xlsx_block_size = 1048576
 
-def export_xlsx(description, file_path):
+
+def _xlsx_plot(workbook, description, name):
     """
-    Create a matplotlib script to plot the VFD with the given description.
+    Add the sheets with the data of a plot and its chart to a workbook.
 
-    Args:
-        description (dict): Description of the VFD, obtained parsing the JSON.
-        file_path (str): Path to the created file.
+    The data is written row by row, as needed in the constant_memory mode of xlsxwriter. Series which do not fit in
+    a sheet continue in additional ones, named after the first one.
 
+    Args:
+        workbook (xlsxwriter.Workbook): The workbook.
+        description (dict): Description of the VFD, of type "plot".
+        name (str): Name of the first sheet.
 
     """
-    row_start = '3'  # Row where the series start in the spreadsheet
-    if description["type"] == "plot":
-        workbook = xlsxwriter.Workbook(file_path)
-        worksheet = workbook.add_worksheet()
-        bold = workbook.add_format({'bold': 1})
-        if "title" in description:
-            worksheet.write(0, 0, description["title"], bold)
-        if "xlabel" in description:
-            worksheet.write(0, 1, description["xlabel"], bold)
-        if "ylabel" in description:
-            worksheet.write(0, 2, description["ylabel"], bold)
-        # Prepare a chart with both markers and lines by default
-        chart = workbook.add_chart({'type': 'scatter', 'subtype': 'straight_with_markers'})
-        for i, s in enumerate(description["series"]):
-            col = chr(ord('A') + 2 * i)
-            col2 = chr(ord('B') + 2 * i)
-            worksheet.write_column(col + row_start, s["x"])
-            worksheet.write_column(col2 + row_start, s["y"])
+    series = description["series"]
+    # Points in each sheet
+    sheet_size = _xlsx_max_rows - _xlsx_header_rows
+    total = max([len(s["y"]) for s in series] or [0])
+    bold = workbook.add_format({'bold': 1})
+    # Prepare a chart with both markers and lines by default
+    chart = workbook.add_chart({'type': 'scatter', 'subtype': 'straight_with_markers'})
+    chart_series = [[] for _ in series]
+    first_sheet = None
+    for sheet_index, start in enumerate(range(0, max(total, 1), sheet_size)):
+        sheet_name = _xlsx_sheet_name(name, sheet_index)
+        worksheet = workbook.add_worksheet(sheet_name)
+        if first_sheet is None:
+            first_sheet = worksheet
+        _xlsx_write_titles(worksheet, description, bold)
+        for i, s in enumerate(series):
             if "label" in s:
                 worksheet.write(1, 2 * i, s["label"], bold)
-
+        columns = []
+        for i, s in enumerate(series):
+            x = s["x"] if "x" in s else range(1, len(s["y"]) + 1)
+            stop = min(len(s["y"]), start + sheet_size)
+            if stop > start:
+                columns.append((2 * i, x, s["y"], stop))
+                chart_series[i].append([sheet_name, _xlsx_header_rows, 2 * i, _xlsx_header_rows + stop - start - 1])
+        # Write row by row
+        write_number = worksheet.write_number
+        for index in range(start, min(total, start + sheet_size)):
+            row = _xlsx_header_rows + index - start
+            for col, x, y, stop in columns:
+                if index < stop:
+                    write_number(row, col, x[index])
+                    write_number(row, col + 1, y[index])
+
+    for i, s in enumerate(series):
+        for sheet_name, first_row, col, last_row in chart_series[i]:
             # TODO: add error bar support
             opts = {
-                'name': '=Sheet1!$%s$2' % col,
-                'categories': '=Sheet1!$%s$%s:$%s$%s' % (col, int(row_start), col, str(len(s["x"]) + int(row_start))),
-                'values': '=Sheet1!$%s$%s:$%s$%s' % (col2, int(row_start), col2, str(len(s["y"]) + int(row_start))),
+                'name': [name, 1, col],
+                'categories': [sheet_name, first_row, col, last_row, col],
+                'values': [sheet_name, first_row, col + 1, last_row, col + 1],
             }
             if "joined" in s:
                 # If joined was explicitly set, remove the unwanted lines or markers
@@ -772,103 +1422,498 @@ def export_xlsx(description, file_path):
                 else:
                     opts['line'] = {'none': True}
             chart.add_series(opts)
-        chart.set_title({'name': '=Sheet1!A1'})
-        # Attribute "legendtitle" can not be used in xlsx
-        # A possible workarounds could be adding a dummy series as follows
-        # if "legendtitle" in description:
-        #     chart.add_series(
-        #         {'name': description["legendtitle"], 'categories': '1', 'values': '1', 'marker': {'type': 'none'},
-        #          'line': {'none': True}})
-        # However, I still don't like the result. Better do nothing.
-        opts = {'name': '=Sheet1!B1'}
-        if "xlog" in description and description["xlog"]:
-            opts["log_base"] = 10
-        if "xrange" in description:
-            opts["min"], opts["max"] = description["xrange"]
-        chart.set_x_axis(opts)
-
-        opts = {'name': '=Sheet1!C1'}
-        if "ylog" in description and description["ylog"]:
-            opts["log_base"] = 10
-        if "yrange" in description:
-            opts["min"], opts["max"] = description["yrange"]
-        chart.set_y_axis(opts)
-
-        worksheet.insert_chart('D3', chart, {'x_offset': 25, 'y_offset': 10})
-        workbook.close()
-    elif description["type"] == "multiplot":
-        raise NotImplemented
-    elif description["type"] == "colorplot":
-        raise NotImplemented
+    chart.set_title({'name': [name, 0, 0]})
+    # Attribute "legendtitle" can not be used in xlsx
+    # A possible workarounds could be adding a dummy series as follows
+    # if "legendtitle" in description:
+    #     chart.add_series(
+    #         {'name': description["legendtitle"], 'categories': '1', 'values': '1', 'marker': {'type': 'none'},
+    #          'line': {'none': True}})
+    # However, I still don't like the result. Better do nothing.
+    opts = {'name': [name, 0, 1]}
+    if "xlog" in description and description["xlog"]:
+        opts["log_base"] = 10
+    if "xrange" in description:
+        opts["min"], opts["max"] = description["xrange"]
+    chart.set_x_axis(opts)
+
+    opts = {'name': [name, 0, 2]}
+    if "ylog" in description and description["ylog"]:
+        opts["log_base"] = 10
+    if "yrange" in description:
+        opts["min"], opts["max"] = description["yrange"]
+    chart.set_y_axis(opts)
+
+    # Next to the data. A chart without series can not be added.
+    if series:
+        first_sheet.insert_chart(2, max(3, 2 * len(series)), chart, {'x_offset': 25, 'y_offset': 10})
+
+
+def _xlsx_colorplot(workbook, description, name, path="."):
+    """
+    Add the sheets with the matrix of a colorplot to a workbook, colored with a conditional format.
+
+    The first row of the matrix has the x values, and the first column the y values. Rows which do not fit in a sheet
+    continue in additional ones, named after the first one.
+
+    Args:
+        workbook (xlsxwriter.Workbook): The workbook.
+        description (dict): Description of the VFD, of type "colorplot".
+        name (str): Name of the first sheet.
+        path (str): Directory of the VFD, where the relative paths of external data files start.
+
+    """
+    z = description["z"]
+    if is_external_array(z):
+        z = load_external_array(z, path)
+    rows = len(z)
+    cols = len(z[0]) if rows else 0
+    if cols >= _xlsx_max_columns:
+        raise ValueError("The colorplot has %d columns, but a xlsx sheet has %d" % (cols, _xlsx_max_columns))
+    x = description["x"] if "x" in description else range(1, cols + 1)
+    y = description["y"] if "y" in description else range(1, rows + 1)
+
+    # The same scale is used in all the sheets
+    if "zrange" in description:
+        z_min, z_max = description["zrange"]
+    elif hasattr(z, "dtype"):
+        z_min, z_max = _finite_range(z)
+    else:
+        finite = [value for row in z for value in row if not (math.isnan(value) or math.isinf(value))]
+        z_min, z_max = (min(finite), max(finite)) if finite else (0, 1)
+    color_scale = {'type': '3_color_scale',
+                   'min_type': 'num', 'min_value': z_min, 'min_color': '#440154',
+                   'mid_type': 'num', 'mid_value': (z_min + z_max) / 2, 'mid_color': '#21918C',
+                   'max_type': 'num', 'max_value': z_max, 'max_color': '#FDE725'}
+
+    bold = workbook.add_format({'bold': 1})
+    sheet_size = _xlsx_max_rows - _xlsx_header_rows
+    for sheet_index, start in enumerate(range(0, max(rows, 1), sheet_size)):
+        worksheet = workbook.add_worksheet(_xlsx_sheet_name(name, sheet_index))
+        _xlsx_write_titles(worksheet, description, bold)
+        for j, value in enumerate(x):
+            worksheet.write_number(1, j + 1, value, bold)
+        write_number = worksheet.write_number
+        stop = min(rows, start + sheet_size)
+        for i in range(start, stop):
+            row = _xlsx_header_rows + i - start
+            write_number(row, 0, y[i], bold)
+            values = z[i]
+            if hasattr(values, "tolist"):
+                values = values.tolist()
+            for j, value in enumerate(values):
+                write_number(row, j + 1, value)
+        if stop > start and cols:
+            worksheet.conditional_format(_xlsx_header_rows, 1, _xlsx_header_rows + stop - start - 1, cols,
+                                         color_scale)
+
+
+def _finite_range(z):
+    """
+    Get the minimum and the maximum of the finite values of a numpy matrix, or (0, 1) if there are none.
+
+    The matrix is read by blocks of rows, so a memory-mapped one is never loaded at once.
+
+    """
+    import numpy as np
+    z_min, z_max = None, None
+    step = max(1, _xlsx_block_size // max(1, z.shape[1] if z.ndim > 1 else 1))
+    for start in range(0, len(z), step):
+        block = np.asarray(z[start:start + step])
+        finite = block[np.isfinite(block)]
+        if finite.size:
+            block_min, block_max = float(finite.min()), float(finite.max())
+            z_min = block_min if z_min is None else min(z_min, block_min)
+            z_max = block_max if z_max is None else max(z_max, block_max)
+    return (0, 1) if z_min is None else (z_min, z_max)
+
+
+def _xlsx_sheet_name(name, index):
+    """Get the name of a sheet continuing the data of the one with the given name"""
+    return name if index == 0 else "%s (%d)" % (name, index + 1)
+
+
+def _xlsx_write_titles(worksheet, description, bold):
+    """Write the title and the axis labels of a plot in the first row of a sheet"""
+    if "title" in description:
+        worksheet.write(0, 0, description["title"], bold)
+    if "xlabel" in description:
+        worksheet.write(0, 1, description["xlabel"], bold)
+    if "ylabel" in description:
+        worksheet.write(0, 2, description["ylabel"], bold)
+
+
+def _xlsx_add(workbook, description, name, path="."):
+    """Add the sheets of a plot or colorplot to a workbook"""
+    vfd_type = description.get("type", "plot")
+    if vfd_type == "plot":
+        _xlsx_plot(workbook, description, name)
+    elif vfd_type == "colorplot":
+        _xlsx_colorplot(workbook, description, name, path=path)
     else:
+        raise ValueError("Unknown type: %s" % vfd_type)
+
+
+def export_xlsx(description, file_path, path=None):
+    """
+    Create a xlsx file with the data of the VFD with the given description.
+
+    Plots are represented with a chart next to their data. Colorplots are represented by their matrix, colored with a
+    conditional format. In a multiplot, each subplot is added in its own sheet.
+
+    The file is written in the constant_memory mode of xlsxwriter, so the memory used does not grow with the size of
+    the data. Data with more points than the rows of a sheet continues in additional sheets.
+
+    Args:
+        description (dict): Description of the VFD, obtained parsing the JSON.
+        file_path (str): Path to the created file.
+        path (str): Directory of the VFD, where the relative paths of external data files start. If None, the
+                    working directory is used.
+
+    """
+    import xlsxwriter
+
+    if path is None:
+        path = "."
+    if description["type"] not in _schemas:
         raise ValueError("Unknown type: %s" % description["type"])
+    with xlsxwriter.Workbook(file_path, {'constant_memory': True, 'nan_inf_to_errors': True}) as workbook:
+        if description["type"] == "multiplot":
+            for i, row in enumerate(description["plots"]):
+                for j, plot in enumerate(row):
+                    _xlsx_add(workbook, plot, "Plot %d-%d" % (i + 1, j + 1), path=path)
+        else:
+            _xlsx_add(workbook, description, "Sheet1", path=path)
+
+
+def _file_list(path, expand_glob=True):
+    """Get the list of files to process in a path"""
+    if expand_glob:
+        file_list = glob(path)
+        if path.endswith(".vfd"):
+            # Patterns for VFD files also match the compressed ones and the streams
+            for extension in vfd_extensions[1:]:
+                file_list += glob(path[:-4] + extension)
+    else:
+        file_list = [path]
+    if not file_list:
+        raise ValueError("No file matching " + path)
+    return file_list
+
+
+class _BatchTask(object):
+    """A picklable call of a function on a file, returning the error instead of raising it"""
+
+    def __init__(self, function, kwargs):
+        self.function = function
+        self.kwargs = kwargs
+
+    def __call__(self, file):
+        try:
+            self.function(file, **self.kwargs)
+        except Exception as e:
+            # Some exceptions (e.g., jsonschema.ValidationError) provide a shorter description
+            return file, "%s: %s" % (type(e).__name__, getattr(e, "message", e))
+        return file, None
+
+
+def _run_batch(function, file_list, workers, **kwargs):
+    """
+    Call a function for each file using a pool of processes.
+
+    Args:
+        function (callable): A module-level function taking the path of the file as the first argument.
+        file_list (list of str): Paths of the files.
+        workers (int): Number of processes to use.
+        **kwargs: Additional arguments to supply to the function.
+
+    Returns:
+        dict: A mapping from the paths of the files whose processing failed to a description of the error.
+
+    Raises:
+        ValueError: If the number of processes is not positive.
 
+    """
+    if workers < 1:
+        raise ValueError("The number of workers must be at least 1, got %d" % workers)
+    errors = {}
+    pool = multiprocessing.Pool(min(workers, len(file_list)))
+    try:
+        for file, error in pool.imap_unordered(_BatchTask(function, kwargs), file_list):
+            if error is not None:
+                logger.error("%s: %s" % (file, error))
+                errors[file] = error
+    finally:
+        pool.close()
+        pool.join()
+    return errors
+
+
+def _skip_multiplot_container(description):
+    """Get the only plot of a multiplot with a single item, or the description itself otherwise"""
+    if description["type"] == "multiplot" and len(description["plots"]) == 1 and \
+        len(description["plots"][0]) == 1:
+        return description["plots"][0][0]
+    return description
+
+
+def _run_matplotlib(description, path=".", namespace=None, report=null_report, **kwargs):
+    """
+    Plot a VFD in the current interpreter, passing the data in memory to matplotlib.
+
+    Args:
+        description (dict): Description of the VFD, obtained parsing the JSON.
+        path (str): Directory where the code is run, which is where the plots are exported to. If None, the working
+                    directory is not changed.
+        namespace (dict): Additional names available to the code.
+        report (vfd.profiling.FileReport): Report where the time of the stages is added.
+        **kwargs: Additional arguments to supply to `create_matplotlib_script`.
+
+    """
+    plt = _import_pyplot()
+    arrays = []
+    with report.stage("codegen"):
+        head, context_code, code, export_code = _create_matplotlib_stages(description, data_store=_array_store(arrays),
+                                                                          **kwargs)
+    code_globals = dict(namespace or {}, _data=arrays)
+    old_cwd = os.getcwd()
+    if path is not None:
+        os.chdir(os.path.abspath(path))
+    try:
+        plt.close('all')
+        # The export runs apart from the plotting, in the same style context, so each one is timed
+        with report.stage("plot"):
+            exec(head + context_code + code, code_globals)
+        with report.stage("savefig"):
+            exec(context_code + export_code, code_globals)
+        plt.close('all')
+    finally:
+        os.chdir(old_cwd)
+
+
+def render_image(description, image_format="png", path=None, **kwargs):
+    """
+    Render a VFD in the current interpreter, getting the image in memory instead of writing a file.
+
+    Rendering in a long-lived interpreter avoids the startup costs of matplotlib, so this is suitable for previews.
+
+    Args:
+        description (dict): Description of the VFD, obtained parsing the JSON.
+        image_format (str): Format of the image, as understood by matplotlib's savefig.
+        path (str): Directory of the VFD, where the relative paths of external data files start. If None, the
+                    working directory is used.
+        **kwargs: Additional arguments to supply to `create_matplotlib_script`.
+
+    Returns:
+        bytes: The content of the image file.
 
-def create_scripts(path=".", run=False, blocking=True, expand_glob=True, **kwargs):
+    """
+    description = _skip_multiplot_container(description)
+    if path is not None:
+        # The working directory is not changed, since this might be called from a thread
+        description = _resolve_external_files(description, path)
+    output = io.BytesIO()
+    _run_matplotlib(description, path=None, namespace={"_output": output}, export_name=_CodeName("_output"),
+                    export_format=image_format, **kwargs)
+    return output.getvalue()
+
+
+def _count_points(description):
+    """Get the number of values in the plotted arrays of a VFD (points of the series and cells of the colorplots)"""
+    vfd_type = description.get("type", "plot")
+    if vfd_type == "multiplot":
+        return sum(_count_points(plot) for row in description["plots"] for plot in row)
+    if vfd_type == "colorplot":
+        z = description["z"]
+        if is_external_array(z):
+            return description["z"]["shape"][0] * description["z"]["shape"][1] if "shape" in z else None
+        return sum(len(row) for row in z)
+    return sum(len(s["y"]) for s in description.get("series", []))
+
+
+def _output_bytes(outputs):
+    """Get the total size of the files which exist among the given ones"""
+    return sum(os.path.getsize(output) for output in outputs if os.path.isfile(output))
+
+
+def _create_script(file, run=False, blocking=True, write_script=True, data_format=None, validate="full", cache=None,
+                   profile=None, **kwargs):
+    """Create a script to generate a plot for a VFD file, as described in create_scripts"""
+    report = start_report(profile, file, "create_scripts")
+    try:
+        _create_script_stages(file, report, run=run, blocking=blocking, write_script=write_script,
+                              data_format=data_format, validate=validate, cache=cache, **kwargs)
+    except Exception as e:
+        report.finish(error=e)
+        raise
+    report.finish()
+
+
+def _create_script_stages(file, report, run=False, blocking=True, write_script=True, data_format=None,
+                          validate="full", cache=None, **kwargs):
+    """Create a script for a VFD file, adding the time of each stage to a report"""
+    stem = split_vfd_extension(file)[0]
+    basename = os.path.basename(stem)
+    pyfile_path = stem + ".py"
+    data_file = stem + "." + data_format if data_format else None
+    report.set(input_bytes=os.path.getsize(file))
+    description = None
+
+    export_format = kwargs.get("export_format")
+    if isinstance(export_format, str):
+        export_format = [export_format]
+    outputs = [os.path.join(os.path.dirname(file), "%s.%s" % (basename, f)) for f in export_format or []]
+    if write_script or (run and not blocking):
+        outputs.append(pyfile_path)
+        if data_file:
+            outputs.append(data_file)
+
+    # Only exported plots are cached, interactive windows and non-blocking runs are always shown
+    if cache is not None and run and blocking and export_format:
+        options = dict(kwargs, export_name=basename, write_script=write_script, data_format=data_format,
+                       matplotlib=_matplotlib_version())
+        # The key needs the whole content, which is then parsed from memory
+        with report.stage("read"):
+            content = _read_vfd_bytes(file)
+        if b'"file"' in content:
+            # The data in external files might have changed without changing the VFD
+            with report.stage("parse"):
+                description = _parse_vfd_bytes(content, file)
+            options["external_files"] = _external_files_state(description, os.path.dirname(file))
+        with report.stage("cache"):
+            key = cache.key(content, options)
+            restored = cache.restore(key, outputs)
+        if restored:
+            logger.debug("%s: Using cached files" % file)
+            report.set(cached=True, output_bytes=_output_bytes(outputs))
+            return
+    else:
+        key = None
+
+    if description is None:
+        with report.stage("parse"):
+            description = load_vfd(file) if key is None else _parse_vfd_bytes(content, file)
+    if validate:
+        with report.stage("validate"):
+            validate_vfd(description, mode=validate)
+    description = _skip_multiplot_container(description)
+    report.set(points=_count_points(description))
+
+    if write_script or (run and not blocking):
+        with report.stage("codegen"):
+            code = create_matplotlib_script(description, export_name=basename, data_file=data_file, **kwargs)
+        with report.stage("write_script"):
+            with _open_write(pyfile_path) as output:
+                if sys.version_info < (3, 0):
+                    output.write(unicode(code))  # noqa
+                else:
+                    output.write(code)
+    if run:
+        # FIXME: Running blocking in current interpreter trying to make pyinstaller work.
+        # If this change stays, consider changing the API.
+        if blocking:
+            # No need to write and parse the data as literals in a script
+            _run_matplotlib(description, path=os.path.dirname(file), export_name=basename, report=report, **kwargs)
+        else:
+            subprocess.Popen(["python", os.path.abspath(pyfile_path)],
+                             cwd=os.path.abspath(os.path.dirname(pyfile_path)))
+    if key is not None:
+        with report.stage("cache"):
+            cache.store(key, outputs)
+    report.set(output_bytes=_output_bytes(outputs))
+
+
+def create_scripts(path=".", run=False, blocking=True, expand_glob=True, workers=None, write_script=True,
+                   data_format=None, validate="full", cache=None, profile=None, **kwargs):
     """
     Create a script to generate a plot for the VFD file in the given path.
 
     Args:
-        path (str): Path to the VFD file.
+        path (str): Path to the VFD file. Compressed files (.vfd.gz or .vfd.zst) and VFD streams (.vfds) are also
+                    accepted, see `open_vfd`.
         run (bool): Whether to run the script upon creation.
-        blocking (bool): If run is True, whether to wait for the calls to end.
-        expand_glob (bool): Whether regular expressions are expanded (e.g., *.vfd or  **.vfd)
+        blocking (bool): If run is True, whether to wait for the calls to end. Blocking runs happen in the current
+                         interpreter, with the data passed in memory instead of through the script.
+        expand_glob (bool): Whether regular expressions are expanded (e.g., *.vfd or  **.vfd). Patterns ending in .vfd
+                            also match the compressed files and the streams.
+        workers (int): If given, number of processes used to handle the files. Each process runs the scripts in its
+                       own interpreter, so the runs must be blocking and export the plots (export_format must be
+                       given). Errors found in a file are then logged and collected instead of raised.
+        write_script (bool): Whether to write the script file. Ignored in non-blocking runs, which need it.
+        data_format (str): If given, format ("npz" or "json") of a file with the same name as the script, where the
+                           data is saved instead of writing it in the script.
+        validate (str or bool): Validation of the VFD. See `validate_vfd` for the available modes. If False, the VFD
+                                is not validated.
+        cache (vfd.cache.RenderCache): If given, cache used to skip the blocking runs exporting plots when the files
+                                       generated with the same VFD content and options are available.
+        profile (vfd.profiling.Profiler): If given, profiler where the time spent in each stage of the processing of
+                                          each file is reported.
         **kwargs: Additional arguments to supply to `create_matplotlib_script`.
 
+    Returns:
+        dict: If workers was given, a mapping from the paths of the files which could not be processed to a
+              description of the error. Otherwise, None.
+
     Raises:
         FileNotFoundError: If the file was not found.
         json.JSONDecodeError: If the file was opened, but it is not a well-built JSON.
         jsonschema.ValidationError: If the opened file was a well-built JSON but not a well-built VFD.
+        ValueError: If workers was given for runs which are not blocking or do not export the plots.
 
     """
-    if expand_glob:
-        file_list = glob(path)
-    else:
-        file_list = [path]
-    if not file_list:
-        raise ValueError("No file matching " + path)
+    if workers is not None and run and (not blocking or not kwargs.get("export_format")):
+        raise ValueError("Runs in parallel workers must be blocking and export the plots")
+    file_list = _file_list(path, expand_glob=expand_glob)
+    if workers is not None:
+        # Processes are already running in parallel, run the scripts in them
+        return _run_batch(_create_script, file_list, workers, run=run, blocking=True, write_script=write_script,
+                          data_format=data_format, validate=validate, cache=cache, profile=profile, **kwargs)
     for file in file_list:
-        basename = os.path.basename(file)[:-4]
-        pyfile_path = file[:-3] + "py"
-        with _open_write(pyfile_path) as output:
-            description = json.load(open(file))
-            validate_vfd(description)
-            # If it's a single item multiplot, skip the multiplot container
-            if description["type"] == "multiplot" and len(description["plots"]) == 1 and \
-                len(description["plots"][0]) == 1:
-                code = create_matplotlib_script(description["plots"][0][0], export_name=basename, **kwargs)
-            else:
-                code = create_matplotlib_script(description, export_name=basename, **kwargs)
-
-            if sys.version_info < (3, 0):
-                output.write(unicode(code))  # noqa
-            else:
-                output.write(code)
-        if run:
-            # FIXME: Running blocking in current interpreter trying to make pyinstaller work.
-            # If this change stays, consider changing the API.
-            if blocking:
-                if plt is None:
-                    raise ModuleNotFoundError("Matplotlib was not found, scripts can not be run")
-                old_cwd = os.getcwd()
-                os.chdir(os.path.abspath(os.path.dirname(pyfile_path)))
-                plt.close('all')
-                with io.open(os.path.abspath(pyfile_path), "r", encoding="utf8") as f:
-                    exec(f.read())
-                plt.close('all')
-                os.chdir(old_cwd)
-            else:
-                subprocess.Popen(["python", os.path.abspath(pyfile_path)],
-                                 cwd=os.path.abspath(os.path.dirname(pyfile_path)))
+        _create_script(file, run=run, blocking=blocking, write_script=write_script, data_format=data_format,
+                       validate=validate, cache=cache, profile=profile, **kwargs)
 
 
-def create_xlsx(path=".", expand_glob=True):
+def _create_xlsx(file, validate="full", profile=None):
+    """Create a xlsx file for a VFD file, as described in create_xlsx"""
+    report = start_report(profile, file, "create_xlsx")
+    try:
+        xlsx_path = split_vfd_extension(file)[0] + ".xlsx"
+        report.set(input_bytes=os.path.getsize(file))
+        with report.stage("parse"):
+            description = load_vfd(file)
+        if validate:
+            with report.stage("validate"):
+                validate_vfd(description, mode=validate)
+        description = _skip_multiplot_container(description)
+        report.set(points=_count_points(description))
+        with report.stage("export"):
+            export_xlsx(description, xlsx_path, path=os.path.dirname(file))
+        report.set(output_bytes=_output_bytes([xlsx_path]))
+    except Exception as e:
+        report.finish(error=e)
+        raise
+    report.finish()
+
+
+def create_xlsx(path=".", expand_glob=True, workers=None, validate="full", profile=None):
     """
     Create a xlsx file for the VFD file in the given path.
 
     Args:
-        path (str): Path to the VFD file.
-        expand_glob (bool): Whether regular expressions are expanded (e.g., *.vfd or  **.vfd)
+        path (str): Path to the VFD file. Compressed files (.vfd.gz or .vfd.zst) and VFD streams (.vfds) are also
+                    accepted, see `open_vfd`.
+        expand_glob (bool): Whether regular expressions are expanded (e.g., *.vfd or  **.vfd). Patterns ending in .vfd
+                            also match the compressed files and the streams.
+        workers (int): If given, number of processes used to handle the files. Errors found in a file are then logged
+                       and collected instead of raised.
+        validate (str or bool): Validation of the VFD. See `validate_vfd` for the available modes. If False, the VFD
+                                is not validated.
+        profile (vfd.profiling.Profiler): If given, profiler where the time spent in each stage of the processing of
+                                          each file is reported.
+
+    Returns:
+        dict: If workers was given, a mapping from the paths of the files which could not be processed to a
+              description of the error. Otherwise, None.
 
     Raises:
         FileNotFoundError: If the file was not found.
@@ -876,32 +1921,257 @@ def create_xlsx(path=".", expand_glob=True):
         jsonschema.ValidationError: If the opened file was a well-built JSON but not a well-built VFD.
 
     """
-    # TODO: Refactor to unify with create_scripts
-    if expand_glob:
-        file_list = glob(path)
-    else:
-        file_list = [path]
-    if not file_list:
-        raise ValueError("No file matching " + path)
+    file_list = _file_list(path, expand_glob=expand_glob)
+    if workers is not None:
+        return _run_batch(_create_xlsx, file_list, workers, validate=validate, profile=profile)
     for file in file_list:
-        pyfile_path = file[:-3] + "xlsx"
-        description = json.load(open(file))
-        validate_vfd(description)
-
-        # If it's a single item multiplot, skip the multiplot container
-        if description["type"] == "multiplot" and len(description["plots"]) == 1 and \
-            len(description["plots"][0]) == 1:
-            export_xlsx(description["plots"][0][0], pyfile_path)
-        else:
-            export_xlsx(description, pyfile_path)
+        _create_xlsx(file, validate=validate, profile=profile)
+
+
+def _scan_vfd_files(path):
+    """Get a mapping from the VFD files in a directory tree to their modification time and size"""
+    states = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name.endswith(vfd_extensions):
+                file = os.path.join(root, name)
+                try:
+                    st = os.stat(file)
+                except OSError:
+                    # Removed while scanning
+                    continue
+                states[file] = (st.st_mtime, st.st_size)
+    return states
+
+
+def _watch_changes(path, interval=0.5, debounce=0.5):
+    """
+    Poll a directory tree for created or modified VFD files.
+
+    Args:
+        path (str): Path to the directory.
+        interval (float): Time in seconds between polls.
+        debounce (float): Time in seconds a file must stay unchanged before it is reported, so bursts of writes are
+                          reported only once.
+
+    Yields:
+        list of str: The files found in the first poll, then the files changed since the last report.
+
+    """
+    known = _scan_vfd_files(path)
+    yield sorted(known)
+    pending = {}  # Changed files and the time their last change was seen
+    while True:
+        time.sleep(interval)
+        current = _scan_vfd_files(path)
+        now = time.time()
+        for file, state in current.items():
+            if known.get(file) != state:
+                pending[file] = now
+        for file in set(pending) - set(current):
+            del pending[file]
+        known = current
+        ready = sorted(file for file, changed in pending.items() if now - changed >= debounce)
+        for file in ready:
+            del pending[file]
+        if ready:
+            yield ready
+
+
+def watch(path=".", interval=0.5, debounce=0.5, scripts=True, xlsx=False, **kwargs):
+    """
+    Keep processing the VFD files (including the compressed ones) in a directory tree as they are created or modified.
+
+    All the files are processed at start. Then, the directory is polled for changes until the process is interrupted.
+    Everything runs in the current interpreter, so the startup costs are paid only once. Errors found in a file are
+    logged instead of raised.
+
+    Args:
+        path (str): Path to the directory.
+        interval (float): Time in seconds between polls.
+        debounce (float): Time in seconds a file must stay unchanged before it is processed.
+        scripts (bool): Whether to create and run the scripts, as in `create_scripts`.
+        xlsx (bool): Whether to create the xlsx files, as in `create_xlsx`.
+        **kwargs: Additional arguments to supply to `create_scripts`.
+
+    """
+    if not os.path.isdir(path):
+        raise ValueError("Not a directory: " + path)
+    tasks = []
+    if scripts:
+        tasks.append(_BatchTask(_create_script, dict(kwargs, run=True, blocking=True)))
+    if xlsx:
+        tasks.append(_BatchTask(_create_xlsx, {"validate": kwargs.get("validate", "full"),
+                                               "profile": kwargs.get("profile")}))
+    for file_list in _watch_changes(path, interval=interval, debounce=debounce):
+        for file in file_list:
+            for task in tasks:
+                _, error = task(file)
+                if error is not None:
+                    logger.error("%s: %s" % (file, error))
+
 
+# Type codes of the array module for the binary encodings of arrays, by their dtype tag (little-endian)
+_binary_dtypes = {"<f8": "d", "<f4": "f"}
 
-def str_to_python(description):
+_binary_types = {"float64": "<f8", "float32": "<f4"}
+
+_binary_compressions = {"zlib": (zlib.compress, zlib.decompress)}
+
+# Minimum number of items of an array of numbers to use the binary encoding
+_binary_min_size = 16
+
+
+def _is_encoded_array(value):
+    """Check if a value is a binary encoded array of numbers"""
+    return isinstance(value, dict) and "dtype" in value and isinstance(value.get("data"), str)
+
+
+def _encode_array(values, binary="float64", compression=None):
+    """
+    Get the binary encoding of an array of numbers.
+
+    Args:
+        values (list): A list of numbers or a rectangular list of lists of numbers.
+        binary (str): Type used to store the numbers ("float64" or "float32").
+        compression (str): If given, compression applied to the bytes ("zlib").
+
+    Returns:
+        dict: The encoded array.
+
+    """
+    dtype = _binary_types[binary]
+    encoded = {"dtype": dtype}
+    if values and isinstance(values[0], (list, tuple)):
+        encoded["shape"] = [len(values), len(values[0])]
+        values = [value for row in values for value in row]
+    data = array.array(_binary_dtypes[dtype], values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    data = data.tobytes()
+    if compression is not None:
+        data = _binary_compressions[compression][0](data)
+        encoded["compression"] = compression
+    encoded["data"] = base64.b64encode(data).decode("ascii")
+    return encoded
+
+
+def _decode_array(encoded):
+    """
+    Get the list of numbers in a binary encoded array.
+
+    Args:
+        encoded (dict): The encoded array.
+
+    Returns:
+        list: A list of floats, or a list of lists of floats if the array was 2-dimensional.
+
+    Raises:
+        ValueError: If the encoding is not valid.
+
+    """
+    if encoded["dtype"] not in _binary_dtypes:
+        raise ValueError("Unknown dtype of encoded array: %s" % encoded["dtype"])
+    data = base64.b64decode(encoded["data"])
+    compression = encoded.get("compression")
+    if compression is not None:
+        if compression not in _binary_compressions:
+            raise ValueError("Unknown compression of encoded array: %s" % compression)
+        try:
+            data = _binary_compressions[compression][1](data)
+        except zlib.error as e:
+            raise ValueError("Invalid compressed data in encoded array: %s" % e)
+    values = array.array(_binary_dtypes[encoded["dtype"]])
+    if len(data) % values.itemsize:
+        raise ValueError("Size of encoded array is not a multiple of its item size")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    values = values.tolist()
+    shape = encoded.get("shape")
+    if shape is not None and len(shape) == 2:
+        if shape[0] * shape[1] != len(values):
+            raise ValueError("Shape of encoded array does not match its size: %s" % (shape,))
+        values = [values[i:i + shape[1]] for i in range(0, len(values), shape[1])]
+    return values
+
+
+def _decode_arrays(data):
+    """
+    Replace the binary encoded arrays in the data by lists of numbers.
+
+    The data is not modified. Arrays of numbers are shared with the returned data.
+
+    Args:
+        data: A Python object representing a VFD, as loaded from the JSON.
+
+    Returns:
+        The data with the arrays decoded.
+
+    """
+    if isinstance(data, dict):
+        if _is_encoded_array(data):
+            return _decode_array(data)
+        return {key: _decode_arrays(value) for key, value in data.items()}
+    # Arrays of numbers are not walked
+    if isinstance(data, list) and data and isinstance(data[0], (dict, list)):
+        return [_decode_arrays(value) for value in data]
+    return data
+
+
+def _is_number_array(value):
+    """Check if a value is a list of ints and floats"""
+    return isinstance(value, (list, tuple)) and len(value) > 0 and set(map(type, value)) <= {int, float}
+
+
+def _encode_arrays(data, binary="float64", compression=None):
+    """
+    Replace the arrays of numbers in the data by their binary encoding.
+
+    Arrays with less than a few items, as ranges, are kept for readability.
+
+    Args:
+        data: A Python object representing a VFD.
+        binary (str): Type used to store the numbers ("float64" or "float32").
+        compression (str): If given, compression applied to the bytes ("zlib").
+
+    Returns:
+        The data with the arrays encoded.
+
+    """
+    if binary not in _binary_types:
+        raise ValueError("Unknown binary type: %s" % binary)
+    if compression is not None and compression not in _binary_compressions:
+        raise ValueError("Unknown compression: %s" % compression)
+    return _encode_arrays_walk(data, binary, compression)
+
+
+def _encode_arrays_walk(data, binary, compression):
+    if isinstance(data, dict):
+        return {key: _encode_arrays_walk(value, binary, compression) for key, value in data.items()}
+    if isinstance(data, (list, tuple)) and data:
+        if isinstance(data[0], (int, float)) and not isinstance(data[0], bool):
+            if len(data) >= _binary_min_size and _is_number_array(data):
+                return _encode_array(data, binary, compression)
+            return data
+        # 2-dimensional arrays, as the z values of a colorplot
+        if all(_is_number_array(row) and len(row) == len(data[0]) for row in data) and \
+                len(data) * len(data[0]) >= _binary_min_size:
+            return _encode_array(data, binary, compression)
+        return [_encode_arrays_walk(value, binary, compression) for value in data]
+    return data
+
+
+def str_to_python(description, validate="full"):
     """
     Find a Python representation for the given data in a string.
 
+    Arrays stored with a binary encoding (see `python_to_json`) are decoded.
+
     Args:
         description (str): A string defining the JSON object.
+        validate (str or bool): Validation of the VFD. See `validate_vfd` for the available modes. If False, the VFD
+                                is not validated.
 
     Returns:
         dict: A python representation of the VFD.
@@ -911,35 +2181,114 @@ def str_to_python(description):
         jsonschema.ValidationError: If string defines a JSON but not a well-built VFD.
 
     """
-    data = json.loads(description)
-    validate_vfd(data)
+    data = _decode_arrays(json.loads(description))
+    if validate:
+        validate_vfd(data, mode=validate)
     return data
 
 
-def validate_vfd(data):
+def _without_number_items(schema):
+    """Get a copy of a schema where the type of the items of the arrays of numbers is not checked"""
+    if isinstance(schema, dict):
+        return {key: _without_number_items(value) for key, value in schema.items()
+                if not (key == "items" and value == {"type": "number"})}
+    elif isinstance(schema, list):
+        return [_without_number_items(value) for value in schema]
+    else:
+        return schema
+
+
+def _is_number(value):
+    """Check if a value is a number as understood by jsonschema"""
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def _check_number_items(data, schema, path):
+    """
+    Check the arrays of numbers in the data which are not checked in the schemas given by `_without_number_items`.
+
+    Args:
+        data: The data to check.
+        schema (dict): The complete schema of the data.
+        path (list): Path to the data, used to describe the error.
+
+    Raises:
+        jsonschema.ValidationError: If an item of an array of numbers is not a number.
+
+    """
+    if "anyOf" in schema:
+        for subschema in schema["anyOf"]:
+            _check_number_items(data, subschema, path)
+    if "properties" in schema and isinstance(data, dict):
+        for key, subschema in schema["properties"].items():
+            if key in data:
+                _check_number_items(data[key], subschema, path + [key])
+    if "items" in schema and isinstance(data, list):
+        if schema["items"] == {"type": "number"}:
+            # Check all types at once, falling back to item checking if unusual types were found
+            if set(map(type, data)) <= {int, float} or all(_is_number(value) for value in data):
+                return
+            index, value = next((i, value) for i, value in enumerate(data) if not _is_number(value))
+            import jsonschema
+            raise jsonschema.ValidationError("%r is not of type 'number'" % (value,), path=deque(path + [index]))
+        elif isinstance(schema["items"], dict):
+            for i, value in enumerate(data):
+                _check_number_items(value, schema["items"], path + [i])
+
+
+# Validators for each type of VFD, created when first needed
+_validators = {}
+
+
+def _get_validator(vfd_type, mode="full"):
+    """Get a (cached) jsonschema validator for a type of VFD"""
+    if (vfd_type, mode) not in _validators:
+        schema = _schemas[vfd_type]
+        if mode == "fast":
+            schema = _without_number_items(schema)
+        import jsonschema
+
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        _validators[(vfd_type, mode)] = validator_class(schema)
+    return _validators[(vfd_type, mode)]
+
+
+def validate_vfd(data, mode="full"):
     """
     Check if the given data is a well-built VFD
 
     Args:
         data (dict): The data to check
+        mode (str or bool): Validation mode. Available modes are:
+
+                            - "full" (or True): Check everything in the schema with jsonschema.
+                            - "fast": Check the structure with jsonschema, but check the arrays of numbers at once.
+                              The error messages might be less detailed.
 
     Raises:
         jsonschema.ValidationError: If the data is not a well-built VFD.
 
     """
+    if mode is True:
+        mode = "full"
+    if mode not in ["full", "fast"]:
+        raise ValueError("Unknown validation mode: %s" % mode)
     if "type" not in data:
         raise ValueError("No type in provided file")
-    if data["type"] == "plot":
-        validate_schema(data, schema_plot)
-    elif data["type"] == "multiplot":
-        validate_schema(data, schema_multiplot)
-    elif data["type"] == "colorplot":
-        validate_schema(data, schema_colorplot)
-    else:
+    if data["type"] not in _schemas:
         raise ValueError("Unknown type: %s" % data["type"])
+    import jsonschema
+
+    validator = _get_validator(data["type"], mode=mode)
+    error = jsonschema.exceptions.best_match(validator.iter_errors(data))
+    if error is not None:
+        raise error
+    if mode == "fast":
+        _check_number_items(data, _schemas[data["type"]], [])
 
 
-def python_to_json(data, compact=False, compact_arrays=True):
+def python_to_json(data, compact=False, compact_arrays=True, binary=None, compression=None):
     """
     Return a JSON representation of the data.
 
@@ -948,21 +2297,174 @@ def python_to_json(data, compact=False, compact_arrays=True):
         compact (bool): Whether to save space in detriment of readability.
         compact_arrays (bool): If compact was False, whether to make 1d arrays of numbers compact.
                                This both improves readability and saves space.
+        binary (str): If given, the arrays of numbers are stored as base64 of their little-endian binary
+                      representation with this type ("float64" or "float32"), which is smaller and faster to read.
+                      Integers are stored as floats. Only short arrays, as ranges, are kept as JSON numbers.
+        compression (str): If binary was given, compression applied to the arrays before the base64 encoding
+                           ("zlib").
 
     Returns:
         str: A JSON representation of the data.
 
     """
+    if binary:
+        data = _encode_arrays(data, binary=binary, compression=compression)
+    # json.dumps uses the C encoder, which is not used when encoding incrementally
     if compact:
-        my_json = json.dumps(data, sort_keys=True, separators=(',', ':'))
+        return json.dumps(data, sort_keys=True, separators=(',', ':'))
+    elif compact_arrays:
+        return "".join(_iterencode_compact_arrays(data, 0))
     else:
-        my_json = json.dumps(data, sort_keys=True, indent=4, separators=(',', ': '))
-        if compact_arrays:
-            # numbers in an array should join in one line
-            # "number   ,  " into "number,":
-            my_json = re.sub(r"(%s)\s*([,\]])\s*" % _float_pattern, r"\g<1>\g<2>", my_json)
-            # "[   number  " into "[number":
-            my_json = re.sub(r"\[\s*(%s)\s*" % _float_pattern, r"[\g<1>", my_json)
-            # "  number   ]" into "number]":
-            my_json = re.sub(r"\s*(%s)\s*\]" % _float_pattern, r"\g<1>]", my_json)
-    return my_json
+        return json.dumps(data, sort_keys=True, indent=4, separators=(',', ': '))
+
+
+def _is_json_number(value):
+    """Check if a value is encoded as a JSON number (i.e., it is a finite int or float)"""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    if isinstance(value, float):
+        return not (math.isnan(value) or math.isinf(value))
+    return False
+
+
+def _ends_with_number(value):
+    """Check if a value is a non-empty array whose last item is a JSON number"""
+    return isinstance(value, (list, tuple)) and len(value) > 0 and _is_json_number(value[-1])
+
+
+def _encode_json_scalar(value):
+    """Encode a JSON scalar as json.dumps would do"""
+    if isinstance(value, str):
+        return json.encoder.encode_basestring_ascii(value)
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return 'Infinity' if value > 0 else '-Infinity'
+        return float.__repr__(value)
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+def _encode_json_key(key):
+    """Encode a key of a JSON object as json.dumps would do"""
+    if isinstance(key, str):
+        return json.encoder.encode_basestring_ascii(key)
+    if key is None or isinstance(key, (bool, int, float)):
+        return '"%s"' % _encode_json_scalar(key)
+    raise TypeError("keys must be str, int, float, bool or None, not %s" % type(key).__name__)
+
+
+# Number of items of a numeric array which are encoded at once
+_array_chunk_size = 4096
+
+
+def _iterencode_number_array(values):
+    """Yield the compact JSON representation of an array of finite numbers, or None if it is not the case"""
+    if not set(map(type, values)) <= {int, float}:
+        return None
+    chunks = []
+    for start in range(0, len(values), _array_chunk_size):
+        chunk = ",".join(map(repr, values[start:start + _array_chunk_size]))
+        if "n" in chunk:  # nan, inf or -inf
+            return None
+        chunks.append(chunk)
+    return chunks
+
+
+def _iterencode_compact_arrays(value, level):
+    """
+    Yield the chunks of an indented JSON representation where arrays of numbers are kept in one line.
+
+    The layout is that given by python_to_json with compact_arrays=True.
+
+    Args:
+        value: The python object to encode.
+        level (int): Indentation level of the object.
+
+    """
+    newline = "\n" + " " * (_indentation_size * (level + 1))
+    if isinstance(value, dict):
+        if not value:
+            yield "{}"
+            return
+        items = sorted(value.items())
+        previous_number = False
+        for i, (key, item) in enumerate(items):
+            if i == 0:
+                yield "{" + newline
+            else:
+                # Line breaks are dropped after numbers
+                yield "," if previous_number else "," + newline
+            yield _encode_json_key(key) + ": "
+            for chunk in _iterencode_compact_arrays(item, level + 1):
+                yield chunk
+            previous_number = _is_json_number(item)
+        # Closing brackets of arrays of numbers also take the following line break
+        yield "}" if _ends_with_number(items[-1][1]) else "\n" + " " * (_indentation_size * level) + "}"
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            yield "[]"
+            return
+        if isinstance(value[0], (int, float)):
+            chunks = _iterencode_number_array(value)
+            if chunks is not None:
+                yield "["
+                for i, chunk in enumerate(chunks):
+                    yield "," + chunk if i else chunk
+                yield "]"
+                return
+        numbers = [_is_json_number(item) for item in value]
+        last = len(value) - 1
+        for i, item in enumerate(value):
+            if i == 0:
+                yield "[" if numbers[0] else "[" + newline
+            else:
+                # No line break around numbers, except before one which is not the last item of the array
+                yield "," if numbers[i - 1] or (i == last and numbers[i]) else "," + newline
+            for chunk in _iterencode_compact_arrays(item, level + 1):
+                yield chunk
+        yield "]" if numbers[-1] or _ends_with_number(value[-1]) else "\n" + " " * (_indentation_size * level) + "]"
+    else:
+        yield _encode_json_scalar(value)
+
+
+def _iterencode(data, compact=False, compact_arrays=True):
+    """Yield the chunks of the JSON representation given by python_to_json"""
+    if compact:
+        return json.JSONEncoder(sort_keys=True, separators=(',', ':')).iterencode(data)
+    elif compact_arrays:
+        return _iterencode_compact_arrays(data, 0)
+    else:
+        return json.JSONEncoder(sort_keys=True, indent=4, separators=(',', ': ')).iterencode(data)
+
+
+def dump_json(data, fp, compact=False, compact_arrays=True, binary=None, compression=None):
+    """
+    Write the JSON representation of the data to a file-like object.
+
+    The output is the same given by python_to_json, but it is written incrementally, so the whole representation is
+    never kept in memory.
+
+    Args:
+        data (dict): A Python object representing a VFD.
+        fp: A file-like object opened in text mode.
+        compact (bool): Whether to save space in detriment of readability.
+        compact_arrays (bool): If compact was False, whether to make 1d arrays of numbers compact.
+                               This both improves readability and saves space.
+        binary (str): If given, type used to store the arrays of numbers in binary. See `python_to_json`.
+        compression (str): If binary was given, compression applied to the arrays. See `python_to_json`.
+
+    """
+    if binary:
+        data = _encode_arrays(data, binary=binary, compression=compression)
+    fp.writelines(_iterencode(data, compact=compact, compact_arrays=compact_arrays))